@@ -35,9 +35,12 @@ class BaseMeasure(object):
         '''
         raise NotImplemented
 
-    def random(self):
+    def random(self, rng=None):
         '''
         Return a random sample from the base measure.
+
+        Kwargs:
+            rng : (RandomStream) Stream of random numbers. If None the default stream is used.
         '''
         raise NotImplemented
 
@@ -50,8 +53,8 @@ class BetaBaseMeasure(BaseMeasure):
     def log_p(self, data):
         return log_beta_pdf(data.x, self.params.a, self.params.b)
 
-    def random(self):
-        x = beta_rvs(self.params.a, self.params.b)
+    def random(self, rng=None):
+        x = beta_rvs(self.params.a, self.params.b, rng=rng)
 
         return BetaData(x)
 
@@ -64,8 +67,8 @@ class GammaBaseMeasure(BaseMeasure):
     def log_p(self, data):
         return log_gamma_pdf(data.x, self.params.a, self.params.b)
 
-    def random(self):
-        x = gamma_rvs(self.params.a, self.params.b)
+    def random(self, rng=None):
+        x = gamma_rvs(self.params.a, self.params.b, rng=rng)
 
         return GammaData(x)
 
@@ -82,9 +85,9 @@ class GaussianGammaBaseMeasure(BaseMeasure):
 
         return log_p_mean + log_p_precision
 
-    def random(self):
-        precision = gamma_rvs(self.params.alpha, self.params.beta) + 1e-10
+    def random(self, rng=None):
+        precision = gamma_rvs(self.params.alpha, self.params.beta, rng=rng) + 1e-10
 
-        mean = gaussian_rvs(self.params.mean, self.params.size * precision)
+        mean = gaussian_rvs(self.params.mean, self.params.size * precision, rng=rng)
 
         return GaussianGammaData(mean, precision)
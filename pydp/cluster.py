@@ -24,6 +24,26 @@ def cluster_with_mpear(X, max_clusters=None):
 
     sim_mat = 1 - squareform(dist_mat)
 
+    return _cluster_with_mpear(dist_mat, sim_mat, max_clusters)
+
+
+def cluster_with_mpear_from_similarity_matrix(sim_mat, max_clusters=None):
+    '''
+    Args:
+        sim_mat : (array) Posterior similarity matrix with the fraction of iterations in which each pair of data points
+                          was clustered together, such as the output of pydp.trace.SimilarityMatrixTrace.
+    '''
+    sim_mat = np.asarray(sim_mat)
+
+    # The hamming distance between the labels of two data points is one minus their similarity.
+    dist_mat = 1 - squareform(sim_mat, checks=False)
+
+    return _cluster_with_mpear(dist_mat, sim_mat, max_clusters)
+
+
+def _cluster_with_mpear(dist_mat, sim_mat, max_clusters):
+    N = sim_mat.shape[0]
+
     Z = average(dist_mat)
 
     max_pear = 0
@@ -31,10 +51,10 @@ def cluster_with_mpear(X, max_clusters=None):
     best_cluster_labels = _get_flat_clustering(Z, 1)
 
     if max_clusters is None:
-        max_clusters = len(X) + 1
+        max_clusters = N + 1
 
     else:
-        max_clusters = min(max_clusters, len(X))
+        max_clusters = min(max_clusters, N)
 
     max_clusters = max(max_clusters, 1)
 
@@ -16,9 +16,15 @@ Created on 2012-09-21
 '''
 from collections import namedtuple
 
+try:
+    import numpy as np
+
+except ImportError:
+    np = None
+
 BetaData = namedtuple('BetaData', 'x')
 
-BetaParameter = namedtuple('BetaPriorData', ['a', 'b'])
+BetaParameter = namedtuple('BetaParameter', ['a', 'b'])
 
 BinomialData = namedtuple('BinomialData', ['x', 'n'])
 
@@ -35,3 +41,121 @@ GaussianGammaParameter = namedtuple('GaussianGammaParameter', ['mean', 'size', '
 PoissonData = namedtuple('PoissonData', 'x')
 
 NegativeBinomialParameter = namedtuple('NegativeBinomialParameter', ['r', 'p'])
+
+
+class Dataset(object):
+    '''
+    Columnar container for a list of data points of the same namedtuple type.
+
+    Each field is stored as a contiguous NumPy array. Indexing with an integer returns a namedtuple of the data type so
+    a Dataset can be passed to the samplers in place of a list of data points. Requires NumPy.
+    '''
+
+    def __init__(self, data_type, columns):
+        '''
+        Args:
+            data_type : (class) The namedtuple class of the data points, i.e. BinomialData.
+
+            columns : (dict or sequence) Either a mapping of field names to arrays or a sequence of arrays in the same
+                                         order as the fields of data_type.
+        '''
+        if np is None:
+            raise ImportError('NumPy is required to use Dataset.')
+
+        if isinstance(columns, dict):
+            columns = [columns[field] for field in data_type._fields]
+
+        columns = [np.ascontiguousarray(x) for x in columns]
+
+        if len(columns) != len(data_type._fields):
+            raise ValueError('Dataset of type {0} requires {1} columns.'.format(data_type.__name__,
+                                                                               len(data_type._fields)))
+
+        for x in columns:
+            if x.ndim != 1 or len(x) != len(columns[0]):
+                raise ValueError('Dataset columns must be one dimensional arrays of the same length.')
+
+        self.data_type = data_type
+
+        self.columns = data_type(*columns)
+
+    @classmethod
+    def from_records(cls, records):
+        '''
+        Build a Dataset from a non-empty list of namedtuples of the same type.
+        '''
+        return cls(type(records[0]), to_columns(records))
+
+    def take(self, items):
+        '''
+        Return the data points for a set of items as a namedtuple of arrays.
+
+        Args:
+            items : (iterable) Items to select.
+        '''
+        if not isinstance(items, np.ndarray):
+            items = np.fromiter(iter(items), dtype=np.intp, count=len(items))
+
+        return self.data_type(*[x[items] for x in self.columns])
+
+    def __getitem__(self, item):
+        return self.data_type(*[x[item].item() for x in self.columns])
+
+    def __iter__(self):
+        # Convert in blocks to avoid materialising the whole data set as Python objects.
+        block_size = 10000
+
+        for start in range(0, len(self), block_size):
+            for row in zip(*[x[start:start + block_size].tolist() for x in self.columns]):
+                yield self.data_type(*row)
+
+    def __len__(self):
+        return len(self.columns[0])
+
+
+def to_columns(records):
+    '''
+    Convert a sequence of namedtuples of the same type to a single namedtuple of that type with a NumPy array for each
+    field.
+
+    Args:
+        records : (list) List of namedtuples.
+    '''
+    record_type = type(records[0])
+
+    return record_type(*[np.array(x) for x in zip(*records)])
+
+
+def as_columns(data):
+    '''
+    Return data in columnar form with fields accessible as attributes.
+
+    Args:
+        data : (list or array) A list of namedtuples, a Dataset, a namedtuple of arrays (returned as is) or a NumPy
+                               structured array (returned as a record array view).
+    '''
+    if isinstance(data, Dataset):
+        return data.columns
+
+    elif isinstance(data, np.ndarray):
+        return data.view(np.recarray)
+
+    elif isinstance(data, tuple) and len(data) > 0 and isinstance(data[0], np.ndarray):
+        return data
+
+    return to_columns(data)
+
+
+def get_columns(data, items):
+    '''
+    Return the data points for a set of items in columnar form.
+
+    Args:
+        data : (list or Dataset) Data points indexed by item.
+
+        items : (iterable) Items to select.
+    '''
+    if isinstance(data, Dataset):
+        return data.take(items)
+
+    return to_columns([data[item] for item in items])
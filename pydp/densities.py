@@ -16,20 +16,56 @@ Created on 2012-09-21
 '''
 from __future__ import division
 
-from collections import OrderedDict
 from math import log, lgamma as log_gamma, pi
 
-from pydp.data import GammaParameter, NegativeBinomialParameter
+from pydp.data import GammaParameter, NegativeBinomialParameter, as_columns, get_columns, to_columns
+from pydp.utils import LRUCache
+
+try:
+    import numpy as np
+
+    from scipy.special import gammaln as _array_log_gamma, xlogy as _xlogy, xlog1py as _xlog1py
+
+except ImportError:
+    np = None
 
 
 class Density(object):
+    '''
+    Base class for densities.
+
+    Subclasses implement _log_p for a single data point and parameter. Subclasses which also implement _log_p_array
+    using NumPy broadcasting should set vectorised = True to enable the fast paths in log_p_many, log_p_batch and
+    log_p_sum. The log_p_many fast path is only used when the caller asks for it.
+
+    The samplers also accept objects which only implement log_p(data, params). They are called through the module
+    level functions log_p_many and log_p_sum, which fall back to calling log_p.
+    '''
+
+    vectorised = False
+
+    def __init__(self, params=None, cache=None):
+        '''
+        Kwargs:
+            params : (namedtuple) Global parameters shared by all atoms.
 
-    def __init__(self, params=None):
+            cache : (Cache) Cache for log_p. Defaults to an LRUCache with 10000 entries. Use NullCache to disable
+                            caching.
+        '''
         self.params = params
 
-        self.cache = OrderedDict()
+        if cache is None:
+            cache = LRUCache()
+
+        self.cache = cache
+
+    @property
+    def max_cache_size(self):
+        return self.cache.max_size
 
-        self.max_cache_size = 10000
+    @max_cache_size.setter
+    def max_cache_size(self, value):
+        self.cache.max_size = value
 
     def log_p(self, data, params):
         '''
@@ -37,27 +73,109 @@ class Density(object):
             data : (nametuple) Data for density.
 
             params : (nametuple) Parameters in density.
+        '''
+        return self.cache.lookup(self._log_p, data, params, self.params)
+
+    def log_p_many(self, data, params, vectorise=False):
+        '''
+        Compute the log density of a single data point for each element of a sequence of parameters.
+
+        Args:
+            data : (nametuple) Data for density.
+
+            params : (list) List of nametuples of parameters in density.
 
         Kwargs:
-            global_params: (namedtuple) Parameters which are shared across all atoms. If this is None it will use the
-                                        current value.
+            vectorise : (bool) Whether to evaluate all parameters with a single call to _log_p_array. Only used if the
+                               density is vectorised, otherwise log_p is called for each parameter.
+
+        Returns:
+            log_p : (list or array) Log density for each parameter. A NumPy array is returned if vectorise is True and
+                    the density is vectorised.
+        '''
+        if vectorise and self.vectorised and np is not None:
+            if len(params) == 0:
+                return np.zeros(0)
+
+            return self._log_p_array(data, to_columns(params))
+
+        return [self.log_p(data, x) for x in params]
+
+    def log_p_batch(self, data, params):
         '''
-        key = (data, params, self.params)
+        Compute the log density for a batch of data points.
 
-        if key not in self.cache:
-            self.cache[key] = self._log_p(data, params)
+        Args:
+            data : (namedtuple or array) Data points in columnar form. Either a namedtuple of the data type with a NumPy
+                                         array for each field (see pydp.data.to_columns), a NumPy structured array
+                                         with the same field names or a list of nametuples.
+
+            params : (namedtuple) Parameters in density. Either a single value shared by all data points or a namedtuple
+                                  with an array for each field giving the parameters of each data point.
+
+        Returns:
+            log_p : (array) Log density of each data point.
+        '''
+        if np is None:
+            raise ImportError('NumPy is required for batched density evaluation.')
 
-            if len(self.cache) > self.max_cache_size:
-                self.cache.popitem(last=False)
+        data = as_columns(data)
+
+        if self.vectorised:
+            return self._log_p_array(data, params)
+
+        if isinstance(data, np.ndarray):
+            rows = list(data)
+
+        else:
+            rows = [type(data)(*x) for x in zip(*data)]
 
-        return self.cache[key]
+        if _is_columns(params):
+            params = [type(params)(*x) for x in zip(*params)]
+
+        else:
+            params = [params] * len(rows)
+
+        return np.array([self._log_p(x, y) for x, y in zip(rows, params)])
+
+    def log_p_sum(self, data, items, params):
+        '''
+        Compute the sum of the log density of a set of data points sharing the same parameters.
+
+        Args:
+            data : (list) Data points indexed by item.
+
+            items : (iterable) Items to include in the sum.
+
+            params : (namedtuple) Parameters in density.
+        '''
+        if self.vectorised and np is not None:
+            if len(items) == 0:
+                return 0
+
+            return float(np.sum(self._log_p_array(get_columns(data, items), params)))
+
+        log_p = 0
+
+        for item in items:
+            log_p += self.log_p(data[item], params)
+
+        return log_p
 
     def _log_p(self, data, params):
         raise NotImplemented
 
+    def _log_p_array(self, data, params):
+        '''
+        Vectorised version of _log_p. Fields of data and params may be NumPy arrays which will be broadcast.
+        '''
+        raise NotImplemented
+
 
 class BetaDensity(Density):
 
+    vectorised = True
+
     def _log_p(self, data, params):
         x = data.x
 
@@ -66,9 +184,14 @@ class BetaDensity(Density):
 
         return log_beta_pdf(x, a, b)
 
+    def _log_p_array(self, data, params):
+        return log_beta_pdf_array(data.x, params.a, params.b)
+
 
 class BetaBinomialDensity(Density):
 
+    vectorised = True
+
     def _log_p(self, data, params):
         x = data.x
         n = data.n
@@ -78,9 +201,14 @@ class BetaBinomialDensity(Density):
 
         return log_beta_binomial_pdf(x, n, a, b)
 
+    def _log_p_array(self, data, params):
+        return log_beta_binomial_pdf_array(data.x, data.n, params.a, params.b)
+
 
 class BinomialDensity(Density):
 
+    vectorised = True
+
     def _log_p(self, data, params):
         x = data.x
         n = data.n
@@ -89,9 +217,14 @@ class BinomialDensity(Density):
 
         return log_binomial_pdf(x, n, p)
 
+    def _log_p_array(self, data, params):
+        return log_binomial_pdf_array(data.x, data.n, params.x)
+
 
 class GammaDensity(Density):
 
+    vectorised = True
+
     def _log_p(self, data, params):
         x = data.x
 
@@ -101,9 +234,14 @@ class GammaDensity(Density):
 
         return log_gamma_pdf(x, a, b)
 
+    def _log_p_array(self, data, params):
+        return log_gamma_pdf_array(data.x, params.a, params.b)
+
 
 class GaussianDensity(Density):
 
+    vectorised = True
+
     def _log_p(self, data, params):
         x = data.x
 
@@ -112,9 +250,14 @@ class GaussianDensity(Density):
 
         return log_gaussian_pdf(x, mean, precision)
 
+    def _log_p_array(self, data, params):
+        return log_gaussian_pdf_array(data.x, params.mean, params.precision)
+
 
 class PoissonDensity(Density):
 
+    vectorised = True
+
     def _log_p(self, data, params):
         x = data.x
 
@@ -122,12 +265,27 @@ class PoissonDensity(Density):
 
         return log_poisson_pdf(x, l)
 
+    def _log_p_array(self, data, params):
+        return log_poisson_pdf_array(data.x, params.x)
+
+
+class NegativeBinomialDensity(Density):
 
-class NegativeBinomialDensity(object):
+    vectorised = True
 
     def _log_p(self, data, params):
         x = data.x
 
+        r, p = self._get_standard_params(params)
+
+        return log_negative_binomial(x, r, p)
+
+    def _log_p_array(self, data, params):
+        r, p = self._get_standard_params(params)
+
+        return log_negative_binomial_array(data.x, r, p)
+
+    def _get_standard_params(self, params):
         if isinstance(params, NegativeBinomialParameter):
             r = params.r
             p = params.p
@@ -137,7 +295,63 @@ class NegativeBinomialDensity(object):
         else:
             raise Exception("NegativeBinomialDensity does not accept parameters of type {0}.".format(type(params)))
 
-        return log_negative_binomial(x, r, p)
+        return r, p
+
+
+class StudentTDensity(Density):
+    '''
+    Student-t density parameterised by a Gaussian-Gamma distribution over the mean and precision of a Gaussian. This is
+    the posterior predictive density of the Gaussian-Gamma-Gaussian model.
+    '''
+
+    vectorised = True
+
+    def _log_p(self, data, params):
+        x = data.x
+
+        df, scale2 = self._get_standard_params(params)
+
+        return log_student_t_pdf(x, df, params.mean, scale2)
+
+    def _log_p_array(self, data, params):
+        df, scale2 = self._get_standard_params(params)
+
+        return log_student_t_pdf_array(data.x, df, params.mean, scale2)
+
+    def _get_standard_params(self, params):
+        df = 2 * params.alpha
+
+        scale2 = params.beta * (params.size + 1) / (params.alpha * params.size)
+
+        return df, scale2
+
+#=======================================================================================================================
+# Calling densities which may only implement log_p
+#=======================================================================================================================
+
+
+def log_p_many(density, data, params, vectorise=False):
+    '''
+    Call density.log_p_many, or density.log_p for each parameter if the density does not subclass Density.
+    '''
+    method = getattr(density, 'log_p_many', None)
+
+    if method is None:
+        return [density.log_p(data, x) for x in params]
+
+    return method(data, params, vectorise=vectorise)
+
+
+def log_p_sum(density, data, items, params):
+    '''
+    Call density.log_p_sum, or sum density.log_p over the items if the density does not subclass Density.
+    '''
+    method = getattr(density, 'log_p_sum', None)
+
+    if method is None:
+        return sum([density.log_p(data[item], params) for item in items])
+
+    return method(data, items, params)
 
 #=======================================================================================================================
 # Log of probability density functions
@@ -215,11 +429,80 @@ def log_normal_pdf(x, mu, sigma2):
 def log_poisson_pdf(x, l):
     return x * log(l) - l - log_factorial(x)
 
+
+def log_student_t_pdf(x, df, loc, scale2):
+    return log_gamma((df + 1) / 2) - log_gamma(df / 2) - 1 / 2 * log(df * pi * scale2) - \
+        ((df + 1) / 2) * log(1 + (x - loc) ** 2 / (df * scale2))
+
+#=======================================================================================================================
+# Vectorised log of probability density functions
+#=======================================================================================================================
+# These functions require NumPy and SciPy. Arguments may be scalars or arrays which will be broadcast against each
+# other.
+
+
+def log_beta_pdf_array(x, a, b):
+    x = np.asarray(x, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_p = -log_beta_array(a, b) + (a - 1) * np.log(x) + (b - 1) * np.log1p(-x)
+
+    return np.where((x == 0) | (x == 1), float('-inf'), log_p)
+
+
+def log_beta_binomial_pdf_array(x, n, a, b):
+    return log_binomial_coefficient_array(n, x) + log_beta_array(a + x, b + n - x) - log_beta_array(a, b)
+
+
+def log_binomial_pdf_array(x, n, p):
+    with np.errstate(divide='ignore'):
+        return log_binomial_coefficient_array(n, x) + _xlogy(x, p) + _xlog1py(n - x, -np.asarray(p, dtype=float))
+
+
+def log_gamma_pdf_array(x, a, b):
+    return -_array_log_gamma(a) + a * np.log(b) + (a - 1) * np.log(x) - b * x
+
+
+def log_gaussian_pdf_array(x, mean, precision):
+    return 0.5 * np.log(precision / (2 * pi)) - 0.5 * precision * (x - mean) ** 2
+
+
+def log_negative_binomial_array(x, r, p):
+    return log_binomial_coefficient_array(x + r - 1, x) + r * np.log1p(-np.asarray(p, dtype=float)) + _xlogy(x, p)
+
+
+def log_poisson_pdf_array(x, l):
+    return _xlogy(x, l) - l - _array_log_gamma(np.asarray(x, dtype=float) + 1)
+
+
+def log_student_t_pdf_array(x, df, loc, scale2):
+    return _array_log_gamma((df + 1) / 2) - _array_log_gamma(df / 2) - 0.5 * np.log(df * pi * scale2) - \
+        ((df + 1) / 2) * np.log1p((x - loc) ** 2 / (df * scale2))
+
+
+def log_beta_array(a, b):
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+
+    log_p = _array_log_gamma(a) + _array_log_gamma(b) - _array_log_gamma(a + b)
+
+    return np.where((a <= 0) | (b <= 0), float('-inf'), log_p)
+
+
+def log_binomial_coefficient_array(n, x):
+    n = np.asarray(n, dtype=float)
+
+    return _array_log_gamma(n + 1) - _array_log_gamma(x + 1) - _array_log_gamma(n - x + 1)
+
 #=======================================================================================================================
 # Helper functions
 #=======================================================================================================================
 
 
+def _is_columns(x):
+    return len(x) > 0 and isinstance(x[0], np.ndarray)
+
+
 def log_beta(a, b):
     if a <= 0 or b <= 0:
         return float('-inf')
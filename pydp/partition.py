@@ -14,78 +14,127 @@ Created on 2012-09-20
 
 @author: Andrew Roth
 '''
+from pydp.densities import log_p_sum
 
 
 class Partition(object):
+    '''
+    A partition of the items {0, ..., n - 1} into cells.
+
+    The partition keeps an item to cell lookup table which is updated incrementally as items are added and removed, so
+    label queries do not require scanning the cells.
+    '''
 
     def __init__(self):
-        self.cells = []
+        self._cells = []
+
+        # Maps each item to the cell containing it or None if the item is not in the partition.
+        self._item_cells = []
+
+        self._number_of_items = 0
+
+    @property
+    def cells(self):
+        return self._cells
+
+    @cells.setter
+    def cells(self, cells):
+        self._cells = []
+
+        self._item_cells = []
+
+        self._number_of_items = 0
+
+        for cell in cells:
+            self._attach_cell(cell)
+
+            for item in cell.items:
+                self._register_item(item, cell)
+
+    @property
+    def canonical_labels(self):
+        '''
+        Labels with the cells numbered in order of first occurrence, i.e. by their smallest item. Unlike labels these do
+        not depend on the order of the cells so the same partition always gives the same labels.
+        '''
+        canonical_index = dict((cell, i) for i, cell in enumerate(self._get_canonical_cells()))
+
+        return [None if cell is None else canonical_index[cell] for cell in self._item_cells]
+
+    @property
+    def canonical_cell_values(self):
+        '''
+        Values of the non-empty cells in the order used by canonical_labels.
+        '''
+        return [cell.value for cell in self._get_canonical_cells()]
 
     @property
     def cell_values(self):
-        return [cell.value for cell in self.cells]
+        return [cell.value for cell in self._cells]
 
     @property
     def counts(self):
-        return [cell.size for cell in self.cells]
+        return [cell.size for cell in self._cells]
 
     @property
     def item_values(self):
-        cell_values = self.cell_values
-        labels = self.labels
-
-        return [cell_values[i] for i in labels]
+        return [cell.value for cell in self._item_cells]
 
     @property
     def labels(self):
-        labels = [None] * self.number_of_items
-
-        for cell_index, cell in enumerate(self.cells):
-            for item in cell.items:
-                labels[item] = cell_index
-
-        return labels
+        return [None if cell is None else cell._index for cell in self._item_cells]
 
     @property
     def number_of_cells(self):
-        return len(self.cells)
+        return len(self._cells)
 
     @property
     def number_of_items(self):
-        return sum(self.counts)
+        return self._number_of_items
 
     def add_cell(self, value):
         cell = PartitionCell(value)
 
-        self.cells.append(cell)
+        self._attach_cell(cell)
 
         return cell
 
     def add_item(self, item, cell_index):
-        self.cells[cell_index].add_item(item)
+        self._cells[cell_index].add_item(item)
 
     def get_cell_by_value(self, value):
-        for cell in self.cells:
+        for cell in self._cells:
             if cell.value == value:
                 return cell
 
     def get_cell_index(self, item):
-        for cell_index, cell in enumerate(self.cells):
-            if item in cell:
-                return cell_index
+        if item < len(self._item_cells):
+            cell = self._item_cells[item]
+
+            if cell is not None:
+                return cell._index
 
     def remove_item(self, item, cell_index):
-        self.cells[cell_index].remove_item(item)
+        self._cells[cell_index].remove_item(item)
 
     def remove_empty_cells(self):
-        for cell in self.cells[:]:
+        cells = []
+
+        for cell in self._cells:
             if cell.empty:
-                self.cells.remove(cell)
+                cell._partition = None
+
+            else:
+                cell._index = len(cells)
+
+                cells.append(cell)
+
+        self._cells = cells
 
     def copy(self):
         partition = Partition()
 
-        for cell_index, cell in enumerate(self.cells):
+        for cell_index, cell in enumerate(self._cells):
             partition.add_cell(cell.value)
 
             for item in cell.items:
@@ -93,14 +142,67 @@ class Partition(object):
 
         return partition
 
+    def _get_canonical_cells(self):
+        return sorted([cell for cell in self._cells if cell.size > 0], key=lambda cell: cell.min_item)
+
+    def _attach_cell(self, cell):
+        cell._partition = self
+
+        cell._index = len(self._cells)
+
+        self._cells.append(cell)
+
+    def _register_item(self, item, cell):
+        if item >= len(self._item_cells):
+            self._item_cells.extend([None] * (item + 1 - len(self._item_cells)))
+
+        self._item_cells[item] = cell
+
+        self._number_of_items += 1
+
+    def _unregister_item(self, item, cell):
+        if self._item_cells[item] is cell:
+            self._item_cells[item] = None
+
+        self._number_of_items -= 1
+
 
 class PartitionCell(object):
+    '''
+    A cell (block) of a partition.
+
+    Items are stored in an array with a companion item to position map. Removal swaps the last item into the vacated
+    slot so membership tests, additions and removals are all O(1). Note this means the iteration order of the items is
+    not the insertion order.
+    '''
+
+    __slots__ = ('value', '_items', '_positions', '_partition', '_index', '_statistics', '_version', '_log_likelihood',
+                 '_min_item')
 
     def __init__(self, value):
         self.value = value
 
         self._items = []
 
+        self._positions = {}
+
+        # Owning partition and position in its list of cells. Set by the partition when the cell is attached.
+        self._partition = None
+
+        self._index = None
+
+        # Sufficient statistics attached to the cell keyed by class.
+        self._statistics = None
+
+        # Incremented whenever the membership of the cell changes.
+        self._version = 0
+
+        # Cached log likelihood of the items in the cell as a (key, version, value) tuple.
+        self._log_likelihood = None
+
+        # Smallest item in the cell or None if it has to be recomputed.
+        self._min_item = None
+
     @property
     def empty(self):
         if self.size == 0:
@@ -110,20 +212,179 @@ class PartitionCell(object):
 
     @property
     def items(self):
-        return self._items[:]
+        '''
+        Read-only view of the items in the cell. The view reflects later changes to the cell so it should be copied with
+        list() before the cell is modified while iterating.
+        '''
+        return PartitionCellItems(self)
+
+    @property
+    def min_item(self):
+        '''
+        Smallest item in the cell or None if the cell is empty. This is only recomputed when the smallest item is
+        removed.
+        '''
+        if self._min_item is None and self._items:
+            self._min_item = min(self._items)
+
+        return self._min_item
 
     @property
     def size(self):
         return len(self._items)
 
+    @property
+    def version(self):
+        '''
+        Counter which changes whenever an item is added to or removed from the cell.
+        '''
+        return self._version
+
     def add_item(self, item):
+        if not self._items:
+            self._min_item = item
+
+        elif self._min_item is not None and item < self._min_item:
+            self._min_item = item
+
+        self._positions[item] = len(self._items)
+
         self._items.append(item)
 
+        self._version += 1
+
+        if self._partition is not None:
+            self._partition._register_item(item, self)
+
+        if self._statistics:
+            for statistics in self._statistics.values():
+                statistics.add_item(item)
+
     def remove_item(self, item):
-        self._items.remove(item)
+        position = self._positions.pop(item)
+
+        last_item = self._items.pop()
+
+        if last_item != item:
+            self._items[position] = last_item
+
+            self._positions[last_item] = position
+
+        if item == self._min_item:
+            self._min_item = None
+
+        self._version += 1
+
+        if self._partition is not None:
+            self._partition._unregister_item(item, self)
+
+        if self._statistics:
+            for statistics in self._statistics.values():
+                statistics.remove_item(item)
+
+    def get_log_likelihood(self, data, density):
+        '''
+        Return the sum of the log density of the items in the cell given the cell value.
+
+        The value is cached until the membership of the cell, the cell value or the global parameters of the density
+        change. Changes to values are detected by object identity so values should be replaced rather than modified in
+        place.
+
+        Args:
+            data : (list) List of data points indexed by item.
+
+            density : (Density) Cluster density.
+        '''
+        key = (data, density, self.value, getattr(density, 'params', None))
+
+        if self._log_likelihood is not None:
+            cached_key, version, log_likelihood = self._log_likelihood
+
+            if version == self._version and all(x is y for x, y in zip(cached_key, key)):
+                return log_likelihood
+
+        log_likelihood = log_p_sum(density, data, self._items, self.value)
+
+        self._log_likelihood = (key, self._version, log_likelihood)
+
+        return log_likelihood
+
+    def set_log_likelihood(self, data, density, value, log_likelihood):
+        '''
+        Cache the log likelihood of the items in the cell for a value which has been evaluated elsewhere, typically an
+        accepted Metropolis-Hastings proposal. The cached value is used by get_log_likelihood once the cell value is set
+        to value.
+
+        Args:
+            data : (list) List of data points indexed by item.
+
+            density : (Density) Cluster density with the global parameters used to compute log_likelihood.
+
+            value : (namedtuple) Cell value used to compute log_likelihood.
+
+            log_likelihood : (float) Sum of the log density of the items in the cell.
+        '''
+        self._log_likelihood = ((data, density, value, getattr(density, 'params', None)), self._version, log_likelihood)
+
+    def get_sufficient_statistics(self, statistics_cls, data, key=None):
+        '''
+        Return sufficient statistics for the items in the cell.
+
+        The statistics are computed the first time they are requested for a given data set and then kept up to date as
+        items are added to and removed from the cell.
+
+        Args:
+            statistics_cls : (class) Subclass of SufficientStatistics to compute.
+
+            data : (list) List of data points indexed by item.
+
+        Kwargs:
+            key : (hashable) Key the statistics are stored under. Defaults to statistics_cls. Use different keys to keep
+                             statistics of the same class for several data sets, e.g. the dimensions of vector data.
+        '''
+        if key is None:
+            key = statistics_cls
+
+        if self._statistics is None:
+            self._statistics = {}
+
+        statistics = self._statistics.get(key)
+
+        if statistics is None or statistics.data is not data:
+            statistics = statistics_cls(data)
+
+            for item in self._items:
+                statistics.add_item(item)
+
+            self._statistics[key] = statistics
+
+        return statistics
 
     def __contains__(self, x):
-        if x in self._items:
-            return True
-        else:
-            return False
+        return x in self._positions
+
+
+class PartitionCellItems(object):
+    '''
+    Read-only view of the items in a PartitionCell which avoids copying the underlying array.
+    '''
+
+    __slots__ = ('_cell',)
+
+    def __init__(self, cell):
+        self._cell = cell
+
+    def __contains__(self, x):
+        return x in self._cell._positions
+
+    def __getitem__(self, index):
+        return self._cell._items[index]
+
+    def __iter__(self):
+        return iter(self._cell._items)
+
+    def __len__(self):
+        return len(self._cell._items)
+
+    def __repr__(self):
+        return repr(self._cell._items)
@@ -24,7 +24,7 @@ class ProposalFunction(object):
     def log_p(self, data, params):
         raise NotImplemented
 
-    def random(self, params):
+    def random(self, params, rng=None):
         raise NotImplemented
 
 
@@ -36,8 +36,8 @@ class BaseMeasureProposalFunction(ProposalFunction):
     def log_p(self, data, params):
         return self.base_measure.log_p(data)
 
-    def random(self, params):
-        return self.base_measure.random()
+    def random(self, params, rng=None):
+        return self.base_measure.random(rng=rng)
 
 
 class BetaProposalFunction(ProposalFunction):
@@ -50,13 +50,13 @@ class BetaProposalFunction(ProposalFunction):
 
         return log_beta_pdf(data.x, a, b)
 
-    def random(self, params):
+    def random(self, params, rng=None):
         a, b = self._get_standard_params(params)
 
         a += 1
         b += 1
 
-        return BetaData(beta_rvs(a, b))
+        return BetaData(beta_rvs(a, b, rng=rng))
 
     def _get_standard_params(self, params):
         s = self.s
@@ -78,10 +78,10 @@ class GammaProposal(ProposalFunction):
 
         return log_gamma_pdf(data.x, a, b)
 
-    def random(self, params):
+    def random(self, params, rng=None):
         a, b = self._get_params(params.x)
 
-        return GammaData(gamma_rvs(a, b))
+        return GammaData(gamma_rvs(a, b, rng=rng))
 
     def _get_params(self, x):
         b = x * self.precision
@@ -16,14 +16,116 @@ Created on 2012-09-21
 '''
 from __future__ import division
 
-from math import log, sqrt
-from random import betavariate as beta_rvs, gammavariate as _gamma_rvs, normalvariate as _normal_rvs, \
-    uniform as uniform_rvs
+from bisect import bisect_right
+from math import exp, floor, lgamma as log_gamma, log, sqrt
+
+import hashlib
+import random
 
 from pydp.utils import log_sum_exp
 
+try:
+    import numpy as np
+
+except ImportError:
+    np = None
+
+#=======================================================================================================================
+# Random number streams
+#=======================================================================================================================
+
+
+class RandomStream(random.Random):
+    '''
+    Seedable stream of random numbers which can spawn independent sub-streams.
+
+    All functions in this module, and the samplers, base measures and proposal functions which use them, accept an rng
+    argument which can be an instance of this class. When rng is None the default stream is used, which is the random
+    module unless set_default_rng has been called.
+    '''
+
+    def __init__(self, seed=None):
+        '''
+        Kwargs:
+            seed : (int) Seed for the stream. If None a seed is drawn from the system.
+        '''
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+
+        self.seed_value = seed
+
+        self._num_spawned = 0
+
+        random.Random.__init__(self, seed)
+
+    def spawn(self, n):
+        '''
+        Return a list of n new streams. The seed of each new stream is derived by hashing the seed of this stream and
+        the number of streams spawned so far, so the same sequence of calls to spawn always gives the same streams.
+        '''
+        streams = []
+
+        for _ in range(n):
+            key = '{0}:{1}'.format(self.seed_value, self._num_spawned).encode('ascii')
+
+            streams.append(RandomStream(int(hashlib.sha256(key).hexdigest()[:16], 16)))
+
+            self._num_spawned += 1
+
+        return streams
+
+    def __getstate__(self):
+        return (self.getstate(), self.seed_value, self._num_spawned)
+
+    def __setstate__(self, state):
+        random_state, self.seed_value, self._num_spawned = state
+
+        self.setstate(random_state)
+
+    def __reduce__(self):
+        return (self.__class__, (self.seed_value,), self.__getstate__())
+
+
+_default_rng = random
+
+
+def get_rng(rng=None):
+    '''
+    Return rng, or the default stream if rng is None.
+    '''
+    if rng is None:
+        return _default_rng
+
+    return rng
+
 
-def bernoulli_rvs(p):
+def set_default_rng(rng):
+    '''
+    Set the stream used when no rng is passed. Passing None restores the random module as the default stream.
+    '''
+    global _default_rng
+
+    if rng is None:
+        rng = random
+
+    _default_rng = rng
+
+
+def get_numpy_random_state(rng=None):
+    '''
+    Return a NumPy RandomState seeded from rng, for code which draws arrays of random numbers.
+    '''
+    if np is None:
+        raise ImportError('NumPy is required for a NumPy random state.')
+
+    return np.random.RandomState(get_rng(rng).getrandbits(32))
+
+#=======================================================================================================================
+# Random variables
+#=======================================================================================================================
+
+
+def bernoulli_rvs(p, rng=None):
     '''
     Return a Bernoulli distributed random variable.
 
@@ -33,7 +135,7 @@ def bernoulli_rvs(p):
     Returns:
         x : (int) Binary indicator of success/failure.
     '''
-    u = uniform_rvs(0, 1)
+    u = uniform_rvs(0, 1, rng=rng)
 
     if u <= p:
         return 1
@@ -41,18 +143,28 @@ def bernoulli_rvs(p):
         return 0
 
 
-def beta_binomial_rvs(n, a, b):
-    p = beta_rvs(a, b)
+def beta_binomial_rvs(n, a, b, rng=None):
+    p = beta_rvs(a, b, rng=rng)
 
-    x = binomial_rvs(n, p)
+    x = binomial_rvs(n, p, rng=rng)
 
     return x
 
 
-def binomial_rvs(n, p):
+def beta_rvs(a, b, rng=None):
+    '''
+    Sample a beta distributed random variable.
+    '''
+    return get_rng(rng).betavariate(a, b)
+
+
+def binomial_rvs(n, p, rng=None):
     '''
     Sample a binomial distributed random variable.
 
+    Uses inversion when n * p < 10 and the transformed rejection sampler BTRS of Hormann "The Generation of Binomial
+    Random Variates" otherwise, so the expected cost is bounded regardless of n.
+
     Args:
         n : (int) Number of trials performed.
         p : (int) Probability of success for each trial.
@@ -61,34 +173,101 @@ def binomial_rvs(n, p):
         x : (int) Number of successful trials.
     '''
     if p > 0.5:
-        return n - binomial_rvs(n, 1 - p)
+        return n - binomial_rvs(n, 1 - p, rng=rng)
 
-    if p == 0:
+    if p == 0 or n == 0:
         return 0
 
-    u = uniform_rvs(0, 1)
-    log_u = log(u)
+    if n * p < 10:
+        return _binomial_inversion_rvs(n, p, rng)
+
+    return _binomial_btrs_rvs(n, p, rng)
+
+
+def _binomial_inversion_rvs(n, p, rng):
+    q = 1 - p
+
+    s = p / q
+
+    a = (n + 1) * s
+
+    prob = q ** n
 
-    log_c = log(p) - log(1 - p)
+    u = uniform_rvs(0, 1, rng=rng)
+
+    x = 0
+
+    while u > prob:
+        u -= prob
+
+        x += 1
+
+        if x > n:
+            return n
+
+        prob *= a / x - s
+
+    return x
 
-    i = 0
 
-    log_prob = n * log(1 - p)
+def _binomial_btrs_rvs(n, p, rng):
+    q = 1 - p
 
-    log_F = log_prob
+    spq = sqrt(n * p * q)
+
+    b = 1.15 + 2.53 * spq
+
+    a = -0.0873 + 0.0248 * b + 0.01 * p
+
+    c = n * p + 0.5
+
+    v_r = 0.92 - 4.2 / b
+
+    alpha = (2.83 + 5.1 / b) * spq
+
+    log_pq = log(p / q)
+
+    m = floor((n + 1) * p)
+
+    h = log_gamma(m + 1) + log_gamma(n - m + 1)
 
     while True:
-        if log_u < log_F:
-            return i
+        u = uniform_rvs(0, 1, rng=rng) - 0.5
+
+        v = uniform_rvs(0, 1, rng=rng)
+
+        us = 0.5 - abs(u)
+
+        k = floor((2 * a / us + b) * u + c)
+
+        if k < 0 or k > n:
+            continue
+
+        if us >= 0.07 and v <= v_r:
+            return int(k)
+
+        v = log(v * alpha / (a / (us * us) + b))
 
-        log_prob += log_c + log(n - i) - log(i + 1)
+        if v <= h - log_gamma(k + 1) - log_gamma(n - k + 1) + (k - m) * log_pq:
+            return int(k)
 
-        log_F = log_sum_exp([log_F, log_prob])
 
-        i += 1
+def binomial_rvs_array(n, p, size=None, rng=None):
+    '''
+    Sample an array of binomial distributed random variables using NumPy.
+
+    Args:
+        n : (int or array) Number of trials performed.
+        p : (float or array) Probability of success for each trial.
+
+    Kwargs:
+        size : (int or tuple) Shape of the output. Defaults to the broadcast shape of n and p.
+        rng : (RandomStream) Stream of random numbers used to seed NumPy. If None the default stream is used.
+    '''
+    return get_numpy_random_state(rng).binomial(n, p, size=size)
 
 
-def dirichlet_rvs(alpha):
+def dirichlet_rvs(alpha, rng=None):
     '''
     Sample a Dirichlet distributed random variable.
 
@@ -98,14 +277,14 @@ def dirichlet_rvs(alpha):
     Returns:
         pi : (list) List of probabilities for each class such that sum(pi) == 1.
     '''
-    g = [gamma_rvs(a, 1) for a in alpha]
+    g = [gamma_rvs(a, 1, rng=rng) for a in alpha]
 
     norm_const = sum(g)
 
     return [x / norm_const for x in g]
 
 
-def discrete_rvs(p):
+def discrete_rvs(p, rng=None):
     '''
     Sample a discrete (Categorical) random variable.
 
@@ -117,7 +296,7 @@ def discrete_rvs(p):
     '''
     total = 0
 
-    u = uniform_rvs(0, 1)
+    u = uniform_rvs(0, 1, rng=rng)
 
     for i, p_i in enumerate(p):
         total += p_i
@@ -128,7 +307,60 @@ def discrete_rvs(p):
     return i
 
 
-def gamma_rvs(a, b):
+def log_discrete_rvs(log_p, rng=None):
+    '''
+    Sample a discrete (Categorical) random variable from unnormalised log probabilities.
+
+    The weights are exponentiated relative to the maximum and the class found by binary search of the cumulative sum,
+    so there is no need to normalise log_p first.
+
+    Args:
+        log_p : (list) Unnormalised log probabilities for each class from 0 to len(log_p) - 1
+
+    Returns:
+        i : (int) Id of class sampled.
+    '''
+    max_log_p = max(log_p)
+
+    cdf = []
+
+    total = 0
+
+    for x in log_p:
+        total += exp(x - max_log_p)
+
+        cdf.append(total)
+
+    u = uniform_rvs(0, 1, rng=rng) * total
+
+    return min(bisect_right(cdf, u), len(cdf) - 1)
+
+
+def log_discrete_rvs_array(log_p, rng=None):
+    '''
+    Sample a discrete (Categorical) random variable for each row of an array of unnormalised log probabilities.
+
+    Args:
+        log_p : (array) Array of shape (number of draws, number of classes).
+
+    Returns:
+        i : (array) Id of the class sampled for each row.
+    '''
+    if np is None:
+        raise ImportError('NumPy is required for batched sampling.')
+
+    log_p = np.asarray(log_p, dtype=float)
+
+    cdf = np.cumsum(np.exp(log_p - log_p.max(axis=1)[:, np.newaxis]), axis=1)
+
+    u = get_numpy_random_state(rng).random_sample(cdf.shape[0]) * cdf[:, -1]
+
+    index = (cdf <= u[:, np.newaxis]).sum(axis=1)
+
+    return np.minimum(index, cdf.shape[1] - 1)
+
+
+def gamma_rvs(a, b, rng=None):
     '''
                         a ** b    x ** (a - 1) * math.exp(-x * b)
             pdf(x) =  ----------------- 
@@ -138,7 +370,7 @@ def gamma_rvs(a, b):
 
     scale = 1 / b
 
-    value = _gamma_rvs(shape, scale)
+    value = get_rng(rng).gammavariate(shape, scale)
 
     if value < 1e-100:
         value = 1e-100
@@ -146,12 +378,14 @@ def gamma_rvs(a, b):
     return value
 
 
-def multinomial_rvs(n, p):
+def multinomial_rvs(n, p, rng=None):
     x = [0 for _ in p]
 
     if len(p) / n > 1:
+        table = AliasTable(p)
+
         for _ in range(n):
-            index = discrete_rvs(p)
+            index = table.sample(rng=rng)
 
             x[index] += 1
     else:
@@ -165,7 +399,7 @@ def multinomial_rvs(n, p):
             # Need min to avoid numeirc issues
             p_scale = min(p_i / denom, 1)
 
-            x[i] = binomial_rvs(n - total, p_scale)
+            x[i] = binomial_rvs(n - total, p_scale, rng=rng)
 
             denom -= p_i
 
@@ -177,7 +411,7 @@ def multinomial_rvs(n, p):
     return x
 
 
-def gaussian_rvs(mean, precision):
+def gaussian_rvs(mean, precision, rng=None):
     '''
     Draw a random variable from a univariate Gaussian (normal) distribution.
 
@@ -187,36 +421,104 @@ def gaussian_rvs(mean, precision):
     '''
     std_dev = 1 / sqrt(precision)
 
-    return _normal_rvs(mean, std_dev)
+    return get_rng(rng).normalvariate(mean, std_dev)
+
+
+def poisson_rvs(l, rng=None):
+    '''
+    Sample a Poisson distributed random variable.
+
+    Uses inversion when l < 10 and the transformed rejection sampler PTRS of Hormann "The Transformed Rejection Method
+    For Generating Poisson Random Variables" otherwise.
+
+    Args:
+        l : (float) Mean of the distribution.
+
+    Returns:
+        x : (int) Sampled value.
+    '''
+    if l == 0:
+        return 0
+
+    if l < 10:
+        return _poisson_inversion_rvs(l, rng)
+
+    return _poisson_ptrs_rvs(l, rng)
+
+
+def _poisson_inversion_rvs(l, rng):
+    prob = exp(-l)
+
+    u = uniform_rvs(0, 1, rng=rng)
+
+    x = 0
 
+    while u > prob:
+        u -= prob
 
-def poisson_rvs(l):
-    u = uniform_rvs(0, 1)
-    log_u = log(u)
+        x += 1
 
-    i = 0
+        prob *= l / x
+
+        # Only reachable through rounding error in the tail.
+        if prob == 0:
+            break
+
+    return x
+
+
+def _poisson_ptrs_rvs(l, rng):
+    sqrt_l = sqrt(l)
 
     log_l = log(l)
 
-    log_p = -l
+    b = 0.931 + 2.53 * sqrt_l
+
+    a = -0.059 + 0.02483 * b
 
-    log_F = log_p
+    log_inv_alpha = log(1.1239 + 1.1328 / (b - 3.4))
+
+    v_r = 0.9277 - 3.6224 / (b - 2)
 
     while True:
-        if log_u < log_F:
-            return i
+        u = uniform_rvs(0, 1, rng=rng) - 0.5
+
+        v = uniform_rvs(0, 1, rng=rng)
+
+        us = 0.5 - abs(u)
 
-        log_p += log_l - log(i + 1)
+        k = floor((2 * a / us + b) * u + l + 0.43)
 
-        log_F = log_sum_exp([log_F, log_p])
+        if us >= 0.07 and v <= v_r:
+            return int(k)
 
-        i += 1
+        if k < 0 or (us < 0.013 and v > us):
+            continue
 
+        if log(v) + log_inv_alpha - log(a / (us * us) + b) <= -l + k * log_l - log_gamma(k + 1):
+            return int(k)
 
-def inverse_sample_rvs(log_f, a, b, mesh_size=100):
+
+def poisson_rvs_array(l, size=None, rng=None):
+    '''
+    Sample an array of Poisson distributed random variables using NumPy.
+
+    Args:
+        l : (float or array) Mean of the distribution.
+
+    Kwargs:
+        size : (int or tuple) Shape of the output. Defaults to the shape of l.
+        rng : (RandomStream) Stream of random numbers used to seed NumPy. If None the default stream is used.
+    '''
+    return get_numpy_random_state(rng).poisson(l, size=size)
+
+
+def inverse_sample_rvs(log_f, a, b, mesh_size=100, rng=None, vectorised=False):
     '''
     Sample from a continuous univariate density using the inverse transform method.
 
+    The grid for each (a, b, mesh_size) is built once and reused, see GridSampler.
+
     Args:
         log_f : (function) A function which computes the unnormalised of the density.
         a : (float) Left side of the support for the denstiy.
@@ -224,45 +526,272 @@ def inverse_sample_rvs(log_f, a, b, mesh_size=100):
 
     Kwargs:
         mesh_size : (int) How many points to use to approximate the integral for computing CDF.
+        rng : (RandomStream) Stream of random numbers. If None the default stream is used.
+        vectorised : (bool) Whether log_f can be called once with a NumPy array of points.
 
     Returns:
         x : (float) Sampled value
         log_q : (float) The value of the density at x.
     '''
-    u = uniform_rvs(0, 1)
+    key = (a, b, mesh_size, vectorised)
+
+    if key not in _grid_samplers:
+        if len(_grid_samplers) >= 100:
+            _grid_samplers.clear()
+
+        _grid_samplers[key] = GridSampler(a, b, mesh_size=mesh_size, vectorised=vectorised)
+
+    return _grid_samplers[key].sample(log_f, rng=rng)
+
+
+_grid_samplers = {}
+
+
+def uniform_rvs(a, b, rng=None):
+    '''
+    Sample a uniform random variable on [a, b].
+    '''
+    return get_rng(rng).uniform(a, b)
+
+#=======================================================================================================================
+# Alias tables
+#=======================================================================================================================
+
+
+class AliasTable(object):
+    '''
+    Alias table of Vose "A Linear Algorithm For Generating Random Numbers With a Given Distribution" for repeated draws
+    from a fixed discrete distribution. Building the table is O(K) and each draw is O(1).
+    '''
+
+    def __init__(self, p):
+        '''
+        Args:
+            p : (list) Probabilities, or unnormalised weights, for each class from 0 to len(p) - 1
+        '''
+        n = len(p)
+
+        total = sum(p)
 
-    log_u = log(u)
+        scaled = [x * n / total for x in p]
 
-    step_size = (b - a) / mesh_size
+        self.prob = [1.0] * n
 
-    log_step_size = log(b - a) - log(mesh_size)
+        self.alias = list(range(n))
 
-    knots = [i * step_size + a for i in range(0, mesh_size + 1)]
+        small = [i for i, x in enumerate(scaled) if x < 1]
 
-    mid_points = [(x_l + x_r) / 2 for x_l, x_r in zip(knots[:-1], knots[1:])]
+        large = [i for i, x in enumerate(scaled) if x >= 1]
 
-    log_likelihood = [log_f(x) for x in mid_points]
+        while small and large:
+            s = small.pop()
 
-    log_riemann_sum = []
+            l = large.pop()
 
-    for y in log_likelihood:
-        log_riemann_sum.append(y + log_step_size)
+            self.prob[s] = scaled[s]
 
-    log_norm_const = log_sum_exp(log_riemann_sum)
+            self.alias[s] = l
 
-    log_cdf = None
+            scaled[l] = (scaled[l] + scaled[s]) - 1
 
-    for x, y in zip(mid_points, log_likelihood):
-        log_q = y - log_norm_const
+            if scaled[l] < 1:
+                small.append(l)
 
-        log_partial_pdf_riemann_sum = log_q + log_step_size
+            else:
+                large.append(l)
+
+        # Anything left over has probability 1 up to rounding error.
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, rng=None):
+        '''
+        Draw a class.
+
+        Kwargs:
+            rng : (RandomStream) Stream of random numbers. If None the default stream is used.
+        '''
+        u = uniform_rvs(0, len(self.prob), rng=rng)
+
+        i = int(u)
+
+        if i == len(self.prob):
+            i -= 1
+
+        if u - i < self.prob[i]:
+            return i
+
+        return self.alias[i]
+
+    def sample_many(self, size, rng=None):
+        '''
+        Draw size classes.
+        '''
+        return [self.sample(rng=rng) for _ in range(size)]
+
+#=======================================================================================================================
+# Grid sampling
+#=======================================================================================================================
+
+
+class GridSampler(object):
+    '''
+    Sample from a continuous univariate density on [a, b] by evaluating it at the mid points of a grid, i.e. griddy
+    Gibbs. The knots and mid points are computed once so repeated draws only evaluate the density.
+
+    If refine_factor is set, cells of the grid which hold at least refine_tol of the mass after a first pass are split
+    into refine_factor smaller cells and the density is evaluated again at their mid points. The draw is made from the
+    combined grid so the resolution is only increased where the mass is.
+    '''
+
+    def __init__(self, a, b, mesh_size=100, vectorised=False, refine_factor=None, refine_tol=1e-3):
+        '''
+        Args:
+            a : (float) Left side of the support for the density.
+            b : (float) Right side of the support for the density.
+
+        Kwargs:
+            mesh_size : (int) Number of cells in the grid.
+            vectorised : (bool) Whether log_f can be called once with a NumPy array of points.
+            refine_factor : (int) Number of cells to split cells with large mass into. If None the grid is not refined.
+            refine_tol : (float) Minimum fraction of the mass in a cell for it to be refined.
+        '''
+        if vectorised and np is None:
+            raise ImportError('NumPy is required for vectorised grid sampling.')
+
+        self.a = a
+        self.b = b
+
+        self.mesh_size = mesh_size
+
+        self.vectorised = vectorised
+
+        self.refine_factor = refine_factor
+
+        self.refine_tol = refine_tol
+
+        self.step_size = (b - a) / mesh_size
+
+        self.knots = [i * self.step_size + a for i in range(0, mesh_size + 1)]
+
+        self.mid_points = [(x_l + x_r) / 2 for x_l, x_r in zip(self.knots[:-1], self.knots[1:])]
+
+        self.log_step_size = log(b - a) - log(mesh_size)
+
+        if vectorised:
+            self._mid_points = np.array(self.mid_points)
+
+            self._log_widths = np.empty(mesh_size)
+
+            self._log_widths.fill(self.log_step_size)
 
-        if log_cdf is None:
-            log_cdf = log_partial_pdf_riemann_sum
         else:
-            log_cdf = log_sum_exp([log_cdf, log_partial_pdf_riemann_sum])
+            self._mid_points = self.mid_points
 
-        if log_u < log_cdf:
-            break
+            self._log_widths = [self.log_step_size] * mesh_size
+
+    def sample(self, log_f, rng=None):
+        '''
+        Args:
+            log_f : (function) A function which computes the unnormalised log of the density.
+
+        Kwargs:
+            rng : (RandomStream) Stream of random numbers. If None the default stream is used.
+
+        Returns:
+            x : (float) Sampled value
+            log_q : (float) The value of the normalised density at x.
+        '''
+        mid_points, log_widths, log_p = self._get_grid(log_f)
+
+        if self.vectorised:
+            log_mass = log_p + log_widths
+
+            max_log_mass = log_mass.max()
+
+            cdf = np.cumsum(np.exp(log_mass - max_log_mass))
+
+            total = cdf[-1]
+
+            u = uniform_rvs(0, 1, rng=rng) * total
+
+            i = min(int(np.searchsorted(cdf, u, side='right')), len(cdf) - 1)
+
+            x = float(mid_points[i])
+
+            y = float(log_p[i])
+
+        else:
+            log_mass = [y + w for y, w in zip(log_p, log_widths)]
+
+            max_log_mass = max(log_mass)
+
+            cdf = []
+
+            total = 0
+
+            for z in log_mass:
+                total += exp(z - max_log_mass)
+
+                cdf.append(total)
+
+            u = uniform_rvs(0, 1, rng=rng) * total
+
+            i = min(bisect_right(cdf, u), len(cdf) - 1)
+
+            x = mid_points[i]
+
+            y = log_p[i]
+
+        log_norm_const = max_log_mass + log(total)
+
+        return x, y - log_norm_const
+
+    def _evaluate(self, log_f, x):
+        if self.vectorised:
+            return np.asarray(log_f(x), dtype=float)
+
+        return [log_f(z) for z in x]
+
+    def _get_grid(self, log_f):
+        log_p = self._evaluate(log_f, self._mid_points)
+
+        if self.refine_factor is None:
+            return self._mid_points, self._log_widths, log_p
+
+        log_norm_const = log_sum_exp([y + self.log_step_size for y in log_p])
+
+        min_log_p = log(self.refine_tol) + log_norm_const - self.log_step_size
+
+        offsets = [(k + 0.5) * self.step_size / self.refine_factor for k in range(self.refine_factor)]
+
+        log_sub_step_size = self.log_step_size - log(self.refine_factor)
+
+        # The order of the cells does not matter for the draw so refined cells are placed after the rest.
+        if self.vectorised:
+            refine = log_p >= min_log_p
+
+            new_points = (self._mid_points[refine][:, np.newaxis] - self.step_size / 2 + np.array(offsets)).ravel()
+
+            mid_points = np.concatenate([self._mid_points[~refine], new_points])
+
+            log_widths = np.concatenate([self._log_widths[~refine], np.repeat(log_sub_step_size, len(new_points))])
+
+            log_p = np.concatenate([log_p[~refine], self._evaluate(log_f, new_points)])
+
+        else:
+            refine = [y >= min_log_p for y in log_p]
+
+            new_points = [x - self.step_size / 2 + z for x, r in zip(self.mid_points, refine) if r for z in offsets]
+
+            mid_points = [x for x, r in zip(self.mid_points, refine) if not r] + new_points
+
+            log_widths = [self.log_step_size] * (len(mid_points) - len(new_points)) + \
+                [log_sub_step_size] * len(new_points)
+
+            log_p = [y for y, r in zip(log_p, refine) if not r] + self._evaluate(log_f, new_points)
 
-    return x, log_q
+        return mid_points, log_widths, log_p
@@ -19,9 +19,11 @@ from __future__ import division
 from math import log
 
 from pydp.data import BetaData, GammaData, GaussianGammaData
+from pydp.densities import log_p_sum
 from pydp.proposal_functions import BaseMeasureProposalFunction
 from pydp.rvs import beta_rvs, gamma_rvs, uniform_rvs, gaussian_rvs
-from pydp.stats import mean, variance
+from pydp.sufficient_statistics import BinomialSufficientStatistics, GaussianSufficientStatistics, \
+    PoissonSufficientStatistics
 
 
 class AtomSampler(object):
@@ -29,17 +31,22 @@ class AtomSampler(object):
     Base class for samplers to update the cell values in the partition (atoms of DP).
     '''
 
-    def __init__(self, base_measure, cluster_density):
+    def __init__(self, base_measure, cluster_density, rng=None):
         '''
         Args:
             base_measure : (BaseMeasure) Base measure for DP process.
 
             cluster_density : (Density) Cluster density for DP process.
+
+        Kwargs:
+            rng : (RandomStream) Stream of random numbers. If None the default stream is used.
         '''
         self.base_measure = base_measure
 
         self.cluster_density = cluster_density
 
+        self.rng = rng
+
     def sample(self, data, partition):
         '''
         Sample a new value for atoms in the partition. The partition passed in will be updated in place.
@@ -69,30 +76,32 @@ class MetropolisHastingsAtomSampler(AtomSampler):
     the previous cell value as an argument.
     '''
 
-    def __init__(self, base_measure, cluster_density, proposal_func):
-        AtomSampler.__init__(self, base_measure, cluster_density)
+    def __init__(self, base_measure, cluster_density, proposal_func, rng=None):
+        AtomSampler.__init__(self, base_measure, cluster_density, rng=rng)
 
         self.proposal_func = proposal_func
 
     def sample_atom(self, data, cell):
         old_param = cell.value
-        new_param = self.proposal_func.random(old_param)
+        new_param = self.proposal_func.random(old_param, rng=self.rng)
 
-        old_ll = self.base_measure.log_p(old_param)
-        new_ll = self.base_measure.log_p(new_param)
+        # The log likelihood of the current value is cached on the cell so only the proposal needs to be evaluated.
+        old_data_ll = cell.get_log_likelihood(data, self.cluster_density)
+        new_data_ll = log_p_sum(self.cluster_density, data, cell.items, new_param)
 
-        for j in cell.items:
-            old_ll += self.cluster_density.log_p(data[j], old_param)
-            new_ll += self.cluster_density.log_p(data[j], new_param)
+        old_ll = self.base_measure.log_p(old_param) + old_data_ll
+        new_ll = self.base_measure.log_p(new_param) + new_data_ll
 
         forward_log_ratio = new_ll - self.proposal_func.log_p(new_param, old_param)
         reverse_log_ratio = old_ll - self.proposal_func.log_p(old_param, new_param)
 
         log_ratio = forward_log_ratio - reverse_log_ratio
 
-        u = uniform_rvs(0, 1)
+        u = uniform_rvs(0, 1, rng=self.rng)
 
         if log_ratio >= log(u):
+            cell.set_log_likelihood(data, self.cluster_density, new_param, new_data_ll)
+
             return new_param
         else:
             return old_param
@@ -103,10 +112,10 @@ class BaseMeasureAtomSampler(MetropolisHastingsAtomSampler):
     Update the atom values using a Metropolis-Hastings steps with the base measure as a proposal density.
     '''
 
-    def __init__(self, base_measure, cluster_density):
+    def __init__(self, base_measure, cluster_density, rng=None):
         proposal_func = BaseMeasureProposalFunction(base_measure)
 
-        MetropolisHastingsAtomSampler.__init__(self, base_measure, cluster_density, proposal_func)
+        MetropolisHastingsAtomSampler.__init__(self, base_measure, cluster_density, proposal_func, rng=rng)
 
 #=======================================================================================================================
 # Conjugate samplers
@@ -120,15 +129,14 @@ class BetaBinomialGibbsAtomSampler(AtomSampler):
     Requires a Beta base measure and binomial data.
     '''
 
+    sufficient_statistics = BinomialSufficientStatistics
+
     def sample_atom(self, data, cell):
-        a = self.base_measure.params.a
-        b = self.base_measure.params.b
+        statistics = cell.get_sufficient_statistics(self.sufficient_statistics, data)
 
-        for item in cell.items:
-            a += data[item].x
-            b += data[item].n - data[item].x
+        params = statistics.get_posterior_params(self.base_measure.params)
 
-        return BetaData(beta_rvs(a, b))
+        return BetaData(beta_rvs(params.a, params.b, rng=self.rng))
 
 
 class GammaPoissonGibbsAtomSampler(AtomSampler):
@@ -138,18 +146,14 @@ class GammaPoissonGibbsAtomSampler(AtomSampler):
     Requires a Gamma base measure and Poisson data.
     '''
 
-    def sample_atom(self, data, cell):
-        a = self.base_measure.params.a
+    sufficient_statistics = PoissonSufficientStatistics
 
-        for item in cell.items:
-            a += data[item].x
-
-        n = cell.size
-        b = self.base_measure.params.b
+    def sample_atom(self, data, cell):
+        statistics = cell.get_sufficient_statistics(self.sufficient_statistics, data)
 
-        b = b / (n * b + 1)
+        params = statistics.get_posterior_params(self.base_measure.params)
 
-        return GammaData(gamma_rvs(a, b))
+        return GammaData(gamma_rvs(params.a, params.b, rng=self.rng))
 
 
 class GaussianGammaGaussianAtomSampler(AtomSampler):
@@ -159,12 +163,16 @@ class GaussianGammaGaussianAtomSampler(AtomSampler):
     Requires a GammaGaussian base measure and GammaGaussian data.
     '''
 
+    sufficient_statistics = GaussianSufficientStatistics
+
     def sample_atom(self, data, cell):
-        sample_size = cell.size
+        statistics = cell.get_sufficient_statistics(self.sufficient_statistics, data)
+
+        sample_size = statistics.size
 
-        sample_mean = mean([data[item].x for item in cell.items])
+        sample_mean = statistics.mean
 
-        sample_variance = variance([data[item].x for item in cell.items], sample=False)
+        sample_variance = statistics.variance
 
         posterior_precision = self._sample_precision(sample_size, sample_mean, sample_variance)
 
@@ -182,7 +190,7 @@ class GaussianGammaGaussianAtomSampler(AtomSampler):
         posterior_mean = (prior_size * tau * prior_mean) / posterior_precision + \
                          (sample_size * tau * sample_mean) / posterior_precision
 
-        return gaussian_rvs(posterior_mean, posterior_precision)
+        return gaussian_rvs(posterior_mean, posterior_precision, rng=self.rng)
 
     def _sample_precision(self, sample_size, sample_mean, sample_variance):
         prior_alpha = self.base_measure.params.alpha
@@ -200,4 +208,4 @@ class GaussianGammaGaussianAtomSampler(AtomSampler):
             ((prior_size * sample_size) / (2 * (prior_size + sample_size))) * \
             (sample_mean - prior_mean) ** 2
 
-        return gamma_rvs(posterior_alpha, posterior_beta)
+        return gamma_rvs(posterior_alpha, posterior_beta, rng=self.rng)
@@ -41,15 +41,20 @@ class GammaPriorConcentrationSampler(ConcentrationSampler):
     Gibbs update assuming a gamma prior on the concentration parameter.
     '''
 
-    def __init__(self, a, b):
+    def __init__(self, a, b, rng=None):
         '''
         Args :
             a : (float) Shape parameter of the gamma prior.
             b : (float) Rate parameter of the gamma prior.
+
+        Kwargs :
+            rng : (RandomStream) Stream of random numbers. If None the default stream is used.
         '''
         self.a = a
         self.b = b
 
+        self.rng = rng
+
     def sample(self, old_value, num_clusters, num_data_points):
         a = self.a
         b = self.b
@@ -57,19 +62,19 @@ class GammaPriorConcentrationSampler(ConcentrationSampler):
         k = num_clusters
         n = num_data_points
 
-        eta = beta_rvs(old_value + 1, n)
+        eta = beta_rvs(old_value + 1, n, rng=self.rng)
 
         x = (a + k - 1) / (n * (b - log(eta)))
 
         pi = x / (1 + x)
 
-        label = discrete_rvs([pi, 1 - pi])
+        label = discrete_rvs([pi, 1 - pi], rng=self.rng)
 
         scale = b - log(eta)
 
         if label == 0:
-            new_value = gamma_rvs(a + k, scale)
+            new_value = gamma_rvs(a + k, scale, rng=self.rng)
         else:
-            new_value = gamma_rvs(a + k - 1, scale)
+            new_value = gamma_rvs(a + k - 1, scale, rng=self.rng)
 
         return new_value
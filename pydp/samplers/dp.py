@@ -16,15 +16,31 @@ Created on 2013-03-21
 '''
 from __future__ import division
 
-from collections import OrderedDict
+from array import array
+from collections import OrderedDict, namedtuple
+
+import multiprocessing
+
+try:
+    from collections.abc import Mapping
+
+except ImportError:
+    from collections import Mapping
 
 from pydp.partition import Partition
+from pydp.rvs import RandomStream, get_rng, set_default_rng
 from pydp.samplers.concentration import GammaPriorConcentrationSampler
 
 
 class DirichletProcessSampler(object):
 
-    def __init__(self, atom_sampler, partition_sampler, alpha=1.0, alpha_priors=None, global_params_sampler=None):
+    def __init__(self, atom_sampler, partition_sampler, alpha=1.0, alpha_priors=None, global_params_sampler=None,
+                 rng=None, canonical_labels=False):
+        '''
+        Kwargs:
+            canonical_labels : (bool) Whether the labels in state number the cells in order of first occurrence, so the
+                                      same partition always has the same labels. See Partition.canonical_labels.
+        '''
         self.atom_sampler = atom_sampler
 
         self.partition_sampler = partition_sampler
@@ -38,7 +54,8 @@ class DirichletProcessSampler(object):
             self.update_alpha = True
 
             self.concentration_sampler = GammaPriorConcentrationSampler(alpha_priors['shape'],
-                                                                        alpha_priors['rate'])
+                                                                        alpha_priors['rate'],
+                                                                        rng=rng)
 
         if global_params_sampler is None:
             self.update_global_params = False
@@ -48,16 +65,50 @@ class DirichletProcessSampler(object):
 
             self.global_params_sampler = global_params_sampler
 
+        self.rng = rng
+
+        self.canonical_labels = canonical_labels
+
         self.num_iters = 0
 
     @property
     def state(self):
-        return {
-            'alpha': self.alpha,
-            'labels': self.partition.labels,
-            'params': [param for param in self.partition.item_values],
-            'global_params': self.atom_sampler.cluster_density.params
-        }
+        return self.get_state()
+
+    def get_state(self, fields=None):
+        '''
+        Take a snapshot of the sampler for a trace.
+
+        Kwargs:
+            fields : (list) Fields the trace records. Only the parts of the state needed for these fields are copied. If
+                            None all fields are available.
+
+        Returns:
+            state : (DirichletProcessState) Snapshot of the sampler.
+        '''
+        def wanted(*names):
+            return fields is None or any([x in fields for x in names])
+
+        state = {'alpha': self.alpha}
+
+        if wanted('labels', 'params'):
+            if self.canonical_labels:
+                state['labels'] = array('i', self.partition.canonical_labels)
+
+            else:
+                state['labels'] = array('i', self.partition.labels)
+
+        if wanted('cell_values', 'params'):
+            if self.canonical_labels:
+                state['cell_values'] = self.partition.canonical_cell_values
+
+            else:
+                state['cell_values'] = self.partition.cell_values
+
+        if wanted('global_params'):
+            state['global_params'] = self.atom_sampler.cluster_density.params
+
+        return DirichletProcessState(state)
 
     def initialise_partition(self, data, init_method):
         '''
@@ -74,12 +125,12 @@ class DirichletProcessSampler(object):
 
         if init_method == 'disconnected':
             for item, _ in enumerate(data):
-                self.partition.add_cell(self.partition_sampler.base_measure.random())
+                self.partition.add_cell(self.partition_sampler.base_measure.random(rng=self.rng))
 
                 self.partition.add_item(item, item)
 
         elif init_method == 'connected':
-            self.partition.add_cell(self.partition_sampler.base_measure.random())
+            self.partition.add_cell(self.partition_sampler.base_measure.random(rng=self.rng))
 
             for item, _ in enumerate(data):
                 self.partition.add_item(item, 0)
@@ -105,7 +156,10 @@ class DirichletProcessSampler(object):
 
             self.interactive_sample(data)
 
-            trace.update(self.state)
+            accept = getattr(trace, 'accept', None)
+
+            if accept is None or accept():
+                trace.update(self.get_state(getattr(trace, 'fields', None)))
 
             self.num_iters += 1
 
@@ -121,3 +175,157 @@ class DirichletProcessSampler(object):
 
         if self.update_global_params:
             self.global_params_sampler.sample(data, self.partition)
+
+
+class DirichletProcessState(Mapping):
+    '''
+    Read-only snapshot of a DirichletProcessSampler passed to traces.
+
+    The labels are stored as an int array and the values as one entry per cell, so the per item values are only built
+    if the 'params' field is read. Fields which were not requested when the snapshot was taken are missing.
+
+    Fields:
+        alpha : (float) Concentration parameter.
+
+        labels : (array) Index of the cell of each item.
+
+        cell_values : (list) Value of each cell, indexed by label.
+
+        params : (list) Value of the cell of each item.
+
+        global_params : Parameters of the cluster density.
+    '''
+
+    def __init__(self, fields):
+        '''
+        Args:
+            fields : (dict) Values of the fields in the snapshot, excluding params.
+        '''
+        self._fields = fields
+
+    def __getitem__(self, key):
+        if key == 'params' and key not in self._fields:
+            if 'labels' not in self._fields or 'cell_values' not in self._fields:
+                raise KeyError(key)
+
+            cell_values = self._fields['cell_values']
+
+            self._fields['params'] = [cell_values[x] for x in self._fields['labels']]
+
+        return self._fields[key]
+
+    def __iter__(self):
+        keys = list(self._fields.keys())
+
+        if 'params' not in self._fields and 'labels' in self._fields and 'cell_values' in self._fields:
+            keys.append('params')
+
+        return iter(keys)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+#=======================================================================================================================
+# Multiple chains
+#=======================================================================================================================
+
+
+ChainResult = namedtuple('ChainResult', ['chain_id', 'seed', 'trace'])
+
+
+def run_parallel_chains(sampler_factory,
+                        trace_factory,
+                        data,
+                        num_chains,
+                        num_iters,
+                        seed=None,
+                        num_processes=None,
+                        init_method='disconnected',
+                        print_freq=100):
+    '''
+    Run independent chains of a DirichletProcessSampler in a pool of worker processes.
+
+    Each chain gets its own RandomStream spawned from a stream seeded with seed, which is set as the default stream
+    while the chain runs, so a set of chains can be reproduced regardless of the number of processes used. Samplers
+    should be built with rng=None to use it. The factories are sent to the worker processes so they must be picklable,
+    i.e. module level functions, classes or functools.partial objects.
+
+    Args:
+        sampler_factory : (callable) Called with no arguments to build a new DirichletProcessSampler.
+
+        trace_factory : (callable) Called with the chain id to build the trace the chain will write to.
+
+        data : (list) Data points.
+
+        num_chains : (int) Number of chains to run.
+
+        num_iters : (int) Number of iterations per chain.
+
+    Kwargs:
+        seed : (int) Seed used to derive the seed of each chain. If None the chain seeds are drawn from the system.
+
+        num_processes : (int) Number of worker processes. Defaults to one per chain up to the number of CPUs. If 1 the
+                              chains are run in the current process.
+
+        init_method : (str) Initialisation method passed to DirichletProcessSampler.sample.
+
+        print_freq : (int) Print frequency passed to DirichletProcessSampler.sample.
+
+    Returns:
+        results : (list) ChainResult of (chain_id, seed, trace) for each chain ordered by chain id. The seed can be
+                         passed to RandomStream to reproduce the chain. The trace is the object the chain wrote to,
+                         returned from the worker process after it was closed.
+    '''
+    streams = RandomStream(seed).spawn(num_chains)
+
+    args = []
+
+    for chain_id in range(num_chains):
+        chain_seed = streams[chain_id].seed_value
+
+        args.append((sampler_factory, trace_factory, data, chain_id, chain_seed, num_iters, init_method, print_freq))
+
+    if num_processes is None:
+        num_processes = min(num_chains, multiprocessing.cpu_count())
+
+    if num_processes == 1:
+        return [_run_chain(x) for x in args]
+
+    pool = multiprocessing.Pool(num_processes)
+
+    try:
+        results = pool.map(_run_chain, args, chunksize=1)
+
+    finally:
+        pool.close()
+
+        pool.join()
+
+    return results
+
+
+def _run_chain(args):
+    sampler_factory, trace_factory, data, chain_id, seed, num_iters, init_method, print_freq = args
+
+    default_rng = get_rng()
+
+    set_default_rng(RandomStream(seed))
+
+    try:
+        sampler = sampler_factory()
+
+        trace = trace_factory(chain_id)
+
+        trace.open('w')
+
+        try:
+            sampler.sample(data, trace, num_iters, init_method=init_method, print_freq=print_freq)
+
+        finally:
+            trace.close()
+
+    finally:
+        set_default_rng(default_rng)
+
+    return ChainResult(chain_id, seed, trace)
@@ -18,6 +18,7 @@ from __future__ import division
 
 from math import log
 
+from pydp.densities import log_p_sum
 from pydp.rvs import uniform_rvs
 
 
@@ -26,16 +27,21 @@ class GlobalParameterSampler(object):
     Base class for samplers to update the cell values in the partition (atoms of DP).
     '''
 
-    def __init__(self, base_measure, cluster_density):
+    def __init__(self, base_measure, cluster_density, rng=None):
         '''
         Args:
             base_measure : (BaseMeasure) Prior density for parameter.
             cluster_density : (Density) Cluster density for DP process.
+
+        Kwargs:
+            rng : (RandomStream) Stream of random numbers. If None the default stream is used.
         '''
         self.base_measure = base_measure
 
         self.cluster_density = cluster_density
 
+        self.rng = rng
+
     def sample(self, data, partition):
         '''
         Sample new values for global parameters.
@@ -58,40 +64,42 @@ class MetropolisHastingsGlobalParameterSampler(GlobalParameterSampler):
     the previous cell value as an argument.
     '''
 
-    def __init__(self, base_measure, cluster_density, proposal_func):
-        GlobalParameterSampler.__init__(self, base_measure, cluster_density)
+    def __init__(self, base_measure, cluster_density, proposal_func, rng=None):
+        GlobalParameterSampler.__init__(self, base_measure, cluster_density, rng=rng)
 
         self.proposal_func = proposal_func
 
     def sample(self, data, partition):
         old_param = self.cluster_density.params
-        new_param = self.proposal_func.random(old_param)
+        new_param = self.proposal_func.random(old_param, rng=self.rng)
 
         old_ll = self.base_measure.log_p(old_param)
         new_ll = self.base_measure.log_p(new_param)
 
+        # The log likelihood under the current parameters is cached on the cells.
         for cell in partition.cells:
-            atom_params = cell.value
-
-            for j in cell.items:
-                old_ll += self.cluster_density.log_p(data[j], atom_params)
+            old_ll += cell.get_log_likelihood(data, self.cluster_density)
 
         self.cluster_density.params = new_param
 
+        new_cell_ll = []
+
         for cell in partition.cells:
-            atom_params = cell.value
+            new_cell_ll.append(log_p_sum(self.cluster_density, data, cell.items, cell.value))
 
-            for j in cell.items:
-                new_ll += self.cluster_density.log_p(data[j], atom_params)
+        new_ll += sum(new_cell_ll)
 
         forward_log_ratio = new_ll - self.proposal_func.log_p(new_param, old_param)
         reverse_log_ratio = old_ll - self.proposal_func.log_p(old_param, new_param)
 
         log_ratio = forward_log_ratio - reverse_log_ratio
 
-        u = uniform_rvs(0, 1)
+        u = uniform_rvs(0, 1, rng=self.rng)
 
         if log_ratio >= log(u):
             self.cluster_density.params = new_param
+
+            for cell, cell_ll in zip(partition.cells, new_cell_ll):
+                cell.set_log_likelihood(data, self.cluster_density, cell.value, cell_ll)
         else:
             self.cluster_density.params = old_param
@@ -17,11 +17,21 @@ Created on 2012-09-21
 from __future__ import division
 
 from math import exp, log, lgamma as log_gamma
-from random import sample, shuffle
 
-from pydp.rvs import discrete_rvs, uniform_rvs
+import multiprocessing
+
+from pydp.data import get_columns
+from pydp.densities import log_p_many
+from pydp.proposal_functions import BaseMeasureProposalFunction
+from pydp.rvs import RandomStream, bernoulli_rvs, get_rng, log_discrete_rvs, uniform_rvs
 from pydp.utils import log_space_normalise
 
+try:
+    import numpy as np
+
+except ImportError:
+    np = None
+
 
 class PartitionSampler(object):
     '''
@@ -32,13 +42,26 @@ class PartitionSampler(object):
         base_measure : (BaseMeasure) Base measure for DP process.
 
         cluster_density : (ClusterDensity) Cluster density for DP process.
+
+    Kwargs:
+        vectorise : (bool) Whether to score cells for an item with a single call to Density.log_p_many and draw the new
+                           cell using NumPy. This is faster when there are many cells and the density is vectorised.
+
+        rng : (RandomStream) Stream of random numbers. If None the default stream is used.
     '''
 
-    def __init__(self, base_measure, cluster_density):
+    def __init__(self, base_measure, cluster_density, vectorise=False, rng=None):
+        if vectorise and np is None:
+            raise ImportError('NumPy is required for vectorised partition sampling.')
+
         self.base_measure = base_measure
 
         self.cluster_density = cluster_density
 
+        self.vectorise = vectorise
+
+        self.rng = rng
+
     def sample(self, data, old_partition, alpha, **kwargs):
         '''
             data : (list) List of data points appropriate for cluster_density.
@@ -49,6 +72,38 @@ class PartitionSampler(object):
         '''
         pass
 
+    def _compute_log_p(self, density, data_point, params, counts):
+        '''
+        Compute log(counts[i]) + log(density(data_point | params[i])) for each cell i.
+        '''
+        cluster_log_p = log_p_many(density, data_point, params, vectorise=self.vectorise)
+
+        if self.vectorise:
+            return np.log(counts) + cluster_log_p
+
+        return [log(n) + x for n, x in zip(counts, cluster_log_p)]
+
+    def _append_log_p(self, log_p, x):
+        if self.vectorise:
+            return np.append(log_p, x)
+
+        log_p.append(x)
+
+        return log_p
+
+    def _sample_index(self, log_p):
+        '''
+        Sample an index with probability proportional to exp(log_p).
+        '''
+        if self.vectorise:
+            p = np.exp(log_p - log_p.max())
+
+            cdf = np.cumsum(p)
+
+            return int(np.searchsorted(cdf, uniform_rvs(0, 1, rng=self.rng) * cdf[-1], side='right'))
+
+        return log_discrete_rvs(log_p, rng=self.rng)
+
 #=======================================================================================================================
 # Non-conjugate samplers
 #=======================================================================================================================
@@ -62,7 +117,7 @@ class AuxillaryParameterPartitionSampler(PartitionSampler):
         '''
         items = range(len(data))
 
-        shuffle(items)
+        get_rng(self.rng).shuffle(items)
 
         for item in items:
             data_point = data[item]
@@ -71,37 +126,219 @@ class AuxillaryParameterPartitionSampler(PartitionSampler):
 
             partition.remove_item(item, old_cell_index)
 
-            if partition.counts[old_cell_index] == 0:
+            if partition.cells[old_cell_index].empty:
                 num_new_tables = m - 1
             else:
                 num_new_tables = m
 
             for _ in range(num_new_tables):
-                partition.add_cell(self.base_measure.random())
+                partition.add_cell(self.base_measure.random(rng=self.rng))
 
-            log_p = []
-
-            for cell in partition.cells:
-                cluster_log_p = self.cluster_density.log_p(data_point, cell.value)
+            params = []
 
-                counts = cell.size
+            counts = []
 
-                if counts == 0:
-                    counts = alpha / m
+            for cell in partition.cells:
+                params.append(cell.value)
 
-                log_p.append(log(counts) + cluster_log_p)
+                if cell.empty:
+                    counts.append(alpha / m)
 
-            log_p = log_space_normalise(log_p)
+                else:
+                    counts.append(cell.size)
 
-            p = [exp(x) for x in log_p]
+            log_p = self._compute_log_p(self.cluster_density, data_point, params, counts)
 
-            new_cell_index = discrete_rvs(p)
+            new_cell_index = self._sample_index(log_p)
 
             partition.add_item(item, new_cell_index)
 
             partition.remove_empty_cells()
 
 
+class ShardedAuxillaryParameterPartitionSampler(PartitionSampler):
+    '''
+    Approximate data parallel version of AuxillaryParameterPartitionSampler.
+
+    Items are split randomly into shards. Each shard runs a local sweep of algorithm 8 of Neal against a snapshot of the
+    cell values and counts taken at the start of the sweep, only updating counts for moves made by its own items. New
+    cells opened by a shard are added as new cells of the partition when the shards are merged, so cells opened by
+    different shards are never combined in the same sweep. Because each shard sees stale counts for the other shards
+    this does not leave the posterior exactly invariant. See pydp/tests/compare_sharded_sampler.py for a comparison with
+    the serial sampler.
+
+    Args:
+        base_measure : (BaseMeasure) Base measure for DP process.
+
+        cluster_density : (ClusterDensity) Cluster density for DP process.
+
+    Kwargs:
+        num_shards : (int) Number of shards to split the items into.
+
+        num_processes : (int) Number of worker processes used to sweep the shards. If 1 the shards are swept in the
+                              current process.
+
+        vectorise : (bool) See PartitionSampler.
+
+        rng : (RandomStream) See PartitionSampler.
+    '''
+
+    def __init__(self, base_measure, cluster_density, num_shards=2, num_processes=1, vectorise=False, rng=None):
+        PartitionSampler.__init__(self, base_measure, cluster_density, vectorise=vectorise, rng=rng)
+
+        self.num_shards = num_shards
+
+        self.num_processes = num_processes
+
+        self._pool = None
+
+    def close(self):
+        '''
+        Shut down the worker processes.
+        '''
+        if self._pool is not None:
+            self._pool.close()
+
+            self._pool.join()
+
+            self._pool = None
+
+    def sample(self, data, partition, alpha, m=2):
+        items = range(len(data))
+
+        get_rng(self.rng).shuffle(items)
+
+        shards = [items[i::self.num_shards] for i in range(self.num_shards)]
+
+        values = partition.cell_values
+
+        counts = partition.counts
+
+        labels = partition.labels
+
+        args = []
+
+        for shard in shards:
+            shard_labels = [labels[item] for item in shard]
+
+            if self.num_processes == 1:
+                args.append((self, shard, data, shard_labels, values, counts, alpha, m, None))
+
+            else:
+                # Only send the data points in the shard to the workers.
+                shard_data = dict((k, data[k]) for k in shard)
+
+                seed = get_rng(self.rng).randint(0, 2 ** 31 - 1)
+
+                args.append((self, shard, shard_data, shard_labels, values, counts, alpha, m, seed))
+
+        if self.num_processes == 1:
+            results = [_sample_shard(x) for x in args]
+
+        else:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.num_processes)
+
+            results = self._pool.map(_sample_shard, args)
+
+        num_cells = len(values)
+
+        for shard, (new_labels, new_values) in zip(shards, results):
+            offset = partition.number_of_cells - num_cells
+
+            for value in new_values:
+                partition.add_cell(value)
+
+            for item, old_label, new_label in zip(shard, [labels[x] for x in shard], new_labels):
+                if new_label >= num_cells:
+                    new_label += offset
+
+                if new_label != old_label:
+                    partition.remove_item(item, old_label)
+
+                    partition.add_item(item, new_label)
+
+        partition.remove_empty_cells()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        state['_pool'] = None
+
+        return state
+
+
+def _sample_shard(args):
+    '''
+    Sweep the items of a shard for ShardedAuxillaryParameterPartitionSampler.
+
+    Returns the new label of each item, where labels past the end of the snapshot refer to new cells, and the values of
+    the new cells.
+    '''
+    sampler, shard, data, labels, values, counts, alpha, m, seed = args
+
+    if seed is not None:
+        sampler.rng = RandomStream(seed)
+
+    labels = list(labels)
+
+    values = list(values)
+
+    counts = list(counts)
+
+    num_cells = len(values)
+
+    for index in range(len(shard)):
+        data_point = data[shard[index]]
+
+        old_label = labels[index]
+
+        counts[old_label] -= 1
+
+        # Only cells which are currently occupied can be chosen, plus m auxiliary cells. If the item was alone in its
+        # cell the cell value is reused as one of the auxiliary cells as in algorithm 8.
+        active = [i for i, n in enumerate(counts) if n > 0]
+
+        aux_values = [sampler.base_measure.random(rng=sampler.rng) for _ in range(m)]
+
+        if counts[old_label] == 0:
+            aux_values[0] = values[old_label]
+
+        params = [values[i] for i in active] + aux_values
+
+        cell_counts = [counts[i] for i in active] + [alpha / m] * m
+
+        log_p = sampler._compute_log_p(sampler.cluster_density, data_point, params, cell_counts)
+
+        choice = sampler._sample_index(log_p)
+
+        if choice < len(active):
+            new_label = active[choice]
+
+        elif counts[old_label] == 0 and choice == len(active):
+            new_label = old_label
+
+        else:
+            new_label = len(values)
+
+            values.append(params[choice])
+
+            counts.append(0)
+
+        counts[new_label] += 1
+
+        labels[index] = new_label
+
+    # Drop new cells which were opened then emptied again during the sweep.
+    new_cells = [i for i in range(num_cells, len(values)) if counts[i] > 0]
+
+    relabel = dict((old, num_cells + new) for new, old in enumerate(new_cells))
+
+    labels = [relabel.get(x, x) for x in labels]
+
+    return labels, [values[i] for i in new_cells]
+
+
 class MetropolisGibbsPartitionSampler(PartitionSampler):
     '''
     Sample a new partition according to algorithm 7 of Neal "Sampling Methods For Dirichlet Process Mixture Models"
@@ -111,15 +348,20 @@ class MetropolisGibbsPartitionSampler(PartitionSampler):
         n = partition.number_of_items
 
         for item, data_point in enumerate(data):
-            old_cluster_label = partition.labels[item]
-            old_value = partition.item_values[item]
+            old_cluster_label = partition.get_cell_index(item)
+            old_value = partition.cells[old_cluster_label].value
 
             partition.remove_item(item, old_cluster_label)
 
-            if partition.counts[old_cluster_label] == 0:
-                p = [x / (n - 1) for x in partition.counts]
+            if partition.cells[old_cluster_label].empty:
+                # Choosing the cell of another item uniformly at random picks each cell with probability proportional
+                # to its size.
+                other_item = get_rng(self.rng).randrange(n - 1)
 
-                new_cluster_label = discrete_rvs(p)
+                if other_item >= item:
+                    other_item += 1
+
+                new_cluster_label = partition.get_cell_index(other_item)
 
                 new_value = partition.cell_values[new_cluster_label]
 
@@ -128,7 +370,7 @@ class MetropolisGibbsPartitionSampler(PartitionSampler):
 
                 log_ratio = log(n - 1) - log(alpha) + new_ll - old_ll
 
-                u = uniform_rvs(0, 1)
+                u = uniform_rvs(0, 1, rng=self.rng)
 
                 if log_ratio >= log(u):
                     partition.add_item(item, new_cluster_label)
@@ -136,14 +378,14 @@ class MetropolisGibbsPartitionSampler(PartitionSampler):
                     partition.add_item(item, old_cluster_label)
 
             else:
-                new_value = self.base_measure.random()
+                new_value = self.base_measure.random(rng=self.rng)
 
                 old_ll = self.cluster_density.log_p(data_point, old_value)
                 new_ll = self.cluster_density.log_p(data_point, new_value)
 
                 log_ratio = log(alpha) - log(n - 1) + new_ll - old_ll
 
-                u = uniform_rvs(0, 1)
+                u = uniform_rvs(0, 1, rng=self.rng)
 
                 if log_ratio >= log(u):
                     partition.add_cell(new_value)
@@ -157,27 +399,16 @@ class MetropolisGibbsPartitionSampler(PartitionSampler):
         partition.remove_empty_cells()
 
         for item, data_point in enumerate(data):
-            old_cluster_label = partition.labels[item]
+            old_cluster_label = partition.get_cell_index(item)
 
             if partition.cells[old_cluster_label].size == 1:
                 continue
 
             partition.remove_item(item, old_cluster_label)
 
-            log_p = []
-
-            for cell in partition.cells:
-                cluster_log_p = self.cluster_density.log_p(data_point, cell.value)
-
-                counts = cell.size
+            log_p = self._compute_log_p(self.cluster_density, data_point, partition.cell_values, partition.counts)
 
-                log_p.append(log(counts) + cluster_log_p)
-
-            log_p = log_space_normalise(log_p)
-
-            p = [exp(x) for x in log_p]
-
-            new_cluster_label = discrete_rvs(p)
+            new_cluster_label = self._sample_index(log_p)
 
             partition.add_item(item, new_cluster_label)
 
@@ -185,215 +416,366 @@ class MetropolisGibbsPartitionSampler(PartitionSampler):
 
 
 class SequentiallyAllocatedMergeSplitSampler(PartitionSampler):
+    '''
+    Split-merge sampler using sequential allocation of Dahl "An Improved Merge-Split Sampler for Conjugate Dirichlet
+    Process Mixture Models".
 
-    def __init__(self, base_measure, cluster_density, proposal_func=None):
-        PartitionSampler.__init__(self, base_measure, cluster_density)
+    Proposals are computed from the two affected cells only. The Ewens prior ratio is computed in closed form and the
+    likelihood of the old and new cells is accumulated from the terms computed during the restricted allocation scan.
+    The partition is only modified if the proposal is accepted.
+    '''
+
+    def __init__(self, base_measure, cluster_density, proposal_func=None, rng=None):
+        PartitionSampler.__init__(self, base_measure, cluster_density, rng=rng)
 
         if proposal_func is None:
-            self.proposal_func = base_measure
+            self.proposal_func = BaseMeasureProposalFunction(base_measure)
         else:
             self.proposal_func = proposal_func
 
-    def sample(self, data, old_partition, alpha):
-        items = range(len(data))
-
-        i, j = sample(items, 2)
+    def sample(self, data, partition, alpha):
+        i, j = self._sample_pair(len(data))
 
-        labels = old_partition.labels
+        cell_i = partition.cells[partition.get_cell_index(i)]
+        cell_j = partition.cells[partition.get_cell_index(j)]
 
-        c_i = labels[i]
+        if cell_i is cell_j:
+            log_ratio, move = self._propose_split(i, j, list(cell_i.items), cell_i.value, data, alpha)
 
-        c_j = labels[j]
+        else:
+            log_ratio, move = self._propose_merge(i,
+                                                  j,
+                                                  list(cell_i.items),
+                                                  cell_i.value,
+                                                  list(cell_j.items),
+                                                  cell_j.value,
+                                                  data,
+                                                  alpha)
 
-        new_partition = old_partition.copy()
+        u = uniform_rvs(0, 1, rng=self.rng)
 
-        if c_i == c_j:
-            c = c_i
+        if log_ratio >= log(u):
+            self._apply_move(partition, move)
 
-            old_cell = new_partition.cells[c]
+    def _apply_move(self, partition, move):
+        '''
+        Apply an accepted split or merge move returned by _propose_split or _propose_merge.
+        '''
+        if move[0] == 'split':
+            _, i, value, items = move
 
-            new_cell_i, new_cell_j, forward_log_q, reverse_log_q = self._split(i, j, old_cell, data, new_partition)
+            old_cell = partition.cells[partition.get_cell_index(i)]
 
-            forward_log_p = self._compute_partition_log_p(new_cell_i, data) + \
-                self._compute_partition_log_p(new_cell_j, data)
+            new_cell = partition.add_cell(value)
 
-            old_cell = old_partition.cells[c]
+            for k in items:
+                old_cell.remove_item(k)
 
-            reverse_log_p = self._compute_partition_log_p(old_cell, data)
+                new_cell.add_item(k)
 
         else:
-            cell_i = new_partition.cells[c_i]
-            cell_j = new_partition.cells[c_j]
-
-            new_cell, forward_log_q, reverse_log_q = self._merge(cell_i, cell_j, data, new_partition)
-
-            forward_log_p = self._compute_partition_log_p(new_cell, data)
-
-            old_cell_i = old_partition.cells[c_i]
-            old_cell_j = old_partition.cells[c_j]
+            _, i, j = move
 
-            reverse_log_p = self._compute_partition_log_p(old_cell_i, data) + \
-                self._compute_partition_log_p(old_cell_j, data)
+            cell_i = partition.cells[partition.get_cell_index(i)]
+            cell_j = partition.cells[partition.get_cell_index(j)]
 
-        forward_log_prior = self._compute_prior_log_p(alpha, new_partition)
-        reverse_log_prior = self._compute_prior_log_p(alpha, old_partition)
+            for k in list(cell_j.items):
+                cell_j.remove_item(k)
 
-        forward_log_ratio = forward_log_p + forward_log_prior - forward_log_q
-        reverse_log_ratio = reverse_log_p + reverse_log_prior - reverse_log_q
+                cell_i.add_item(k)
 
-        log_ratio = forward_log_ratio - reverse_log_ratio
-
-        u = uniform_rvs(0, 1)
-
-        if log_ratio >= log(u):
-            print "accepted"
-
-            old_partition.cells = new_partition.cells
-        else:
-            #             print "rejected"
-            #             print forward_log_p - reverse_log_p, forward_log_q - reverse_log_q
-            pass
+            partition.remove_empty_cells()
 
-    def _merge(self, old_cell_i, old_cell_j, data, partition):
-        s_i = old_cell_i.items
-        s_j = old_cell_j.items
+    def _propose_merge(self, i, j, items_i, param_i, items_j, param_j, data, alpha):
+        '''
+        Propose merging the cells containing i and j.
 
-        param_i = old_cell_i.value
-        param_j = old_cell_j.value
+        Returns:
+            log_ratio : (float) Log of the Metropolis-Hastings acceptance ratio.
 
+            move : (tuple) Description of the move for _apply_move.
+        '''
         param_new = param_i
 
         forward_log_q = self.proposal_func.log_p(param_new, param_i)
         reverse_log_q = self.proposal_func.log_p(param_i, param_new) + self.proposal_func.log_p(param_j, param_new)
 
-        new_cell = partition.add_cell(param_new)
+        items = [k for k in items_i + items_j if k != i and k != j]
 
-        for k in s_i:
-            old_cell_i.remove_item(k)
+        get_rng(self.rng).shuffle(items)
 
-            new_cell.add_item(k)
+        log_p_i = self._get_items_log_p(data, [i, j] + items, param_i)
+        log_p_j = self._get_items_log_p(data, [j] + items, param_j)
 
-        for k in s_j:
-            old_cell_j.remove_item(k)
+        # Likelihood of the anchors i and j.
+        forward_log_p = log_p_i[0] + log_p_i[1]
+        reverse_log_p = log_p_i[0] + log_p_j[0]
 
-            new_cell.add_item(k)
+        # Compute the probability of the sequential allocation which would recover the current cells from the merged
+        # cell.
+        items_j = set(items_j)
 
-        temp_s_i = set([s_i.pop(), ])
-        temp_s_j = set([s_j.pop(), ])
+        n_i = 1
+        n_j = 1
 
-        items = s_i + s_j
+        for k, ll_i, ll_j in zip(items, log_p_i[2:], log_p_j[1:]):
+            log_p = log_space_normalise([log(n_i) + ll_i, log(n_j) + ll_j])
 
-        shuffle(items)
+            forward_log_p += ll_i
 
-        for k in items:
-            n_i = len(temp_s_i)
-            n_j = len(temp_s_j)
+            if k in items_j:
+                n_j += 1
 
-            log_p = [
-                log(n_i) + self.cluster_density.log_p(data[k], param_i),
-                log(n_j) + self.cluster_density.log_p(data[k], param_j)
-            ]
+                reverse_log_p += ll_j
 
-            log_p = log_space_normalise(log_p)
+                reverse_log_q += log_p[1]
 
-            if k in s_i:
-                temp_s_i.add(k)
+            else:
+                n_i += 1
+
+                reverse_log_p += ll_i
 
                 reverse_log_q += log_p[0]
 
-            else:
-                temp_s_j.add(k)
+        # The merged cell keeps param_i so param_j is removed from the state.
+        log_prior_ratio = -self._compute_split_prior_log_ratio(alpha, n_i, n_j) - self.base_measure.log_p(param_j)
 
-                reverse_log_q += log_p[1]
+        log_ratio = (forward_log_p - forward_log_q) - (reverse_log_p - reverse_log_q) + log_prior_ratio
 
-        partition.remove_empty_cells()
+        return log_ratio, ('merge', i, j)
 
-        return new_cell, forward_log_q, reverse_log_q
+    def _propose_split(self, i, j, items, param, data, alpha):
+        '''
+        Propose splitting the cell containing i and j into two cells with i and j as anchors.
 
-    def _split(self, i, j, old_cell, data, partition):
-        old_cell.remove_item(i)
-        old_cell.remove_item(j)
+        Returns:
+            log_ratio : (float) Log of the Metropolis-Hastings acceptance ratio.
 
-        param_i = old_cell.value
-        param_j = self.proposal_func.random(param_i)
+            move : (tuple) Description of the move for _apply_move.
+        '''
+        param_i = param
+        param_j = self.proposal_func.random(param_i, rng=self.rng)
 
         forward_log_q = self.proposal_func.log_p(param_i, param_i) + self.proposal_func.log_p(param_j, param_i)
         reverse_log_q = self.proposal_func.log_p(param_i, param_i)
 
-        new_cell_i = partition.add_cell(param_i)
-        new_cell_j = partition.add_cell(param_j)
-
-        new_cell_i.add_item(i)
-        new_cell_j.add_item(j)
+        items = [k for k in items if k != i and k != j]
 
-        s = old_cell.items
-        shuffle(s)
+        get_rng(self.rng).shuffle(items)
 
-        for k in s:
-            old_cell.remove_item(k)
+        log_p_i = self._get_items_log_p(data, [i, j] + items, param_i)
+        log_p_j = self._get_items_log_p(data, [j] + items, param_j)
 
-            n_i = new_cell_i.size
-            n_j = new_cell_j.size
+        # Likelihood of the anchors i and j. The old cell has the same parameter as the new cell containing i.
+        forward_log_p = log_p_i[0] + log_p_j[0]
+        reverse_log_p = log_p_i[0] + log_p_i[1]
 
-            log_p = [
-                log(n_i) + self.cluster_density.log_p(data[k], param_i),
-                log(n_j) + self.cluster_density.log_p(data[k], param_j)
-            ]
+        new_items_j = [j, ]
 
-            log_p = log_space_normalise(log_p)
+        n_i = 1
+        n_j = 1
 
-            p = [exp(x) for x in log_p]
+        for k, ll_i, ll_j in zip(items, log_p_i[2:], log_p_j[1:]):
+            log_p = log_space_normalise([log(n_i) + ll_i, log(n_j) + ll_j])
 
-            c_k = discrete_rvs(p)
+            c_k = bernoulli_rvs(exp(log_p[1]), rng=self.rng)
 
             if c_k == 0:
-                new_cell_i.add_item(k)
+                n_i += 1
+
+                forward_log_p += ll_i
+
             else:
-                new_cell_j.add_item(k)
+                n_j += 1
+
+                forward_log_p += ll_j
+
+                new_items_j.append(k)
 
             forward_log_q += log_p[c_k]
 
-        partition.remove_empty_cells()
+            reverse_log_p += ll_i
 
-        return new_cell_i, new_cell_j, forward_log_q, reverse_log_q
+        # The new cell adds param_j to the state.
+        log_prior_ratio = self._compute_split_prior_log_ratio(alpha, n_i, n_j) + self.base_measure.log_p(param_j)
 
-    def _compute_partition_log_p(self, cell, data):
-        log_p = 0
+        log_ratio = (forward_log_p - forward_log_q) - (reverse_log_p - reverse_log_q) + log_prior_ratio
 
-        param = cell.value
+        return log_ratio, ('split', i, param_j, new_items_j)
 
-        for item in cell.items:
-            log_p += self.cluster_density.log_p(data[item], param)
+    def _compute_split_prior_log_ratio(self, alpha, n_i, n_j):
+        '''
+        Log ratio of the Ewens partition prior after and before splitting a cell of size n_i + n_j into cells of size
+        n_i and n_j. All other terms of the prior cancel.
+        '''
+        return log(alpha) + log_gamma(n_i) + log_gamma(n_j) - log_gamma(n_i + n_j)
 
-        return log_p
+    def _sample_pair(self, n):
+        '''
+        Sample two distinct items uniformly from range(n) without building the list of items.
+        '''
+        i = get_rng(self.rng).randrange(n)
+        j = get_rng(self.rng).randrange(n - 1)
 
-    def _compute_prior_log_p(self, alpha, partition):
-        log_p = partition.number_of_cells * log(alpha)
+        if j >= i:
+            j += 1
 
-        for n_c in partition.counts:
-            log_p += log_gamma(n_c)
+        return i, j
 
-        n = partition.number_of_items
+    def _get_items_log_p(self, data, items, param):
+        '''
+        Compute the log density of each item given a shared parameter.
+        '''
+        if getattr(self.cluster_density, 'vectorised', False) and np is not None:
+            return self.cluster_density.log_p_batch(get_columns(data, items), param).tolist()
 
-        for i in range(1, n + 1):
-            log_p -= log_gamma(alpha + i - 1)
+        return [self.cluster_density.log_p(data[k], param) for k in items]
 
-        return log_p
+
+class MultipleProposalMergeSplitSampler(SequentiallyAllocatedMergeSplitSampler):
+    '''
+    Split-merge sampler which makes several proposals per call on disjoint pairs of cells.
+
+    Pairs of items are drawn as in SequentiallyAllocatedMergeSplitSampler and a pair is skipped if either of its cells
+    is already involved in another proposal. Each proposal only depends on its own cells so the proposals can be
+    evaluated independently, optionally in a pool of worker processes, and all accepted moves applied together. Because
+    the skipped pairs depend on the current partition this is an approximation to making the proposals sequentially.
+    '''
+
+    def __init__(self, base_measure, cluster_density, proposal_func=None, num_proposals=10, num_processes=1,
+                 rng=None):
+        '''
+        Args:
+            base_measure : (BaseMeasure) Base measure for DP process.
+
+            cluster_density : (Density) Cluster density for DP process.
+
+        Kwargs:
+            proposal_func : (ProposalFunction) Proposal for the parameter of a new cell. Defaults to the base measure.
+
+            num_proposals : (int) Number of pairs of items to draw per call.
+
+            num_processes : (int) Number of worker processes used to evaluate proposals. If 1 proposals are evaluated in
+                                  the current process.
+
+            rng : (RandomStream) See PartitionSampler. Proposals evaluated in worker processes use a new stream seeded
+                                 from this one.
+        '''
+        SequentiallyAllocatedMergeSplitSampler.__init__(self, base_measure, cluster_density, proposal_func, rng=rng)
+
+        self.num_proposals = num_proposals
+
+        self.num_processes = num_processes
+
+        self._pool = None
+
+    def close(self):
+        '''
+        Shut down the worker processes.
+        '''
+        if self._pool is not None:
+            self._pool.close()
+
+            self._pool.join()
+
+            self._pool = None
+
+    def sample(self, data, partition, alpha):
+        tasks = []
+
+        used_cells = set()
+
+        for _ in range(self.num_proposals):
+            i, j = self._sample_pair(len(data))
+
+            cell_i = partition.cells[partition.get_cell_index(i)]
+            cell_j = partition.cells[partition.get_cell_index(j)]
+
+            if cell_i in used_cells or cell_j in used_cells:
+                continue
+
+            used_cells.add(cell_i)
+            used_cells.add(cell_j)
+
+            if cell_i is cell_j:
+                proposal = ('split', i, j, list(cell_i.items), cell_i.value)
+
+            else:
+                proposal = ('merge', i, j, list(cell_i.items), cell_i.value, list(cell_j.items), cell_j.value)
+
+            tasks.append(proposal)
+
+        if self.num_processes == 1:
+            moves = [_evaluate_merge_split_proposal((self, x, data, alpha, None)) for x in tasks]
+
+        else:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.num_processes)
+
+            args = []
+
+            for proposal in tasks:
+                # Only send the data points involved in the proposal to the workers.
+                items = proposal[3] if proposal[0] == 'split' else proposal[3] + proposal[5]
+
+                sub_data = dict((k, data[k]) for k in items)
+
+                args.append((self, proposal, sub_data, alpha, get_rng(self.rng).randint(0, 2 ** 31 - 1)))
+
+            moves = self._pool.map(_evaluate_merge_split_proposal, args)
+
+        for move in moves:
+            if move is not None:
+                self._apply_move(partition, move)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        state['_pool'] = None
+
+        return state
+
+
+def _evaluate_merge_split_proposal(args):
+    '''
+    Evaluate a single proposal for MultipleProposalMergeSplitSampler. Returns the move if accepted otherwise None.
+    '''
+    sampler, proposal, data, alpha, seed = args
+
+    if seed is not None:
+        sampler.rng = RandomStream(seed)
+
+    if proposal[0] == 'split':
+        log_ratio, move = sampler._propose_split(*proposal[1:], data=data, alpha=alpha)
+
+    else:
+        log_ratio, move = sampler._propose_merge(*proposal[1:], data=data, alpha=alpha)
+
+    u = uniform_rvs(0, 1, rng=sampler.rng)
+
+    if log_ratio >= log(u):
+        return move
 
 
 class SplitMergeAuxillaryHybridSampler(PartitionSampler):
 
-    def __init__(self, base_measure, cluster_density, proposal_func=None, ratio=0.1):
-        PartitionSampler.__init__(self, base_measure, cluster_density)
+    def __init__(self, base_measure, cluster_density, proposal_func=None, ratio=0.1, vectorise=False, rng=None):
+        PartitionSampler.__init__(self, base_measure, cluster_density, vectorise=vectorise, rng=rng)
 
         self.ratio = ratio
 
-        self.auxillary_sampler = AuxillaryParameterPartitionSampler(base_measure, cluster_density)
+        self.auxillary_sampler = AuxillaryParameterPartitionSampler(base_measure,
+                                                                    cluster_density,
+                                                                    vectorise=vectorise,
+                                                                    rng=rng)
 
-        self.split_merge_sampler = SequentiallyAllocatedMergeSplitSampler(base_measure, cluster_density, proposal_func)
+        self.split_merge_sampler = SequentiallyAllocatedMergeSplitSampler(base_measure,
+                                                                          cluster_density,
+                                                                          proposal_func,
+                                                                          rng=rng)
 
     def sample(self, data, partition, alpha):
-        u = uniform_rvs(0, 1)
+        u = uniform_rvs(0, 1, rng=self.rng)
 
         if u < self.ratio:
             self.auxillary_sampler.sample(data, partition, alpha)
@@ -410,7 +792,7 @@ class MarginalGibbsPartitionSampler(PartitionSampler):
     Update the partition using algorithm 2 of Neal "Sampling Methods For Dirichlet Process Mixture Models".
     '''
 
-    def __init__(self, base_measure, cluster_density, posterior_predictive_density):
+    def __init__(self, base_measure, cluster_density, posterior_predictive_density, vectorise=False, rng=None):
         '''
         Args:
             base_measure : (BaseMeasure) Base measure for DP process.
@@ -419,41 +801,103 @@ class MarginalGibbsPartitionSampler(PartitionSampler):
 
             posterior_predictive_density : (Density) Posterior density obtained by integrating the prior against the likelihood for
             the model.
+
+        Kwargs:
+            vectorise : (bool) Whether to use the vectorised scoring path. See PartitionSampler.
+
+            rng : (RandomStream) See PartitionSampler.
         '''
-        PartitionSampler.__init__(self, base_measure, cluster_density)
+        PartitionSampler.__init__(self, base_measure, cluster_density, vectorise=vectorise, rng=rng)
 
         self.posterior_density = posterior_predictive_density
 
     def sample(self, data, partition, alpha):
         for item, data_point in enumerate(data):
-            old_cell_index = partition.labels[item]
+            old_cell_index = partition.get_cell_index(item)
 
             partition.remove_item(item, old_cell_index)
 
             partition.remove_empty_cells()
 
-            log_p = []
+            log_p = self._compute_log_p(self.cluster_density, data_point, partition.cell_values, partition.counts)
 
-            for cell in partition.cells:
-                cluster_log_p = self.cluster_density.log_p(data_point, cell.value)
+            params = self.base_measure.params
 
-                counts = cell.size
+            cluster_log_p = self.posterior_density.log_p(data_point, params)
 
-                log_p.append(log(counts) + cluster_log_p)
+            log_p = self._append_log_p(log_p, log(alpha) + cluster_log_p)
 
-            params = self.base_measure.params
+            new_cell_index = self._sample_index(log_p)
 
-            cluster_log_p = self.posterior_density.log_p(data_point, params)
+            if new_cell_index == partition.number_of_cells:
+                partition.add_cell(self.base_measure.random(rng=self.rng))
+
+            partition.add_item(item, new_cell_index)
+
+
+class CollapsedGibbsPartitionSampler(PartitionSampler):
+    '''
+    Update the partition using algorithm 3 of Neal "Sampling Methods For Dirichlet Process Mixture Models".
+
+    The cell values are integrated out so each existing cell is scored by the posterior predictive density given the
+    other items in the cell. The posterior parameters are computed from sufficient statistics attached to the cells. The
+    values of new cells are drawn from the base measure so an atom sampler should be run afterwards if they are needed.
+    '''
+
+    def __init__(self, base_measure, cluster_density, posterior_predictive_density, sufficient_statistics,
+                 vectorise=False, rng=None):
+        '''
+        Args:
+            base_measure : (BaseMeasure) Base measure for DP process.
+
+            cluster_density : (Density) Cluster density for DP process.
+
+            posterior_predictive_density : (Density) Posterior density obtained by integrating the prior against the
+            likelihood for the model.
+
+            sufficient_statistics : (class) Subclass of SufficientStatistics conjugate to the base measure.
+
+        Kwargs:
+            vectorise : (bool) Whether to use the vectorised scoring path. See PartitionSampler.
+
+            rng : (RandomStream) See PartitionSampler.
+        '''
+        PartitionSampler.__init__(self, base_measure, cluster_density, vectorise=vectorise, rng=rng)
+
+        self.posterior_density = posterior_predictive_density
+
+        self.sufficient_statistics = sufficient_statistics
+
+    def sample(self, data, partition, alpha):
+        prior_params = self.base_measure.params
+
+        for item, data_point in enumerate(data):
+            old_cell_index = partition.get_cell_index(item)
+
+            partition.remove_item(item, old_cell_index)
+
+            partition.remove_empty_cells()
+
+            params = []
+
+            counts = []
+
+            for cell in partition.cells:
+                statistics = cell.get_sufficient_statistics(self.sufficient_statistics, data)
+
+                params.append(statistics.get_posterior_params(prior_params))
+
+                counts.append(statistics.size)
 
-            log_p.append(log(alpha) + cluster_log_p)
+            params.append(prior_params)
 
-            log_p = log_space_normalise(log_p)
+            counts.append(alpha)
 
-            p = [exp(x) for x in log_p]
+            log_p = self._compute_log_p(self.posterior_density, data_point, params, counts)
 
-            new_cell_index = discrete_rvs(p)
+            new_cell_index = self._sample_index(log_p)
 
             if new_cell_index == partition.number_of_cells:
-                partition.add_cell(self.base_measure.random())
+                partition.add_cell(self.base_measure.random(rng=self.rng))
 
             partition.add_item(item, new_cell_index)
@@ -0,0 +1,173 @@
+'''
+This file is part of PyDP.
+
+PyDP is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+PyDP is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with PyDP.  If not, see
+<http://www.gnu.org/licenses/>.
+
+Created on 2026-10-17
+'''
+from __future__ import division
+
+from pydp.data import BetaParameter, GammaParameter, GaussianGammaParameter
+
+
+class SufficientStatistics(object):
+    '''
+    Base class for sufficient statistics of the data points in a partition cell.
+
+    Instances are attached to cells with PartitionCell.get_sufficient_statistics and updated in O(1) as items are added
+    to and removed from the cell.
+    '''
+
+    def __init__(self, data):
+        '''
+        Args:
+            data : (list) List of data points indexed by item.
+        '''
+        self.data = data
+
+        self.size = 0
+
+    def add_item(self, item):
+        raise NotImplemented
+
+    def remove_item(self, item):
+        raise NotImplemented
+
+    def get_posterior_params(self, params):
+        '''
+        Return the parameters of the posterior obtained by updating the conjugate prior with parameters params.
+        '''
+        raise NotImplemented
+
+
+class BinomialSufficientStatistics(SufficientStatistics):
+    '''
+    Total successes and trials for binomial data. Conjugate to a Beta prior.
+    '''
+
+    def __init__(self, data):
+        SufficientStatistics.__init__(self, data)
+
+        self.x = 0
+
+        self.n = 0
+
+    def add_item(self, item):
+        data_point = self.data[item]
+
+        self.x += data_point.x
+
+        self.n += data_point.n
+
+        self.size += 1
+
+    def remove_item(self, item):
+        data_point = self.data[item]
+
+        self.x -= data_point.x
+
+        self.n -= data_point.n
+
+        self.size -= 1
+
+    def get_posterior_params(self, params):
+        return BetaParameter(params.a + self.x, params.b + self.n - self.x)
+
+
+class PoissonSufficientStatistics(SufficientStatistics):
+    '''
+    Total count for Poisson data. Conjugate to a Gamma prior.
+    '''
+
+    def __init__(self, data):
+        SufficientStatistics.__init__(self, data)
+
+        self.x = 0
+
+    def add_item(self, item):
+        self.x += self.data[item].x
+
+        self.size += 1
+
+    def remove_item(self, item):
+        self.x -= self.data[item].x
+
+        self.size -= 1
+
+    def get_posterior_params(self, params):
+        return GammaParameter(params.a + self.x, params.b + self.size)
+
+
+class GaussianSufficientStatistics(SufficientStatistics):
+    '''
+    Mean and sum of squared deviations for Gaussian data, updated with Welford's method. Conjugate to a Gaussian-Gamma
+    prior.
+    '''
+
+    def __init__(self, data):
+        SufficientStatistics.__init__(self, data)
+
+        self.mean = 0
+
+        self.sum_of_squares = 0
+
+    @property
+    def variance(self):
+        '''
+        Population variance of the data points.
+        '''
+        if self.size == 0:
+            return 0
+
+        return self.sum_of_squares / self.size
+
+    def add_item(self, item):
+        x = self.data[item].x
+
+        self.size += 1
+
+        delta = x - self.mean
+
+        self.mean += delta / self.size
+
+        self.sum_of_squares += delta * (x - self.mean)
+
+    def remove_item(self, item):
+        x = self.data[item].x
+
+        self.size -= 1
+
+        if self.size == 0:
+            self.mean = 0
+
+            self.sum_of_squares = 0
+
+            return
+
+        old_mean = self.mean
+
+        self.mean = old_mean + (old_mean - x) / self.size
+
+        self.sum_of_squares -= (x - old_mean) * (x - self.mean)
+
+        if self.sum_of_squares < 0:
+            self.sum_of_squares = 0
+
+    def get_posterior_params(self, params):
+        size = params.size + self.size
+
+        mean = (params.size * params.mean + self.size * self.mean) / size
+
+        alpha = params.alpha + self.size / 2
+
+        beta = params.beta + self.sum_of_squares / 2 + \
+            (params.size * self.size * (self.mean - params.mean) ** 2) / (2 * size)
+
+        return GaussianGammaParameter(mean, size, alpha, beta)
@@ -0,0 +1,124 @@
+'''
+Compare ShardedAuxillaryParameterPartitionSampler to the serial AuxillaryParameterPartitionSampler on data simulated
+from a CRP.
+
+For each sampler the posterior mean number of clusters and the posterior co-clustering probabilities are estimated after
+burn in. The deviation of the sharded sampler is reported as the mean and maximum absolute difference of the
+co-clustering probabilities from the serial sampler. A second serial run gives the Monte Carlo error for reference.
+'''
+from __future__ import division
+
+import random
+import sys
+
+from pydp.base_measures import BetaBaseMeasure
+from pydp.data import BinomialData
+from pydp.densities import BinomialDensity
+from pydp.rvs import binomial_rvs
+from pydp.samplers.atom import BetaBinomialGibbsAtomSampler
+from pydp.samplers.dp import DirichletProcessSampler
+from pydp.samplers.partition import AuxillaryParameterPartitionSampler, ShardedAuxillaryParameterPartitionSampler
+from pydp.tests.simulators import sample_from_crp
+
+
+def simulate_data(size, depth=100, alpha=1.0):
+    partition = sample_from_crp(alpha, size, BetaBaseMeasure(1, 1))
+
+    data = []
+
+    for p in partition.item_values:
+        data.append(BinomialData(binomial_rvs(depth, p.x), depth))
+
+    return data, partition
+
+
+def run_sampler(partition_sampler, data, num_iters, burnin):
+    base_measure = partition_sampler.base_measure
+
+    atom_sampler = BetaBinomialGibbsAtomSampler(base_measure, partition_sampler.cluster_density)
+
+    sampler = DirichletProcessSampler(atom_sampler, partition_sampler, alpha=1.0)
+
+    sampler.initialise_partition(data, 'connected')
+
+    n = len(data)
+
+    co_clustering = [[0] * n for _ in range(n)]
+
+    num_cells = 0
+
+    for i in range(num_iters):
+        sampler.interactive_sample(data)
+
+        if i < burnin:
+            continue
+
+        labels = sampler.partition.labels
+
+        num_cells += sampler.partition.number_of_cells
+
+        for a in range(n):
+            row = co_clustering[a]
+
+            for b in range(a + 1, n):
+                if labels[a] == labels[b]:
+                    row[b] += 1
+
+    num_samples = num_iters - burnin
+
+    co_clustering = [[x / num_samples for x in row] for row in co_clustering]
+
+    return num_cells / num_samples, co_clustering
+
+
+def main(size=200, num_iters=1000, burnin=200, num_shards=4, num_processes=1, seed=0):
+    random.seed(seed)
+
+    data, true_partition = simulate_data(size)
+
+    base_measure = BetaBaseMeasure(1, 1)
+
+    density = BinomialDensity()
+
+    serial = AuxillaryParameterPartitionSampler(base_measure, density)
+
+    sharded = ShardedAuxillaryParameterPartitionSampler(base_measure,
+                                                        density,
+                                                        num_shards=num_shards,
+                                                        num_processes=num_processes)
+
+    serial_cells, serial_cc = run_sampler(serial, data, num_iters, burnin)
+
+    _, reference_cc = run_sampler(serial, data, num_iters, burnin)
+
+    sharded_cells, sharded_cc = run_sampler(sharded, data, num_iters, burnin)
+
+    sharded.close()
+
+    diff = _get_differences(serial_cc, sharded_cc)
+
+    reference_diff = _get_differences(serial_cc, reference_cc)
+
+    print 'True number of clusters: {0}'.format(true_partition.number_of_cells)
+
+    print 'Mean number of clusters, serial: {0:.2f} sharded: {1:.2f}'.format(serial_cells, sharded_cells)
+
+    print 'Co-clustering absolute difference, mean: {0:.4f} max: {1:.4f}'.format(sum(diff) / len(diff), max(diff))
+
+    print 'Co-clustering absolute difference between serial runs, mean: {0:.4f} max: {1:.4f}'.format(
+        sum(reference_diff) / len(reference_diff), max(reference_diff))
+
+
+def _get_differences(x, y):
+    n = len(x)
+
+    return [abs(x[a][b] - y[a][b]) for a in range(n) for b in range(a + 1, n)]
+
+
+if __name__ == '__main__':
+    kwargs = {}
+
+    for arg, name in zip(sys.argv[1:], ['size', 'num_iters', 'burnin', 'num_shards', 'num_processes']):
+        kwargs[name] = int(arg)
+
+    main(**kwargs)
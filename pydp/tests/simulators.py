@@ -17,32 +17,26 @@ Created on 2012-09-18
 from __future__ import division
 
 from pydp.partition import Partition
-from pydp.rvs import discrete_rvs
+from pydp.rvs import get_rng, uniform_rvs
 
 
-def sample_from_crp(alpha, size, base_measure):
+def sample_from_crp(alpha, size, base_measure, rng=None):
     labels = []
     values = []
 
-    tables = []
-
     # Seat the first customer
-    tables.append([0, ])
-
     labels.append(0)
-    values.append(base_measure.random())
+    values.append(base_measure.random(rng=rng))
 
     for customer in range(1, size):
-        p = _get_table_probabilities(tables, alpha)
-
-        table_id = discrete_rvs(p)
+        # A new table is opened with probability alpha / (alpha + customer), otherwise the customer sits with a
+        # previous customer chosen uniformly at random which picks each table with probability proportional to its size.
+        if uniform_rvs(0, alpha + customer, rng=rng) < alpha:
+            table_id = len(values)
 
-        if table_id == len(tables):
-            tables.append([customer, ])
-
-            values.append(base_measure.random())
+            values.append(base_measure.random(rng=rng))
         else:
-            tables[table_id].append(customer)
+            table_id = labels[get_rng(rng).randrange(customer)]
 
         labels.append(table_id)
 
@@ -55,16 +49,3 @@ def sample_from_crp(alpha, size, base_measure):
         partition.add_item(item, cell_index)
 
     return partition
-
-
-def _get_table_probabilities(tables, alpha):
-    p = []
-
-    for table in tables:
-        p.append(len(table))
-
-    p.append(alpha)
-
-    p = [x / sum(p) for x in p]
-
-    return p
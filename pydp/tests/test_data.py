@@ -0,0 +1,78 @@
+'''
+Tests for the columnar Dataset container.
+
+Created on 2026-10-17
+
+@author: Andrew Roth
+'''
+import unittest
+
+import numpy as np
+
+from pydp.data import BetaData, BinomialData, Dataset, as_columns, get_columns, to_columns
+from pydp.densities import BinomialDensity
+
+
+class DatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [BinomialData(x, 10 + x) for x in range(7)]
+
+        self.dataset = Dataset.from_records(self.records)
+
+    def test_records(self):
+        self.assertEqual(len(self.dataset), len(self.records))
+
+        self.assertEqual(list(self.dataset), self.records)
+
+        for i, x in enumerate(self.records):
+            self.assertEqual(self.dataset[i], x)
+
+            self.assertEqual(type(self.dataset[i].x), int)
+
+    def test_columns(self):
+        dataset = Dataset(BinomialData, {'n': [10, 20], 'x': [1, 2]})
+
+        np.testing.assert_array_equal(dataset.columns.x, [1, 2])
+
+        np.testing.assert_array_equal(dataset.columns.n, [10, 20])
+
+        self.assertRaises(ValueError, Dataset, BinomialData, [[1, 2]])
+
+        self.assertRaises(ValueError, Dataset, BinomialData, [[1, 2], [10]])
+
+    def test_take(self):
+        items = [5, 0, 3]
+
+        columns = self.dataset.take(items)
+
+        np.testing.assert_array_equal(columns.x, [self.records[i].x for i in items])
+
+        for data in (self.records, self.dataset):
+            np.testing.assert_array_equal(get_columns(data, items).n, [self.records[i].n for i in items])
+
+            np.testing.assert_array_equal(get_columns(data, set(items)).n, get_columns(self.records, set(items)).n)
+
+    def test_as_columns(self):
+        columns = to_columns(self.records)
+
+        self.assertTrue(as_columns(columns) is columns)
+
+        self.assertTrue(as_columns(self.dataset) is self.dataset.columns)
+
+        np.testing.assert_array_equal(as_columns(self.records).x, columns.x)
+
+    def test_density(self):
+        density = BinomialDensity()
+
+        param = BetaData(0.3)
+
+        expected = [density.log_p(x, param) for x in self.records]
+
+        np.testing.assert_allclose(density.log_p_batch(self.dataset, param), expected)
+
+        self.assertAlmostEqual(density.log_p_sum(self.dataset, [1, 4], param), expected[1] + expected[4])
+
+
+if __name__ == '__main__':
+    unittest.main()
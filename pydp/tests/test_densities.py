@@ -0,0 +1,172 @@
+'''
+Tests for the scalar and vectorised density evaluation paths.
+
+Created on 2026-10-17
+
+@author: Andrew Roth
+'''
+import unittest
+
+import numpy as np
+
+from pydp.data import BetaData, BetaParameter, BinomialData, GammaData, GammaParameter, GaussianData, \
+    GaussianGammaData, GaussianGammaParameter, NegativeBinomialParameter, PoissonData, to_columns
+from pydp.densities import BetaBinomialDensity, BetaDensity, BinomialDensity, GammaDensity, GaussianDensity, \
+    NegativeBinomialDensity, PoissonDensity, StudentTDensity, log_p_many, log_p_sum
+from pydp.utils import NullCache
+
+# Density, data points and parameters to evaluate each vectorised density at.
+CASES = [
+    (BetaDensity,
+     [BetaData(x) for x in (0.0, 0.01, 0.3, 0.99, 1.0)],
+     [BetaParameter(1, 1), BetaParameter(0.5, 2), BetaParameter(5, 3)]),
+    (BetaBinomialDensity,
+     [BinomialData(0, 10), BinomialData(3, 10), BinomialData(10, 10), BinomialData(40, 100)],
+     [BetaParameter(1, 1), BetaParameter(0.5, 2), BetaParameter(50, 30)]),
+    (BinomialDensity,
+     [BinomialData(0, 10), BinomialData(3, 10), BinomialData(10, 10), BinomialData(40, 100)],
+     [BetaData(0.0), BetaData(0.2), BetaData(0.9), BetaData(1.0)]),
+    (GammaDensity,
+     [GammaData(x) for x in (0.01, 1.0, 7.5)],
+     [GammaParameter(1, 1), GammaParameter(0.5, 2), GammaParameter(10, 0.1)]),
+    (GaussianDensity,
+     [GaussianData(x) for x in (-3.0, 0.0, 12.5)],
+     [GaussianGammaData(0, 1), GaussianGammaData(2, 0.1), GaussianGammaData(-5, 10)]),
+    (NegativeBinomialDensity,
+     [PoissonData(x) for x in (0, 3, 50)],
+     [NegativeBinomialParameter(1, 0.5), NegativeBinomialParameter(7.5, 0.1)]),
+    (NegativeBinomialDensity,
+     [PoissonData(x) for x in (0, 3, 50)],
+     [GammaParameter(2, 0.5), GammaParameter(10, 3)]),
+    (PoissonDensity,
+     [PoissonData(x) for x in (0, 3, 50)],
+     [BetaData(0.5), BetaData(3), BetaData(40)]),
+    (StudentTDensity,
+     [GaussianData(x) for x in (-3.0, 0.0, 12.5)],
+     [GaussianGammaParameter(0, 1, 1, 1), GaussianGammaParameter(2, 10, 3, 0.5)]),
+]
+
+
+class VectorisedDensityTest(unittest.TestCase):
+
+    def test_log_p_array_matches_log_p(self):
+        for density_cls, data, params in CASES:
+            density = density_cls()
+
+            self.assertTrue(density.vectorised)
+
+            for data_point in data:
+                for param in params:
+                    expected = density._log_p(data_point, param)
+
+                    actual = density._log_p_array(data_point, param)
+
+                    self.assert_log_p_equal(actual, expected, density_cls)
+
+    def test_log_p_many(self):
+        for density_cls, data, params in CASES:
+            density = density_cls()
+
+            for data_point in data:
+                expected = [density.log_p(data_point, x) for x in params]
+
+                scalar = density.log_p_many(data_point, params)
+
+                self.assertTrue(isinstance(scalar, list))
+
+                vectorised = density.log_p_many(data_point, params, vectorise=True)
+
+                self.assertTrue(isinstance(vectorised, np.ndarray))
+
+                for x, y in zip(vectorised, expected):
+                    self.assert_log_p_equal(x, y, density_cls)
+
+                self.assertEqual(len(density.log_p_many(data_point, [], vectorise=True)), 0)
+
+    def test_log_p_many_scalar_path_uses_cache(self):
+        density = BinomialDensity()
+
+        params = [BetaData(0.2), BetaData(0.5)]
+
+        density.log_p_many(BinomialData(3, 10), params)
+
+        density.log_p_many(BinomialData(3, 10), params)
+
+        self.assertEqual((density.cache.hits, density.cache.misses), (2, 2))
+
+        density.log_p_many(BinomialData(3, 10), params, vectorise=True)
+
+        self.assertEqual((density.cache.hits, density.cache.misses), (2, 2))
+
+    def test_log_p_batch(self):
+        for density_cls, data, params in CASES:
+            density = density_cls(cache=NullCache())
+
+            param = params[-1]
+
+            expected = [density._log_p(x, param) for x in data]
+
+            for batch in (data, to_columns(data)):
+                for x, y in zip(density.log_p_batch(batch, param), expected):
+                    self.assert_log_p_equal(x, y, density_cls)
+
+    def test_log_p_batch_per_item_params(self):
+        density = BinomialDensity()
+
+        data = [BinomialData(3, 10), BinomialData(5, 20)]
+
+        params = [BetaData(0.1), BetaData(0.7)]
+
+        expected = [density._log_p(x, y) for x, y in zip(data, params)]
+
+        np.testing.assert_allclose(density.log_p_batch(data, to_columns(params)), expected)
+
+    def test_log_p_sum(self):
+        density = BinomialDensity()
+
+        data = [BinomialData(x, 10) for x in range(6)]
+
+        items = [0, 2, 5]
+
+        expected = sum(density._log_p(data[x], BetaData(0.3)) for x in items)
+
+        self.assertAlmostEqual(density.log_p_sum(data, items, BetaData(0.3)), expected)
+
+        self.assertEqual(density.log_p_sum(data, [], BetaData(0.3)), 0)
+
+    def test_log_p_only_density(self):
+        density = BinomialDensity()
+
+        class LogPOnlyDensity(object):
+
+            def log_p(self, data, params):
+                return density.log_p(data, params)
+
+        data = [BinomialData(x, 10) for x in range(6)]
+
+        params = [BetaData(0.1), BetaData(0.7)]
+
+        for vectorise in (False, True):
+            self.assertEqual(log_p_many(LogPOnlyDensity(), data[2], params, vectorise=vectorise),
+                             [density.log_p(data[2], x) for x in params])
+
+            np.testing.assert_allclose(log_p_many(density, data[2], params, vectorise=vectorise),
+                                       [density.log_p(data[2], x) for x in params])
+
+        self.assertAlmostEqual(log_p_sum(LogPOnlyDensity(), data, [1, 3], params[0]),
+                               log_p_sum(density, data, [1, 3], params[0]))
+
+        self.assertEqual(log_p_sum(LogPOnlyDensity(), data, [], params[0]), 0)
+
+    def assert_log_p_equal(self, actual, expected, density_cls):
+        actual = float(actual)
+
+        if expected == float('-inf'):
+            self.assertEqual(actual, expected, density_cls.__name__)
+
+        else:
+            self.assertAlmostEqual(actual, expected, places=8, msg=density_cls.__name__)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+'''
+Tests for DirichletProcessSampler and the parallel chain runner.
+
+Created on 2026-10-17
+
+@author: Andrew Roth
+'''
+import unittest
+
+from pydp.base_measures import BetaBaseMeasure
+from pydp.data import BinomialData
+from pydp.densities import BinomialDensity
+from pydp.rvs import RandomStream
+from pydp.samplers.atom import BetaBinomialGibbsAtomSampler
+from pydp.samplers.dp import DirichletProcessSampler, DirichletProcessState, run_parallel_chains
+from pydp.samplers.partition import AuxillaryParameterPartitionSampler
+from pydp.trace import MemoryTrace
+
+DATA = [BinomialData(x, 20) for x in (1, 2, 2, 3, 10, 11, 12, 18, 19, 19)]
+
+
+def get_sampler(rng=None, canonical_labels=False):
+    '''
+    Build a sampler which uses the default stream, as required by run_parallel_chains.
+    '''
+    base_measure = BetaBaseMeasure(1, 1)
+
+    atom_sampler = BetaBinomialGibbsAtomSampler(base_measure, BinomialDensity(), rng=rng)
+
+    partition_sampler = AuxillaryParameterPartitionSampler(base_measure, BinomialDensity(), rng=rng)
+
+    return DirichletProcessSampler(atom_sampler, partition_sampler, alpha_priors={'shape': 1, 'rate': 1}, rng=rng,
+                                   canonical_labels=canonical_labels)
+
+
+def get_trace(chain_id):
+    return MemoryTrace()
+
+
+class StateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sampler = get_sampler(rng=RandomStream(0))
+
+        self.sampler.initialise_partition(DATA, 'disconnected')
+
+        for _ in range(5):
+            self.sampler.interactive_sample(DATA)
+
+    def test_requested_fields(self):
+        state = self.sampler.get_state(['labels'])
+
+        self.assertTrue(isinstance(state, DirichletProcessState))
+
+        self.assertEqual(sorted(state._fields.keys()), ['alpha', 'labels'])
+
+        self.assertEqual(sorted(state.keys()), ['alpha', 'labels'])
+
+        self.assertRaises(KeyError, state.__getitem__, 'params')
+
+        self.assertRaises(KeyError, state.__getitem__, 'cell_values')
+
+        state = self.sampler.get_state(['alpha'])
+
+        self.assertEqual(list(state.keys()), ['alpha'])
+
+    def test_params_built_on_access(self):
+        state = self.sampler.get_state(['params'])
+
+        self.assertEqual(sorted(state._fields.keys()), ['alpha', 'cell_values', 'labels'])
+
+        self.assertEqual(sorted(state.keys()), ['alpha', 'cell_values', 'labels', 'params'])
+
+        self.assertEqual(len(state), 4)
+
+        self.assertEqual(state['params'], [state['cell_values'][x] for x in state['labels']])
+
+        self.assertEqual(state['params'], self.sampler.partition.item_values)
+
+        self.assertTrue('params' in state._fields)
+
+    def test_snapshot(self):
+        state = self.sampler.get_state()
+
+        labels = list(state['labels'])
+
+        cell_values = list(state['cell_values'])
+
+        for _ in range(5):
+            self.sampler.interactive_sample(DATA)
+
+        self.assertEqual(list(state['labels']), labels)
+
+        self.assertEqual(state['cell_values'], cell_values)
+
+    def test_memory_trace_params(self):
+        trace = MemoryTrace()
+
+        expected = []
+
+        for _ in range(10):
+            self.sampler.interactive_sample(DATA)
+
+            trace.update(self.sampler.get_state(trace.fields))
+
+            # The per item values which were stored in the state before it was lazy.
+            expected.append(self.sampler.partition.item_values)
+
+        self.assertEqual(trace.params, expected)
+
+        self.assertEqual(trace.labels[-1].tolist(), self.sampler.partition.labels)
+
+    def test_memory_trace_eager_state(self):
+        # States given as plain dicts with per item values, as in older samplers, are still accepted.
+        trace = MemoryTrace()
+
+        params = self.sampler.partition.item_values
+
+        trace.update({'alpha': 1.0, 'labels': self.sampler.partition.labels, 'params': params})
+
+        self.assertEqual(trace.params, [params])
+
+
+class CanonicalLabelsTest(unittest.TestCase):
+
+    def test_canonical_labels(self):
+        sampler = get_sampler(rng=RandomStream(0), canonical_labels=True)
+
+        sampler.initialise_partition(DATA, 'disconnected')
+
+        for _ in range(20):
+            sampler.interactive_sample(DATA)
+
+            state = sampler.get_state()
+
+            labels = list(state['labels'])
+
+            # Each new label is one more than the largest label seen so far.
+            max_label = -1
+
+            for x in labels:
+                self.assertTrue(x <= max_label + 1)
+
+                max_label = max(max_label, x)
+
+            self.assertEqual(len(state['cell_values']), max_label + 1)
+
+            self.assertEqual(sampler.partition.number_of_cells, max_label + 1)
+
+            item_values = sampler.partition.item_values
+
+            for item, x in enumerate(labels):
+                self.assertTrue(state['cell_values'][x] is item_values[item])
+
+            self.assertEqual(state['params'], item_values)
+
+    def test_trace(self):
+        trace = MemoryTrace()
+
+        get_sampler(rng=RandomStream(0), canonical_labels=True).sample(DATA, trace, 20, print_freq=1000)
+
+        for labels in trace.labels:
+            first_labels = []
+
+            for x in labels:
+                if x not in first_labels:
+                    first_labels.append(x)
+
+            self.assertEqual(first_labels, list(range(len(first_labels))))
+
+
+class ParallelChainsTest(unittest.TestCase):
+
+    def run_chains(self, num_processes):
+        return run_parallel_chains(get_sampler, get_trace, DATA, 3, 20, seed=1, num_processes=num_processes,
+                                   print_freq=1000)
+
+    def test_independent_of_num_processes(self):
+        serial = self.run_chains(1)
+
+        parallel = self.run_chains(2)
+
+        for x, y in zip(serial, parallel):
+            self.assertEqual(x.seed, y.seed)
+
+            self.assertEqual(x.trace.alpha, y.trace.alpha)
+
+            self.assertEqual(x.trace.labels, y.trace.labels)
+
+            self.assertEqual(x.trace.cell_values, y.trace.cell_values)
+
+    def test_chain_order_and_streams(self):
+        results = self.run_chains(2)
+
+        self.assertEqual([x.chain_id for x in results], [0, 1, 2])
+
+        self.assertEqual([x.seed for x in results], [x.seed_value for x in RandomStream(1).spawn(3)])
+
+        self.assertEqual(len(set(x.seed for x in results)), 3)
+
+        self.assertEqual(len(set(tuple(x.trace.alpha) for x in results)), 3)
+
+        self.assertTrue(all(len(x.trace.labels) == 20 for x in results))
+
+    def test_reproduce_chain(self):
+        result = self.run_chains(1)[1]
+
+        sampler = get_sampler(rng=RandomStream(result.seed))
+
+        trace = MemoryTrace()
+
+        sampler.sample(DATA, trace, 20, print_freq=1000)
+
+        self.assertEqual(trace.labels, result.trace.labels)
+
+
+if __name__ == '__main__':
+    unittest.main()
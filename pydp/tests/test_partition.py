@@ -0,0 +1,392 @@
+'''
+Tests for Partition and PartitionCell.
+
+Created on 2026-10-17
+
+@author: Andrew Roth
+'''
+from collections import OrderedDict
+
+import random
+import unittest
+
+from pydp.data import BetaData, BetaParameter, BinomialData
+from pydp.densities import BinomialDensity
+from pydp.partition import Partition, PartitionCell
+from pydp.vector import VectorDensity
+
+
+class CountingBinomialDensity(BinomialDensity):
+
+    def __init__(self, params=None):
+        BinomialDensity.__init__(self, params=params)
+
+        self.calls = 0
+
+    def log_p_sum(self, data, items, params):
+        self.calls += 1
+
+        return BinomialDensity.log_p_sum(self, data, items, params)
+
+
+class CountingVectorDensity(VectorDensity):
+
+    def __init__(self, cluster_densities):
+        VectorDensity.__init__(self, cluster_densities)
+
+        self.calls = 0
+
+    def log_p_sum(self, data, items, params):
+        self.calls += 1
+
+        return VectorDensity.log_p_sum(self, data, items, params)
+
+
+class PartitionTest(unittest.TestCase):
+
+    def check_partition(self, partition):
+        '''
+        Check the incremental item index and cell storage against a scan of the cells.
+        '''
+        labels = {}
+
+        for cell_index, cell in enumerate(partition.cells):
+            self.assertEqual(cell._index, cell_index)
+
+            self.assertTrue(cell._partition is partition)
+
+            # Swap-remove storage: every item is at the position recorded for it.
+            self.assertEqual(len(cell._positions), cell.size)
+
+            for position, item in enumerate(cell.items):
+                self.assertEqual(cell._positions[item], position)
+
+                self.assertTrue(item in cell)
+
+                labels[item] = cell_index
+
+            if cell.empty:
+                self.assertEqual(cell.min_item, None)
+
+            else:
+                self.assertEqual(cell.min_item, min(cell.items))
+
+        self.assertEqual(partition.number_of_items, len(labels))
+
+        self.assertEqual(partition.labels, [labels.get(x) for x in range(len(partition.labels))])
+
+        for item in range(len(partition.labels) + 2):
+            self.assertEqual(partition.get_cell_index(item), labels.get(item))
+
+        self.assertEqual(partition.counts, [cell.size for cell in partition.cells])
+
+        # Canonical labels number the cells by their smallest item.
+        canonical = {}
+
+        expected = []
+
+        for item in range(len(partition.labels)):
+            if item in labels:
+                expected.append(canonical.setdefault(labels[item], len(canonical)))
+
+            else:
+                expected.append(None)
+
+        self.assertEqual(partition.canonical_labels, expected)
+
+    def test_random_operations(self):
+        rng = random.Random(0)
+
+        partition = Partition()
+
+        num_items = 30
+
+        for item in range(num_items):
+            if partition.number_of_cells == 0 or rng.random() < 0.2:
+                partition.add_cell(rng.random())
+
+            partition.add_item(item, rng.randrange(partition.number_of_cells))
+
+        self.check_partition(partition)
+
+        for i in range(500):
+            item = rng.randrange(num_items)
+
+            cell_index = partition.get_cell_index(item)
+
+            partition.remove_item(item, cell_index)
+
+            self.assertEqual(partition.get_cell_index(item), None)
+
+            if rng.random() < 0.5:
+                partition.remove_empty_cells()
+
+            if partition.number_of_cells == 0 or rng.random() < 0.1:
+                partition.add_cell(rng.random())
+
+            partition.add_item(item, rng.randrange(partition.number_of_cells))
+
+            if i % 50 == 0:
+                partition.remove_empty_cells()
+
+            self.check_partition(partition)
+
+    def test_remove_empty_cells(self):
+        partition = Partition()
+
+        for value in range(3):
+            partition.add_cell(value)
+
+        partition.add_item(0, 0)
+
+        partition.add_item(1, 2)
+
+        empty_cell = partition.cells[1]
+
+        partition.remove_empty_cells()
+
+        self.assertEqual(partition.cell_values, [0, 2])
+
+        self.assertEqual(partition.labels, [0, 1])
+
+        self.assertTrue(empty_cell._partition is None)
+
+        self.check_partition(partition)
+
+    def test_cells_setter(self):
+        cells = [PartitionCell(x) for x in range(2)]
+
+        for item in (0, 3, 4):
+            cells[0].add_item(item)
+
+        for item in (1, 2):
+            cells[1].add_item(item)
+
+        partition = Partition()
+
+        partition.cells = cells
+
+        self.assertEqual(partition.labels, [0, 1, 1, 0, 0])
+
+        self.check_partition(partition)
+
+        partition.cells = cells[::-1]
+
+        self.assertEqual(partition.labels, [1, 0, 0, 1, 1])
+
+        self.check_partition(partition)
+
+        # Changes to the cells are tracked after they are attached.
+        partition.remove_item(3, 1)
+
+        partition.add_item(3, 0)
+
+        self.assertEqual(partition.labels, [1, 0, 0, 0, 1])
+
+        self.check_partition(partition)
+
+    def test_copy(self):
+        partition = Partition()
+
+        partition.add_cell(0)
+
+        partition.add_cell(1)
+
+        for item in range(6):
+            partition.add_item(item, item % 2)
+
+        copy = partition.copy()
+
+        self.assertEqual(copy.labels, partition.labels)
+
+        self.assertEqual(copy.cell_values, partition.cell_values)
+
+        copy.remove_item(0, 0)
+
+        self.assertEqual(partition.get_cell_index(0), 0)
+
+        self.check_partition(copy)
+
+
+class PartitionCellTest(unittest.TestCase):
+
+    def test_swap_remove(self):
+        cell = PartitionCell(None)
+
+        for item in range(5):
+            cell.add_item(item)
+
+        cell.remove_item(1)
+
+        # The last item fills the vacated slot.
+        self.assertEqual(list(cell.items), [0, 4, 2, 3])
+
+        self.assertEqual(cell._positions, {0: 0, 4: 1, 2: 2, 3: 3})
+
+        cell.remove_item(3)
+
+        self.assertEqual(list(cell.items), [0, 4, 2])
+
+        self.assertFalse(3 in cell)
+
+        self.assertRaises(KeyError, cell.remove_item, 3)
+
+    def test_min_item(self):
+        cell = PartitionCell(None)
+
+        self.assertEqual(cell.min_item, None)
+
+        for item in (5, 3, 8):
+            cell.add_item(item)
+
+        self.assertEqual(cell.min_item, 3)
+
+        cell.remove_item(3)
+
+        self.assertEqual(cell.min_item, 5)
+
+        cell.add_item(1)
+
+        self.assertEqual(cell.min_item, 1)
+
+    def test_version(self):
+        cell = PartitionCell(None)
+
+        versions = [cell.version]
+
+        cell.add_item(0)
+
+        versions.append(cell.version)
+
+        cell.remove_item(0)
+
+        versions.append(cell.version)
+
+        self.assertEqual(len(set(versions)), 3)
+
+    def test_items_view(self):
+        cell = PartitionCell(None)
+
+        items = cell.items
+
+        cell.add_item(2)
+
+        self.assertEqual(len(items), 1)
+
+        self.assertEqual(items[0], 2)
+
+        self.assertTrue(2 in items)
+
+
+class LogLikelihoodTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = [BinomialData(x, 10) for x in range(5)]
+
+        self.density = CountingBinomialDensity()
+
+        self.cell = PartitionCell(BetaData(0.3))
+
+        for item in range(3):
+            self.cell.add_item(item)
+
+    def test_cached(self):
+        expected = self.density.log_p_sum(self.data, [0, 1, 2], BetaData(0.3))
+
+        self.density.calls = 0
+
+        for _ in range(3):
+            self.assertAlmostEqual(self.cell.get_log_likelihood(self.data, self.density), expected)
+
+        self.assertEqual(self.density.calls, 1)
+
+    def test_invalidated_by_membership(self):
+        self.cell.get_log_likelihood(self.data, self.density)
+
+        self.cell.add_item(3)
+
+        expected = self.density.log_p_sum(self.data, [0, 1, 2, 3], BetaData(0.3))
+
+        self.assertAlmostEqual(self.cell.get_log_likelihood(self.data, self.density), expected)
+
+        self.cell.remove_item(0)
+
+        expected = self.density.log_p_sum(self.data, [1, 2, 3], BetaData(0.3))
+
+        self.assertAlmostEqual(self.cell.get_log_likelihood(self.data, self.density), expected)
+
+    def test_invalidated_by_value(self):
+        self.cell.get_log_likelihood(self.data, self.density)
+
+        self.cell.value = BetaData(0.7)
+
+        expected = self.density.log_p_sum(self.data, [0, 1, 2], BetaData(0.7))
+
+        self.assertAlmostEqual(self.cell.get_log_likelihood(self.data, self.density), expected)
+
+    def test_invalidated_by_global_params(self):
+        self.cell.get_log_likelihood(self.data, self.density)
+
+        self.density.params = BetaParameter(1, 1)
+
+        calls = self.density.calls
+
+        self.cell.get_log_likelihood(self.data, self.density)
+
+        self.assertEqual(self.density.calls, calls + 1)
+
+    def test_invalidated_by_data_and_density(self):
+        self.cell.get_log_likelihood(self.data, self.density)
+
+        other_data = [BinomialData(10 - x, 10) for x in range(5)]
+
+        expected = self.density.log_p_sum(other_data, [0, 1, 2], BetaData(0.3))
+
+        self.assertAlmostEqual(self.cell.get_log_likelihood(other_data, self.density), expected)
+
+        other_density = CountingBinomialDensity()
+
+        self.cell.get_log_likelihood(self.data, other_density)
+
+        self.assertEqual(other_density.calls, 1)
+
+    def test_set_log_likelihood(self):
+        value = BetaData(0.9)
+
+        self.cell.set_log_likelihood(self.data, self.density, value, -1.0)
+
+        # Not used until the cell has the value.
+        self.assertNotEqual(self.cell.get_log_likelihood(self.data, self.density), -1.0)
+
+        self.cell.set_log_likelihood(self.data, self.density, value, -1.0)
+
+        self.cell.value = value
+
+        self.assertEqual(self.cell.get_log_likelihood(self.data, self.density), -1.0)
+
+    def test_vector_density(self):
+        densities = OrderedDict((x, BinomialDensity()) for x in ('a', 'b'))
+
+        density = CountingVectorDensity(densities)
+
+        data = [dict((x, BinomialData(i, 10)) for x in densities) for i in range(3)]
+
+        cell = PartitionCell(OrderedDict((x, BetaData(0.5)) for x in densities))
+
+        for item in range(3):
+            cell.add_item(item)
+
+        for _ in range(3):
+            cell.get_log_likelihood(data, density)
+
+        self.assertEqual(density.calls, 1)
+
+        densities['a'].params = BetaParameter(1, 1)
+
+        cell.get_log_likelihood(data, density)
+
+        self.assertEqual(density.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,460 @@
+'''
+Tests for the partition samplers.
+
+The samplers are checked against the exact posterior over the partitions of a small binomial dataset, which can be
+enumerated.
+
+Created on 2026-10-17
+
+@author: Andrew Roth
+'''
+from __future__ import division
+
+from collections import Counter
+from math import exp, lgamma as log_gamma, log
+
+import unittest
+
+from pydp.base_measures import BetaBaseMeasure
+from pydp.data import BinomialData
+from pydp.densities import BetaBinomialDensity, BinomialDensity, log_beta
+from pydp.partition import Partition
+from pydp.rvs import RandomStream
+from pydp.samplers.atom import BaseMeasureAtomSampler, BetaBinomialGibbsAtomSampler
+from pydp.samplers.partition import AuxillaryParameterPartitionSampler, CollapsedGibbsPartitionSampler, \
+    MarginalGibbsPartitionSampler, MetropolisGibbsPartitionSampler, MultipleProposalMergeSplitSampler, \
+    SequentiallyAllocatedMergeSplitSampler, ShardedAuxillaryParameterPartitionSampler
+from pydp.sufficient_statistics import BinomialSufficientStatistics
+
+
+def get_partitions(items):
+    '''
+    Generate all partitions of a list of items as lists of cells.
+    '''
+    if len(items) == 0:
+        yield []
+
+        return
+
+    for partition in get_partitions(items[1:]):
+        for i in range(len(partition)):
+            yield partition[:i] + [[items[0]] + partition[i]] + partition[i + 1:]
+
+        yield [[items[0]]] + partition
+
+
+def get_canonical_labels(labels):
+    canonical = {}
+
+    return tuple(canonical.setdefault(x, len(canonical)) for x in labels)
+
+
+def get_exact_posterior(data, alpha, a, b):
+    '''
+    Posterior probability of each partition of binomial data under a DP with a Beta(a, b) base measure, keyed by the
+    canonical labels.
+    '''
+    log_p = {}
+
+    for partition in get_partitions(list(range(len(data)))):
+        labels = [None] * len(data)
+
+        x = len(partition) * log(alpha)
+
+        for cell_index, cell in enumerate(partition):
+            k = sum(data[item].x for item in cell)
+
+            n = sum(data[item].n for item in cell)
+
+            x += log_gamma(len(cell)) + log_beta(a + k, b + n - k) - log_beta(a, b)
+
+            for item in cell:
+                labels[item] = cell_index
+
+        log_p[get_canonical_labels(labels)] = x
+
+    max_log_p = max(log_p.values())
+
+    norm = sum(exp(x - max_log_p) for x in log_p.values())
+
+    return dict((key, exp(x - max_log_p) / norm) for key, x in log_p.items())
+
+
+def run_sampler(sampler, data, num_iters, seed=0):
+    '''
+    Alternate sampler with a Gibbs update of the cell values, starting with every item in its own cell, and return the
+    partition and the labels of each iteration.
+    '''
+    rng = RandomStream(seed)
+
+    base_measure = sampler.base_measure
+
+    atom_sampler = BetaBinomialGibbsAtomSampler(base_measure, BinomialDensity(), rng=rng)
+
+    partition = Partition()
+
+    for item in range(len(data)):
+        partition.add_cell(base_measure.random(rng=rng))
+
+        partition.add_item(item, item)
+
+    trace = []
+
+    for _ in range(num_iters):
+        sampler.sample(data, partition, 1.0)
+
+        atom_sampler.sample(data, partition)
+
+        trace.append(partition.labels)
+
+    return partition, trace
+
+
+class PartitionSamplerTestCase(unittest.TestCase):
+
+    data = [BinomialData(x, 20) for x in (0, 1, 3, 4, 9, 10, 11, 17, 19, 20, 2, 5, 8, 12, 13, 15, 16, 18, 6, 7)]
+
+    def assert_partition_consistent(self, partition, num_items):
+        counts = partition.counts
+
+        self.assertEqual(sum(counts), num_items)
+
+        self.assertEqual(partition.number_of_items, num_items)
+
+        self.assertTrue(all(x > 0 for x in counts))
+
+        for item, label in enumerate(partition.labels):
+            self.assertTrue(item in partition.cells[label].items)
+
+
+class LogPOnlyDensity(object):
+    '''
+    Density which only implements log_p, as densities written before log_p_many and log_p_sum were added to Density.
+    '''
+
+    def __init__(self, density):
+        self.density = density
+
+        self.params = density.params
+
+    def log_p(self, data, params):
+        return self.density.log_p(data, params)
+
+
+class ExactPosteriorTestCase(unittest.TestCase):
+
+    alpha = 1.0
+
+    data = [BinomialData(2, 10), BinomialData(3, 10), BinomialData(8, 10), BinomialData(6, 10)]
+
+    def check_sampler(self, sampler, base_measure, num_iters=20000, max_tv=0.03):
+        '''
+        Run sampler followed by a Gibbs update of the cell values and check the total variation distance of the
+        frequency of each partition from the exact posterior.
+        '''
+        rng = RandomStream(0)
+
+        atom_sampler = BetaBinomialGibbsAtomSampler(base_measure, BinomialDensity(), rng=rng)
+
+        partition = Partition()
+
+        for item in range(len(self.data)):
+            partition.add_cell(base_measure.random(rng=rng))
+
+            partition.add_item(item, item)
+
+        counts = Counter()
+
+        for _ in range(num_iters):
+            sampler.sample(self.data, partition, self.alpha)
+
+            atom_sampler.sample(self.data, partition)
+
+            counts[get_canonical_labels(partition.labels)] += 1
+
+        posterior = get_exact_posterior(self.data, self.alpha, base_measure.params.a, base_measure.params.b)
+
+        tv = 0.5 * sum(abs(posterior[x] - counts[x] / num_iters) for x in posterior)
+
+        self.assertLess(tv, max_tv)
+
+    def get_base_measures(self):
+        # Beta(1, 1) has a constant density so errors in the base measure terms of an acceptance ratio cancel.
+        return [BetaBaseMeasure(1, 1), BetaBaseMeasure(2, 3)]
+
+
+class CollapsedGibbsPartitionSamplerTest(ExactPosteriorTestCase):
+
+    def test_exact_posterior(self):
+        for base_measure in self.get_base_measures():
+            sampler = CollapsedGibbsPartitionSampler(base_measure,
+                                                     BinomialDensity(),
+                                                     BetaBinomialDensity(),
+                                                     BinomialSufficientStatistics,
+                                                     rng=RandomStream(1))
+
+            self.check_sampler(sampler, base_measure)
+
+
+class MarginalGibbsPartitionSamplerTest(unittest.TestCase):
+
+    def test_single_item(self):
+        # Removing the only item leaves no cells to score.
+        for vectorise in (False, True):
+            base_measure = BetaBaseMeasure(1, 1)
+
+            sampler = MarginalGibbsPartitionSampler(base_measure,
+                                                    BinomialDensity(),
+                                                    BetaBinomialDensity(),
+                                                    vectorise=vectorise,
+                                                    rng=RandomStream(0))
+
+            partition = Partition()
+
+            partition.add_cell(base_measure.random(rng=sampler.rng))
+
+            partition.add_item(0, 0)
+
+            for _ in range(5):
+                sampler.sample([BinomialData(3, 10)], partition, 1.0)
+
+            self.assertEqual(partition.labels, [0])
+
+            self.assertEqual(partition.number_of_cells, 1)
+
+
+class VectorisedPathTest(unittest.TestCase):
+    '''
+    The vectorised path draws the new cell from the same cumulative weights with the same uniform as the scalar path, so
+    with the same seed both follow the same chain.
+    '''
+
+    data = [BinomialData(x, 20) for x in (0, 1, 3, 4, 9, 10, 11, 17, 19, 20)]
+
+    def run_sampler(self, sampler_cls, vectorise, num_iters=50, **kwargs):
+        rng = RandomStream(0)
+
+        base_measure = BetaBaseMeasure(1, 1)
+
+        sampler = sampler_cls(base_measure, BinomialDensity(), vectorise=vectorise, rng=rng, **kwargs)
+
+        atom_sampler = BetaBinomialGibbsAtomSampler(base_measure, BinomialDensity(), rng=rng)
+
+        partition = Partition()
+
+        for item in range(len(self.data)):
+            partition.add_cell(base_measure.random(rng=rng))
+
+            partition.add_item(item, item)
+
+        trace = []
+
+        for _ in range(num_iters):
+            sampler.sample(self.data, partition, 1.0)
+
+            atom_sampler.sample(self.data, partition)
+
+            trace.append(get_canonical_labels(partition.labels))
+
+        return trace
+
+    def check_sampler(self, sampler_cls, **kwargs):
+        scalar = self.run_sampler(sampler_cls, False, **kwargs)
+
+        self.assertEqual(self.run_sampler(sampler_cls, True, **kwargs), scalar)
+
+        # The chain moves between partitions rather than staying at the initial one.
+        self.assertTrue(len(set(scalar)) > 5)
+
+    def test_auxillary(self):
+        self.check_sampler(AuxillaryParameterPartitionSampler)
+
+    def test_metropolis_gibbs(self):
+        self.check_sampler(MetropolisGibbsPartitionSampler)
+
+    def test_sharded(self):
+        self.check_sampler(ShardedAuxillaryParameterPartitionSampler, num_shards=3)
+
+    def test_collapsed(self):
+        self.check_sampler(CollapsedGibbsPartitionSampler,
+                           posterior_predictive_density=BetaBinomialDensity(),
+                           sufficient_statistics=BinomialSufficientStatistics)
+
+
+class LogPOnlyDensityTest(PartitionSamplerTestCase):
+
+    def check_sampler(self, sampler_cls, **kwargs):
+        for vectorise in (False, True):
+            traces = []
+
+            for density in (BinomialDensity(), LogPOnlyDensity(BinomialDensity())):
+                sampler = sampler_cls(BetaBaseMeasure(1, 1),
+                                      density,
+                                      vectorise=vectorise,
+                                      rng=RandomStream(1),
+                                      **kwargs)
+
+                traces.append(run_sampler(sampler, self.data, 20)[1])
+
+            self.assertEqual(traces[0], traces[1])
+
+    def test_auxillary(self):
+        self.check_sampler(AuxillaryParameterPartitionSampler)
+
+    def test_collapsed(self):
+        self.check_sampler(CollapsedGibbsPartitionSampler,
+                           posterior_predictive_density=LogPOnlyDensity(BetaBinomialDensity()),
+                           sufficient_statistics=BinomialSufficientStatistics)
+
+    def test_merge_split_and_atom_sampler(self):
+        traces = []
+
+        for density in (BinomialDensity(), LogPOnlyDensity(BinomialDensity())):
+            rng = RandomStream(1)
+
+            base_measure = BetaBaseMeasure(1, 1)
+
+            partition_sampler = SequentiallyAllocatedMergeSplitSampler(base_measure, density, rng=rng)
+
+            atom_sampler = BaseMeasureAtomSampler(base_measure, density, rng=rng)
+
+            partition = Partition()
+
+            partition.add_cell(base_measure.random(rng=rng))
+
+            for item in range(len(self.data)):
+                partition.add_item(item, 0)
+
+            trace = []
+
+            for _ in range(50):
+                partition_sampler.sample(self.data, partition, 1.0)
+
+                atom_sampler.sample(self.data, partition)
+
+                trace.append((partition.labels, partition.cell_values))
+
+            traces.append(trace)
+
+        self.assertEqual(len(traces[0]), len(traces[1]))
+
+        for (labels, values), (other_labels, other_values) in zip(*traces):
+            self.assertEqual(labels, other_labels)
+
+            for x, y in zip(values, other_values):
+                self.assertAlmostEqual(x.x, y.x)
+
+
+class SequentiallyAllocatedMergeSplitSamplerTest(ExactPosteriorTestCase):
+
+    def test_exact_posterior(self):
+        for base_measure in self.get_base_measures():
+            sampler = SequentiallyAllocatedMergeSplitSampler(base_measure, BinomialDensity(), rng=RandomStream(1))
+
+            self.check_sampler(sampler, base_measure, num_iters=40000)
+
+
+class MultipleProposalMergeSplitSamplerTest(ExactPosteriorTestCase):
+
+    def test_exact_posterior(self):
+        for base_measure in self.get_base_measures():
+            sampler = MultipleProposalMergeSplitSampler(base_measure,
+                                                        BinomialDensity(),
+                                                        num_proposals=3,
+                                                        rng=RandomStream(1))
+
+            self.check_sampler(sampler, base_measure, num_iters=30000)
+
+
+class MultipleProposalMergeSplitSamplerProcessesTest(PartitionSamplerTestCase):
+
+    def get_sampler(self):
+        return MultipleProposalMergeSplitSampler(BetaBaseMeasure(1, 1),
+                                                 BinomialDensity(),
+                                                 num_proposals=5,
+                                                 num_processes=2,
+                                                 rng=RandomStream(1))
+
+    def test_processes(self):
+        sampler = self.get_sampler()
+
+        try:
+            partition, trace = run_sampler(sampler, self.data, 30)
+
+        finally:
+            sampler.close()
+
+        self.assert_partition_consistent(partition, len(self.data))
+
+        self.assertTrue(len(set(tuple(x) for x in trace)) > 1)
+
+        # The worker streams are seeded from the sampler stream so runs can be repeated.
+        sampler = self.get_sampler()
+
+        try:
+            self.assertEqual(run_sampler(sampler, self.data, 30)[1], trace)
+
+        finally:
+            sampler.close()
+
+
+class ShardedAuxillaryParameterPartitionSamplerTest(ExactPosteriorTestCase):
+
+    def test_exact_posterior_single_shard(self):
+        # With one shard the sampler is exact. With more shards it is only approximate.
+        base_measure = BetaBaseMeasure(2, 3)
+
+        sampler = ShardedAuxillaryParameterPartitionSampler(base_measure,
+                                                            BinomialDensity(),
+                                                            num_shards=1,
+                                                            rng=RandomStream(1))
+
+        self.check_sampler(sampler, base_measure)
+
+
+class ShardedAuxillaryParameterPartitionSamplerProcessesTest(PartitionSamplerTestCase):
+
+    def get_sampler(self, num_processes):
+        return ShardedAuxillaryParameterPartitionSampler(BetaBaseMeasure(1, 1),
+                                                         BinomialDensity(),
+                                                         num_shards=3,
+                                                         num_processes=num_processes,
+                                                         rng=RandomStream(1))
+
+    def test_multiple_shards(self):
+        for num_processes in (1, 2):
+            sampler = self.get_sampler(num_processes)
+
+            try:
+                partition, trace = run_sampler(sampler, self.data, 30)
+
+                self.assert_partition_consistent(partition, len(self.data))
+
+                # Check after single sweeps as well as at the end.
+                for _ in range(10):
+                    sampler.sample(self.data, partition, 1.0)
+
+                    self.assert_partition_consistent(partition, len(self.data))
+
+            finally:
+                sampler.close()
+
+            self.assertTrue(len(set(tuple(x) for x in trace)) > 1)
+
+    def test_processes_repeatable(self):
+        traces = []
+
+        for _ in range(2):
+            sampler = self.get_sampler(2)
+
+            try:
+                traces.append(run_sampler(sampler, self.data, 20)[1])
+
+            finally:
+                sampler.close()
+
+        self.assertEqual(traces[0], traces[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,282 @@
+'''
+Tests for the random streams and random variable samplers.
+
+Distributions are checked by the total variation distance between the frequencies of a fixed seed sample and the exact
+probabilities.
+
+Created on 2026-10-17
+
+@author: Andrew Roth
+'''
+from __future__ import division
+
+from collections import Counter
+from math import exp, lgamma as log_gamma, log, sqrt
+
+import pickle
+import random
+import unittest
+
+import numpy as np
+
+from pydp.rvs import AliasTable, GridSampler, RandomStream, binomial_rvs, get_rng, inverse_sample_rvs, \
+    log_discrete_rvs, log_discrete_rvs_array, poisson_rvs, set_default_rng, uniform_rvs
+
+
+def get_tv(samples, pmf, support):
+    counts = Counter(samples)
+
+    return 0.5 * sum(abs(counts[x] / len(samples) - pmf(x)) for x in support)
+
+
+def binomial_pmf(x, n, p):
+    return exp(log_gamma(n + 1) - log_gamma(x + 1) - log_gamma(n - x + 1) + x * log(p) + (n - x) * log(1 - p))
+
+
+def poisson_pmf(x, l):
+    return exp(x * log(l) - l - log_gamma(x + 1))
+
+
+class RandomStreamTest(unittest.TestCase):
+
+    def test_seed(self):
+        x = [RandomStream(1).random() for _ in range(2)]
+
+        self.assertEqual(x[0], x[1])
+
+        self.assertNotEqual(RandomStream(1).random(), RandomStream(2).random())
+
+    def test_spawn_reproducible(self):
+        streams = RandomStream(1).spawn(3)
+
+        other_streams = RandomStream(1).spawn(3)
+
+        self.assertEqual([x.seed_value for x in streams], [x.seed_value for x in other_streams])
+
+        self.assertEqual([x.random() for x in streams], [x.random() for x in other_streams])
+
+        self.assertEqual(len(set(x.seed_value for x in streams)), 3)
+
+        self.assertNotEqual([x.seed_value for x in RandomStream(2).spawn(3)], [x.seed_value for x in streams])
+
+    def test_spawn_sequence(self):
+        # Spawning in several calls gives the same streams as spawning all at once.
+        rng = RandomStream(1)
+
+        streams = rng.spawn(2) + rng.spawn(1)
+
+        self.assertEqual([x.seed_value for x in streams], [x.seed_value for x in RandomStream(1).spawn(3)])
+
+    def test_spawn_does_not_use_stream(self):
+        rng = RandomStream(1)
+
+        rng.spawn(5)
+
+        self.assertEqual(rng.random(), RandomStream(1).random())
+
+    def test_pickle(self):
+        rng = RandomStream(1)
+
+        rng.random()
+
+        rng.spawn(2)
+
+        copy = pickle.loads(pickle.dumps(rng))
+
+        self.assertEqual(copy.random(), rng.random())
+
+        self.assertEqual(copy.spawn(1)[0].seed_value, rng.spawn(1)[0].seed_value)
+
+    def test_default_rng(self):
+        self.assertTrue(get_rng() is random)
+
+        rng = RandomStream(1)
+
+        self.assertTrue(get_rng(rng) is rng)
+
+        set_default_rng(RandomStream(3))
+
+        try:
+            x = uniform_rvs(0, 1)
+
+        finally:
+            set_default_rng(None)
+
+        self.assertEqual(x, uniform_rvs(0, 1, rng=RandomStream(3)))
+
+        self.assertTrue(get_rng() is random)
+
+
+class DiscreteRvsTest(unittest.TestCase):
+
+    def test_log_discrete_rvs(self):
+        p = [0.1, 0.2, 0.0, 0.7]
+
+        log_p = [log(x) + 1000 if x > 0 else float('-inf') for x in p]
+
+        rng = RandomStream(0)
+
+        samples = [log_discrete_rvs(log_p, rng=rng) for _ in range(20000)]
+
+        self.assertLess(get_tv(samples, lambda x: p[x], range(len(p))), 0.01)
+
+        self.assertFalse(2 in samples)
+
+    def test_log_discrete_rvs_array(self):
+        p = np.array([[0.5, 0.5, 0.0], [0.1, 0.2, 0.7]])
+
+        with np.errstate(divide='ignore'):
+            log_p = np.log(np.repeat(p, 10000, axis=0))
+
+        samples = log_discrete_rvs_array(log_p, rng=RandomStream(0))
+
+        for i in range(2):
+            row_samples = samples[i * 10000:(i + 1) * 10000].tolist()
+
+            self.assertLess(get_tv(row_samples, lambda x: p[i, x], range(3)), 0.02)
+
+    def test_alias_table(self):
+        weights = [1, 0, 3, 6, 0.5]
+
+        p = [x / sum(weights) for x in weights]
+
+        table = AliasTable(weights)
+
+        self.assertEqual(len(table), len(weights))
+
+        samples = table.sample_many(20000, rng=RandomStream(0))
+
+        self.assertLess(get_tv(samples, lambda x: p[x], range(len(p))), 0.01)
+
+        self.assertFalse(1 in samples)
+
+    def test_alias_table_single_class(self):
+        self.assertEqual(AliasTable([2.0]).sample_many(10, rng=RandomStream(0)), [0] * 10)
+
+
+class BinomialRvsTest(unittest.TestCase):
+
+    def check(self, n, p, num_samples=20000, max_tv=0.02):
+        rng = RandomStream(0)
+
+        samples = [binomial_rvs(n, p, rng=rng) for _ in range(num_samples)]
+
+        self.assertTrue(all(0 <= x <= n for x in samples))
+
+        self.assertLess(get_tv(samples, lambda x: binomial_pmf(x, n, p), range(n + 1)), max_tv)
+
+        self.assertAlmostEqual(np.mean(samples), n * p, delta=4 * sqrt(n * p * (1 - p) / num_samples))
+
+    def test_inversion(self):
+        for n, p in ((5, 0.3), (20, 0.2), (30, 0.9)):
+            self.check(n, p)
+
+    def test_btrs(self):
+        # n * min(p, 1 - p) >= 10 uses transformed rejection.
+        for n, p in ((40, 0.26), (100, 0.7), (1000, 0.1)):
+            self.check(n, p, max_tv=0.03)
+
+    def test_boundaries(self):
+        self.assertEqual(binomial_rvs(10, 0, rng=RandomStream(0)), 0)
+
+        self.assertEqual(binomial_rvs(10, 1, rng=RandomStream(0)), 10)
+
+        self.assertEqual(binomial_rvs(0, 0.5, rng=RandomStream(0)), 0)
+
+
+class PoissonRvsTest(unittest.TestCase):
+
+    def check(self, l, num_samples=20000, max_tv=0.02):
+        rng = RandomStream(0)
+
+        samples = [poisson_rvs(l, rng=rng) for _ in range(num_samples)]
+
+        self.assertTrue(all(x >= 0 for x in samples))
+
+        support = range(int(l + 10 * sqrt(l) + 20))
+
+        self.assertLess(get_tv(samples, lambda x: poisson_pmf(x, l), support), max_tv)
+
+        self.assertAlmostEqual(np.mean(samples), l, delta=4 * sqrt(l / num_samples))
+
+    def test_inversion(self):
+        for l in (0.5, 3, 9.9):
+            self.check(l)
+
+    def test_ptrs(self):
+        # l >= 10 uses transformed rejection.
+        for l in (10, 25, 200):
+            self.check(l, max_tv=0.04)
+
+
+class GridSamplerTest(unittest.TestCase):
+
+    a = 30
+
+    b = 70
+
+    def log_f(self, x):
+        return (self.a - 1) * log(x) + (self.b - 1) * log(1 - x)
+
+    def log_f_array(self, x):
+        return (self.a - 1) * np.log(x) + (self.b - 1) * np.log1p(-x)
+
+    def log_norm_const(self):
+        return log_gamma(self.a) + log_gamma(self.b) - log_gamma(self.a + self.b)
+
+    def check_moments(self, samples):
+        mean = self.a / (self.a + self.b)
+
+        sd = sqrt(self.a * self.b / ((self.a + self.b) ** 2 * (self.a + self.b + 1)))
+
+        self.assertAlmostEqual(np.mean(samples), mean, delta=0.002)
+
+        self.assertAlmostEqual(np.std(samples), sd, delta=0.002)
+
+    def test_sample(self):
+        for refine_factor in (None, 10):
+            sampler = GridSampler(0, 1, mesh_size=100, refine_factor=refine_factor)
+
+            rng = RandomStream(0)
+
+            samples = []
+
+            for _ in range(10000):
+                x, log_q = sampler.sample(self.log_f, rng=rng)
+
+                samples.append(x)
+
+            self.check_moments(samples)
+
+            # log_q is the normalised density at x up to the error of the grid.
+            self.assertAlmostEqual(log_q, self.log_f(x) - self.log_norm_const(), delta=0.01)
+
+    def test_vectorised_matches_scalar(self):
+        for refine_factor in (None, 10):
+            scalar = GridSampler(0, 1, mesh_size=50, refine_factor=refine_factor)
+
+            vectorised = GridSampler(0, 1, mesh_size=50, vectorised=True, refine_factor=refine_factor)
+
+            rng = RandomStream(0)
+
+            other_rng = RandomStream(0)
+
+            for _ in range(100):
+                x = scalar.sample(self.log_f, rng=rng)
+
+                y = vectorised.sample(self.log_f_array, rng=other_rng)
+
+                self.assertAlmostEqual(x[0], y[0])
+
+                self.assertAlmostEqual(x[1], y[1])
+
+    def test_inverse_sample_rvs(self):
+        rng = RandomStream(0)
+
+        samples = [inverse_sample_rvs(self.log_f, 0, 1, rng=rng)[0] for _ in range(10000)]
+
+        self.check_moments(samples)
+
+
+if __name__ == '__main__':
+    unittest.main()
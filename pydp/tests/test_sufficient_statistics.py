@@ -0,0 +1,167 @@
+'''
+Tests for the sufficient statistics attached to partition cells.
+
+Created on 2026-10-17
+
+@author: Andrew Roth
+'''
+from __future__ import division
+
+import random
+import unittest
+
+from pydp.data import BetaParameter, BinomialData, GammaParameter, GaussianData, GaussianGammaParameter, PoissonData
+from pydp.partition import PartitionCell
+from pydp.sufficient_statistics import BinomialSufficientStatistics, GaussianSufficientStatistics, \
+    PoissonSufficientStatistics
+
+
+class SufficientStatisticsTest(unittest.TestCase):
+
+    def run_random_updates(self, statistics_cls, data, check):
+        '''
+        Add and remove random items from a cell with the statistics attached and compare them to statistics rebuilt from
+        the items in the cell after every change.
+        '''
+        rng = random.Random(0)
+
+        cell = PartitionCell(None)
+
+        statistics = cell.get_sufficient_statistics(statistics_cls, data)
+
+        for _ in range(1000):
+            item = rng.randrange(len(data))
+
+            if item in cell:
+                cell.remove_item(item)
+
+            else:
+                cell.add_item(item)
+
+            self.assertTrue(cell.get_sufficient_statistics(statistics_cls, data) is statistics)
+
+            expected = statistics_cls(data)
+
+            for x in cell.items:
+                expected.add_item(x)
+
+            self.assertEqual(statistics.size, cell.size)
+
+            check(statistics, expected, [data[x] for x in cell.items])
+
+    def test_binomial(self):
+        rng = random.Random(1)
+
+        data = [BinomialData(rng.randint(0, 10), 10) for _ in range(20)]
+
+        def check(statistics, expected, data_points):
+            self.assertEqual((statistics.x, statistics.n), (expected.x, expected.n))
+
+            self.assertEqual(statistics.x, sum(x.x for x in data_points))
+
+            self.assertEqual(statistics.get_posterior_params(BetaParameter(1, 2)),
+                             BetaParameter(1 + statistics.x, 2 + statistics.n - statistics.x))
+
+        self.run_random_updates(BinomialSufficientStatistics, data, check)
+
+    def test_poisson(self):
+        rng = random.Random(1)
+
+        data = [PoissonData(rng.randint(0, 50)) for _ in range(20)]
+
+        def check(statistics, expected, data_points):
+            self.assertEqual(statistics.x, sum(x.x for x in data_points))
+
+            self.assertEqual(statistics.get_posterior_params(GammaParameter(1, 2)),
+                             GammaParameter(1 + statistics.x, 2 + len(data_points)))
+
+        self.run_random_updates(PoissonSufficientStatistics, data, check)
+
+    def test_gaussian(self):
+        rng = random.Random(1)
+
+        data = [GaussianData(rng.gauss(100, 10)) for _ in range(20)]
+
+        def check(statistics, expected, data_points):
+            n = len(data_points)
+
+            if n == 0:
+                mean = 0
+
+                sum_of_squares = 0
+
+            else:
+                mean = sum(x.x for x in data_points) / n
+
+                sum_of_squares = sum((x.x - mean) ** 2 for x in data_points)
+
+            self.assertAlmostEqual(statistics.mean, mean, places=8)
+
+            self.assertAlmostEqual(statistics.sum_of_squares, sum_of_squares, places=6)
+
+            prior = GaussianGammaParameter(0, 0.1, 1, 1)
+
+            for x, y in zip(statistics.get_posterior_params(prior), expected.get_posterior_params(prior)):
+                self.assertAlmostEqual(x, y, places=6)
+
+        self.run_random_updates(GaussianSufficientStatistics, data, check)
+
+    def test_gaussian_remove_to_single_item(self):
+        data = [GaussianData(x) for x in (1.0, 2.0, 4.0)]
+
+        statistics = GaussianSufficientStatistics(data)
+
+        for item in range(3):
+            statistics.add_item(item)
+
+        statistics.remove_item(0)
+
+        statistics.remove_item(1)
+
+        self.assertAlmostEqual(statistics.mean, 4.0)
+
+        self.assertAlmostEqual(statistics.sum_of_squares, 0.0)
+
+        self.assertEqual(statistics.variance, 0.0)
+
+    def test_rebuilt_for_new_data(self):
+        data = [BinomialData(1, 10), BinomialData(2, 10)]
+
+        cell = PartitionCell(None)
+
+        cell.add_item(0)
+
+        cell.add_item(1)
+
+        self.assertEqual(cell.get_sufficient_statistics(BinomialSufficientStatistics, data).x, 3)
+
+        other_data = [BinomialData(5, 10), BinomialData(6, 10)]
+
+        self.assertEqual(cell.get_sufficient_statistics(BinomialSufficientStatistics, other_data).x, 11)
+
+
+    def test_keys(self):
+        data = [BinomialData(1, 10), BinomialData(2, 10)]
+
+        other_data = [BinomialData(5, 10), BinomialData(6, 10)]
+
+        cell = PartitionCell(None)
+
+        cell.add_item(0)
+
+        statistics = cell.get_sufficient_statistics(BinomialSufficientStatistics, data, key='a')
+
+        other_statistics = cell.get_sufficient_statistics(BinomialSufficientStatistics, other_data, key='b')
+
+        cell.add_item(1)
+
+        self.assertEqual((statistics.x, other_statistics.x), (3, 11))
+
+        self.assertTrue(cell.get_sufficient_statistics(BinomialSufficientStatistics, data, key='a') is statistics)
+
+        self.assertTrue(cell.get_sufficient_statistics(BinomialSufficientStatistics, other_data, key='b') is
+                        other_statistics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,509 @@
+'''
+Tests for the trace backends and filters.
+
+Created on 2026-10-17
+
+@author: Andrew Roth
+'''
+from __future__ import division
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from pydp.data import BetaData
+from pydp.rvs import RandomStream
+from pydp.trace import AsyncTrace, BinaryTrace, BurnInTrace, DeltaLabelTrace, MemoryTrace, ReservoirTrace, \
+    SimilarityMatrixTrace, ThinnedTrace, Trace
+
+
+def get_states(num_iters, num_items=6, seed=0):
+    rng = RandomStream(seed)
+
+    states = []
+
+    for i in range(num_iters):
+        labels = [rng.randrange(3) for _ in range(num_items)]
+
+        cell_values = [BetaData(rng.random()) for _ in range(3)]
+
+        states.append({'alpha': rng.random(),
+                       'labels': labels,
+                       'cell_values': cell_values,
+                       'params': [cell_values[x] for x in labels]})
+
+    return states
+
+
+def write(trace, states):
+    '''
+    Write states to a trace the way DirichletProcessSampler does.
+    '''
+    trace.open('w')
+
+    for state in states:
+        if trace.accept():
+            trace.update(state)
+
+    trace.close()
+
+
+class IterationTrace(Trace):
+    '''
+    Trace which records the iteration stored in each state.
+    '''
+
+    def __init__(self):
+        self.iters = []
+
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def update(self, state):
+        self.iters.append(state['iter'])
+
+
+class FailingTrace(Trace):
+
+    def update(self, state):
+        raise ValueError('Failed to write.')
+
+
+def get_co_clustering_counts(trace):
+    n = len(trace[0])
+
+    counts = np.zeros((n, n))
+
+    for labels in trace:
+        labels = np.asarray(labels)
+
+        counts += labels[:, np.newaxis] == labels[np.newaxis, :]
+
+    return counts
+
+
+class TraceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.trace_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.trace_dir)
+
+
+class BinaryTraceTest(TraceTestCase):
+
+    def test_round_trip(self):
+        # 10 iterations with a chunk size of 3 leaves a partial chunk to write on close.
+        states = get_states(10)
+
+        trace = BinaryTrace(self.trace_dir, ['alpha', 'labels', 'x'], file_name_map={'x': 'cellular_prevalence'},
+                            chunk_size=3)
+
+        self.assertEqual(set(trace.fields), set(['alpha', 'labels', 'params']))
+
+        write(trace, states)
+
+        arrays = trace.open('r')
+
+        np.testing.assert_allclose(arrays['alpha'], [x['alpha'] for x in states])
+
+        np.testing.assert_array_equal(arrays['labels'], [x['labels'] for x in states])
+
+        self.assertEqual(arrays['labels'].dtype, np.int32)
+
+        np.testing.assert_allclose(trace['x'], [[y.x for y in x['params']] for x in states])
+
+        # The files are standard .npy files.
+        np.testing.assert_allclose(np.load(os.path.join(self.trace_dir, 'cellular_prevalence.npy')), trace['x'])
+
+        trace.close()
+
+    def test_empty(self):
+        trace = BinaryTrace(self.trace_dir, ['alpha', 'labels'])
+
+        write(trace, [])
+
+        arrays = trace.open('r')
+
+        self.assertEqual(len(arrays['labels']), 0)
+
+        trace.close()
+
+    def test_row_shape_changes(self):
+        trace = BinaryTrace(self.trace_dir, ['labels'])
+
+        trace.open('w')
+
+        trace.update({'labels': [0, 1]})
+
+        self.assertRaises(Exception, trace.update, {'labels': [0, 1, 2]})
+
+
+class AsyncTraceTest(unittest.TestCase):
+
+    def test_writes_all_states(self):
+        states = get_states(50)
+
+        trace = AsyncTrace(MemoryTrace(), max_queue_size=4)
+
+        write(trace, states)
+
+        self.assertEqual(trace.labels, [x['labels'] for x in states])
+
+        self.assertEqual(trace.alpha, [x['alpha'] for x in states])
+
+        self.assertEqual(trace.fields, MemoryTrace.fields)
+
+    def test_error_raised(self):
+        trace = AsyncTrace(FailingTrace())
+
+        trace.open('w')
+
+        trace.update({})
+
+        self.assertRaises(ValueError, trace.close)
+
+    def test_update_before_open(self):
+        self.assertRaises(Exception, AsyncTrace(MemoryTrace()).update, {})
+
+    def test_pickle(self):
+        trace = AsyncTrace(MemoryTrace())
+
+        write(trace, get_states(3))
+
+        copy = pickle.loads(pickle.dumps(trace))
+
+        self.assertEqual(copy.labels, trace.labels)
+
+
+class DeltaLabelTraceTest(TraceTestCase):
+
+    def get_labels(self):
+        rng = RandomStream(0)
+
+        labels = [0] * 8
+
+        trace = []
+
+        for i in range(25):
+            # Change a few items per iteration, no items, or all items.
+            if i % 7 == 3:
+                pass
+
+            elif i % 11 == 5:
+                labels = [rng.randrange(4) for _ in labels]
+
+            else:
+                for _ in range(2):
+                    labels[rng.randrange(len(labels))] = rng.randrange(4)
+
+            # The number of items changes between keyframes.
+            if i == 17:
+                labels = labels + [0]
+
+            trace.append(list(labels))
+
+        return trace
+
+    def test_round_trip(self):
+        labels = self.get_labels()
+
+        for keyframe_interval in (1, 3, 4, 100):
+            trace = DeltaLabelTrace(self.trace_dir, keyframe_interval=keyframe_interval)
+
+            write(trace, [{'labels': x} for x in labels])
+
+            trace.open('r')
+
+            self.assertEqual(len(trace), len(labels))
+
+            self.assertEqual(list(trace), labels)
+
+            # Random access on and either side of the keyframes.
+            for i in reversed(range(len(labels))):
+                self.assertEqual(trace.get(i), labels[i])
+
+            trace.close()
+
+    def test_wrong_keyframe_interval(self):
+        labels = self.get_labels()
+
+        trace = DeltaLabelTrace(self.trace_dir, keyframe_interval=4)
+
+        write(trace, [{'labels': x} for x in labels])
+
+        trace.keyframe_interval = 5
+
+        trace.open('r')
+
+        self.assertEqual(trace.get(3), labels[3])
+
+        self.assertRaises(Exception, trace.get, 6)
+
+        trace.close()
+
+    def test_pickle(self):
+        labels = self.get_labels()
+
+        trace = DeltaLabelTrace(self.trace_dir, keyframe_interval=4)
+
+        write(trace, [{'labels': x} for x in labels])
+
+        trace = pickle.loads(pickle.dumps(trace))
+
+        trace.open('r')
+
+        self.assertEqual(list(trace), labels)
+
+        trace.close()
+
+
+class TraceFilterTest(unittest.TestCase):
+
+    def get_states(self, num_iters):
+        return [{'iter': i} for i in range(num_iters)]
+
+    def test_burnin(self):
+        trace = IterationTrace()
+
+        write(BurnInTrace(trace, 5), self.get_states(8))
+
+        self.assertEqual(trace.iters, [5, 6, 7])
+
+        self.assertTrue(trace.closed)
+
+    def test_thin(self):
+        trace = IterationTrace()
+
+        write(ThinnedTrace(trace, 3), self.get_states(10))
+
+        self.assertEqual(trace.iters, [2, 5, 8])
+
+    def test_nested(self):
+        trace = IterationTrace()
+
+        write(BurnInTrace(ThinnedTrace(trace, 10), 30), self.get_states(100))
+
+        self.assertEqual(trace.iters, [39, 49, 59, 69, 79, 89, 99])
+
+        trace = IterationTrace()
+
+        write(ThinnedTrace(BurnInTrace(trace, 3), 10), self.get_states(100))
+
+        self.assertEqual(trace.iters, [39, 49, 59, 69, 79, 89, 99])
+
+    def test_reopen(self):
+        trace = IterationTrace()
+
+        burnin_trace = BurnInTrace(trace, 2)
+
+        write(burnin_trace, self.get_states(3))
+
+        write(burnin_trace, self.get_states(3))
+
+        self.assertEqual(trace.iters, [2, 2])
+
+    def test_delegates_attributes(self):
+        trace = ThinnedTrace(MemoryTrace(), 2)
+
+        write(trace, get_states(4))
+
+        self.assertEqual(len(trace.labels), 2)
+
+        self.assertEqual(trace.fields, MemoryTrace.fields)
+
+    def test_reservoir(self):
+        trace = IterationTrace()
+
+        write(ReservoirTrace(trace, 5, rng=RandomStream(0)), self.get_states(100))
+
+        self.assertEqual(len(trace.iters), 5)
+
+        self.assertEqual(trace.iters, sorted(trace.iters))
+
+        self.assertEqual(len(set(trace.iters)), 5)
+
+        self.assertTrue(trace.closed)
+
+        # Fewer iterations than the size of the reservoir keeps them all.
+        trace = IterationTrace()
+
+        write(ReservoirTrace(trace, 5), self.get_states(3))
+
+        self.assertEqual(trace.iters, [0, 1, 2])
+
+    def test_reservoir_async(self):
+        # The writer thread runs update after the sampler thread has moved on to later calls to accept.
+        for seed in range(5):
+            trace = IterationTrace()
+
+            write(AsyncTrace(ReservoirTrace(trace, 10, rng=RandomStream(seed))), self.get_states(500))
+
+            self.assertEqual(len(trace.iters), 10)
+
+            self.assertEqual(trace.iters, sorted(set(trace.iters)))
+
+            self.assertTrue(trace.closed)
+
+            expected = IterationTrace()
+
+            write(ReservoirTrace(expected, 10, rng=RandomStream(seed)), self.get_states(500))
+
+            self.assertEqual(trace.iters, expected.iters)
+
+    def test_reservoir_uniform(self):
+        rng = RandomStream(0)
+
+        counts = [0] * 20
+
+        for _ in range(2000):
+            trace = IterationTrace()
+
+            write(ReservoirTrace(trace, 5, rng=rng), self.get_states(20))
+
+            for i in trace.iters:
+                counts[i] += 1
+
+        for x in counts:
+            self.assertAlmostEqual(x / 2000, 0.25, delta=0.04)
+
+    def test_reservoir_nested(self):
+        trace = IterationTrace()
+
+        write(BurnInTrace(ReservoirTrace(ThinnedTrace(trace, 2), 4, rng=RandomStream(0)), 50), self.get_states(100))
+
+        # Every other kept iteration is passed on when the reservoir is flushed.
+        self.assertEqual(len(trace.iters), 2)
+
+        self.assertTrue(all(x >= 50 for x in trace.iters))
+
+
+class SimilarityMatrixTraceTest(TraceTestCase):
+
+    def setUp(self):
+        TraceTestCase.setUp(self)
+
+        random_state = np.random.RandomState(0)
+
+        self.labels = [random_state.randint(0, random_state.randint(1, 8), size=23).tolist() for _ in range(51)]
+
+        self.expected = get_co_clustering_counts(self.labels) / len(self.labels)
+
+    def write(self, trace):
+        trace.open('w')
+
+        for labels in self.labels:
+            trace.update({'labels': labels})
+
+    def test_memory(self):
+        trace = SimilarityMatrixTrace(block_size=5, batch_size=7)
+
+        self.write(trace)
+
+        np.testing.assert_allclose(trace.similarity_matrix, self.expected, rtol=1e-6)
+
+        trace.close()
+
+        np.testing.assert_allclose(trace.similarity_matrix, self.expected, rtol=1e-6)
+
+        self.assertEqual(trace.similarity_matrix.dtype, np.float32)
+
+        self.assertEqual(trace.num_iters, len(self.labels))
+
+    def test_memory_mapped(self):
+        file_name = os.path.join(self.trace_dir, 'sub_dir', 'similarity.npy')
+
+        trace = SimilarityMatrixTrace(file_name=file_name, block_size=4, batch_size=10)
+
+        self.write(trace)
+
+        trace.close()
+
+        np.testing.assert_allclose(np.load(file_name), self.expected, rtol=1e-6)
+
+        # The matrix is not pickled but can be reloaded from the file.
+        trace = pickle.loads(pickle.dumps(trace))
+
+        sim_mat = trace.open('r')
+
+        self.assertTrue(isinstance(sim_mat, np.memmap))
+
+        np.testing.assert_allclose(sim_mat, self.expected, rtol=1e-6)
+
+    def test_get_similarity_matrix(self):
+        trace = SimilarityMatrixTrace(block_size=3)
+
+        self.write(trace)
+
+        out = np.zeros(self.expected.shape, dtype=np.float32)
+
+        self.assertTrue(trace.get_similarity_matrix(out=out) is out)
+
+        np.testing.assert_allclose(out, self.expected, rtol=1e-6)
+
+        # Still accumulating.
+        trace.update({'labels': self.labels[0]})
+
+        expected = get_co_clustering_counts(self.labels + self.labels[:1]) / (len(self.labels) + 1)
+
+        np.testing.assert_allclose(trace.similarity_matrix, expected, rtol=1e-6)
+
+    def test_update_after_close(self):
+        trace = SimilarityMatrixTrace()
+
+        self.write(trace)
+
+        trace.close()
+
+        self.assertRaises(Exception, trace.update, {'labels': self.labels[0]})
+
+        # Opening for writing starts again.
+        self.write(trace)
+
+        trace.close()
+
+        np.testing.assert_allclose(trace.similarity_matrix, self.expected, rtol=1e-6)
+
+    def test_one_cell_per_item(self):
+        # The default initialisation of the samplers puts every item in its own cell.
+        num_items = 200
+
+        random_state = np.random.RandomState(0)
+
+        labels = [list(range(num_items)) for _ in range(10)]
+
+        labels += [random_state.permutation(num_items).tolist() for _ in range(10)]
+
+        labels += [(random_state.randint(0, 10, size=num_items) * num_items + np.arange(num_items) % 2).tolist()
+                   for _ in range(10)]
+
+        trace = SimilarityMatrixTrace(block_size=64, batch_size=30)
+
+        trace.open('w')
+
+        for x in labels:
+            trace.update({'labels': x})
+
+        trace.close()
+
+        np.testing.assert_allclose(trace.similarity_matrix, get_co_clustering_counts(labels) / len(labels), rtol=1e-6)
+
+    def test_number_of_items_changes(self):
+        trace = SimilarityMatrixTrace()
+
+        trace.open('w')
+
+        trace.update({'labels': [0, 1]})
+
+        self.assertRaises(Exception, trace.update, {'labels': [0, 1, 2]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+'''
+Tests for the log space functions and the caches used by Density.log_p.
+
+Created on 2026-10-17
+
+@author: Andrew Roth
+'''
+from math import exp, log
+
+import unittest
+
+import numpy as np
+
+from pydp.data import BetaParameter, BinomialData
+from pydp.utils import IdentityCache, LRUCache, NullCache, log_space_normalise, log_space_normalise_rows, log_sum_exp, \
+    log_sum_exp_rows
+
+
+class CountingFunction(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, data, params):
+        self.calls += 1
+
+        return data.x * params.a
+
+
+class LogSpaceTest(unittest.TestCase):
+
+    def test_log_sum_exp(self):
+        x = [-1000.0, -1001.0, -1002.5]
+
+        expected = -1000 + log(1 + exp(-1) + exp(-2.5))
+
+        self.assertAlmostEqual(log_sum_exp(x), expected)
+
+        self.assertAlmostEqual(log_sum_exp(np.array(x)), expected)
+
+        self.assertTrue(isinstance(log_sum_exp(np.array(x)), float))
+
+        self.assertAlmostEqual(log_sum_exp(np.array([x, x])), expected + log(2))
+
+    def test_log_sum_exp_infinite(self):
+        for x in ([float('-inf')] * 2, [float('-inf'), float('inf')]):
+            self.assertEqual(log_sum_exp(x), max(x))
+
+            self.assertEqual(log_sum_exp(np.array(x)), max(x))
+
+        self.assertAlmostEqual(log_sum_exp(np.array([float('-inf'), 0.0])), 0.0)
+
+    def test_log_space_normalise(self):
+        x = [0.0, log(3), float('-inf')]
+
+        expected = [log(0.25), log(0.75), float('-inf')]
+
+        np.testing.assert_allclose(log_space_normalise(x), expected)
+
+        self.assertEqual(x[0], 0.0)
+
+        y = np.array(x)
+
+        np.testing.assert_allclose(log_space_normalise(y), expected)
+
+        self.assertEqual(y[0], 0.0)
+
+        self.assertTrue(log_space_normalise(y, in_place=True) is y)
+
+        np.testing.assert_allclose(y, expected)
+
+        self.assertTrue(log_space_normalise(x, in_place=True) is x)
+
+        np.testing.assert_allclose(x, expected)
+
+    def test_rows(self):
+        x = np.array([[0.0, log(3)], [-1000.0, -1000.0], [float('-inf'), float('-inf')]])
+
+        expected = [log(4), -1000 + log(2), float('-inf')]
+
+        np.testing.assert_allclose(log_sum_exp_rows(x), expected)
+
+        normalised = log_space_normalise_rows(x[:2])
+
+        np.testing.assert_allclose(np.exp(normalised).sum(axis=1), [1, 1])
+
+        np.testing.assert_allclose(normalised[0], [log(0.25), log(0.75)])
+
+        y = x[:2].copy()
+
+        self.assertTrue(log_space_normalise_rows(y, in_place=True) is y)
+
+        np.testing.assert_allclose(y, normalised)
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        cache = LRUCache()
+
+        func = CountingFunction()
+
+        params = BetaParameter(2, 3)
+
+        for _ in range(3):
+            self.assertEqual(cache.lookup(func, BinomialData(1, 10), params, None), 2)
+
+        self.assertEqual(func.calls, 1)
+
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        # Equal values share an entry.
+        cache.lookup(func, BinomialData(1, 10), BetaParameter(2, 3), None)
+
+        self.assertEqual(func.calls, 1)
+
+        # Global parameters are part of the key.
+        cache.lookup(func, BinomialData(1, 10), params, 'other')
+
+        self.assertEqual(func.calls, 2)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+
+        func = CountingFunction()
+
+        params = BetaParameter(1, 1)
+
+        a, b, c = [BinomialData(x, 10) for x in range(3)]
+
+        cache.lookup(func, a, params, None)
+
+        cache.lookup(func, b, params, None)
+
+        # Using a makes b the least recently used entry.
+        cache.lookup(func, a, params, None)
+
+        cache.lookup(func, c, params, None)
+
+        self.assertEqual(len(cache), 2)
+
+        calls = func.calls
+
+        cache.lookup(func, a, params, None)
+
+        cache.lookup(func, c, params, None)
+
+        self.assertEqual(func.calls, calls)
+
+        cache.lookup(func, b, params, None)
+
+        self.assertEqual(func.calls, calls + 1)
+
+    def test_byte_limit(self):
+        cache = LRUCache(max_size=None, max_bytes=2000)
+
+        func = CountingFunction()
+
+        params = BetaParameter(1, 1)
+
+        for x in range(1000):
+            cache.lookup(func, BinomialData(x, 1000), params, None)
+
+            self.assertTrue(0 < cache.size_bytes <= 2000)
+
+        self.assertTrue(0 < len(cache) < 1000)
+
+        # The most recent entries are kept.
+        calls = func.calls
+
+        cache.lookup(func, BinomialData(999, 1000), params, None)
+
+        self.assertEqual(func.calls, calls)
+
+        cache.clear()
+
+        self.assertEqual((len(cache), cache.size_bytes, cache.hits, cache.misses), (0, 0, 0, 0))
+
+    def test_sizes_not_measured_without_byte_limit(self):
+        for cache in (LRUCache(), IdentityCache()):
+            cache.lookup(CountingFunction(), BinomialData(1, 10), BetaParameter(1, 1), None)
+
+            self.assertEqual(cache.size_bytes, 0)
+
+
+class IdentityCacheTest(unittest.TestCase):
+
+    def test_keyed_by_identity(self):
+        cache = IdentityCache()
+
+        func = CountingFunction()
+
+        data = BinomialData(1, 10)
+
+        params = BetaParameter(2, 3)
+
+        cache.lookup(func, data, params, None)
+
+        cache.lookup(func, data, params, None)
+
+        self.assertEqual(func.calls, 1)
+
+        cache.lookup(func, data, BetaParameter(2, 3), None)
+
+        self.assertEqual(func.calls, 2)
+
+
+class NullCacheTest(unittest.TestCase):
+
+    def test_never_hits(self):
+        cache = NullCache()
+
+        func = CountingFunction()
+
+        for _ in range(3):
+            cache.lookup(func, BinomialData(1, 10), BetaParameter(1, 1), None)
+
+        self.assertEqual(func.calls, 3)
+
+        self.assertEqual(cache.hit_rate, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+'''
+Tests for the vector valued atom samplers.
+
+Created on 2026-10-17
+
+@author: Andrew Roth
+'''
+from collections import OrderedDict
+
+import unittest
+
+from pydp.base_measures import BetaBaseMeasure
+from pydp.data import BinomialData
+from pydp.densities import BinomialDensity
+from pydp.partition import Partition
+from pydp.rvs import RandomStream
+from pydp.samplers.atom import BaseMeasureAtomSampler, BetaBinomialGibbsAtomSampler
+from pydp.sufficient_statistics import BinomialSufficientStatistics
+from pydp.vector import VectorAtomSampler, VectorBaseMeasure, VectorDensity
+
+SAMPLE_IDS = ('a', 'b')
+
+
+class CountingBinomialDensity(BinomialDensity):
+
+    def __init__(self):
+        BinomialDensity.__init__(self)
+
+        self.calls = 0
+
+    def log_p_sum(self, data, items, params):
+        self.calls += 1
+
+        return BinomialDensity.log_p_sum(self, data, items, params)
+
+
+class VectorAtomSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = RandomStream(0)
+
+        base_measures = OrderedDict((x, BetaBaseMeasure(1, 1)) for x in SAMPLE_IDS)
+
+        densities = OrderedDict((x, BinomialDensity()) for x in SAMPLE_IDS)
+
+        atom_samplers = OrderedDict((x, BetaBinomialGibbsAtomSampler(base_measures[x], densities[x], rng=self.rng))
+                                    for x in SAMPLE_IDS)
+
+        self.base_measure = VectorBaseMeasure(base_measures)
+
+        self.sampler = VectorAtomSampler(self.base_measure, VectorDensity(densities), atom_samplers, rng=self.rng)
+
+        self.data = [{'a': BinomialData(i, 10), 'b': BinomialData(10 - i, 20)} for i in range(6)]
+
+        self.partition = Partition()
+
+        for _ in range(2):
+            self.partition.add_cell(self.base_measure.random(rng=self.rng))
+
+        for item in range(len(self.data)):
+            self.partition.add_item(item, item % 2)
+
+    def get_statistics(self, cell):
+        return dict((x, cell._statistics[(BinomialSufficientStatistics, x)]) for x in SAMPLE_IDS)
+
+    def check_statistics(self, cell):
+        statistics = self.get_statistics(cell)
+
+        for x in SAMPLE_IDS:
+            self.assertEqual(statistics[x].x, sum(self.data[item][x].x for item in cell.items))
+
+            self.assertEqual(statistics[x].n, sum(self.data[item][x].n for item in cell.items))
+
+    def test_statistics_attached_to_cells(self):
+        self.sampler.sample(self.data, self.partition)
+
+        statistics = [self.get_statistics(cell) for cell in self.partition.cells]
+
+        for cell in self.partition.cells:
+            self.check_statistics(cell)
+
+            self.assertEqual(list(cell.value.keys()), list(SAMPLE_IDS))
+
+        # Moving an item updates the attached statistics, which are reused by the next call.
+        self.partition.remove_item(0, 0)
+
+        self.partition.add_item(0, 1)
+
+        self.sampler.sample(self.data, self.partition)
+
+        for cell, cell_statistics in zip(self.partition.cells, statistics):
+            self.check_statistics(cell)
+
+            for x in SAMPLE_IDS:
+                self.assertTrue(self.get_statistics(cell)[x] is cell_statistics[x])
+
+    def test_sample_data_reused(self):
+        self.sampler.sample(self.data, self.partition)
+
+        sample_data = self.sampler._get_sample_data(self.data)
+
+        self.assertEqual(sample_data['b'], [x['b'] for x in self.data])
+
+        self.sampler.sample(self.data, self.partition)
+
+        self.assertTrue(self.sampler._get_sample_data(self.data) is sample_data)
+
+        # A new data list is split again.
+        data = list(self.data)
+
+        self.assertFalse(self.sampler._get_sample_data(data) is sample_data)
+
+    def test_removed_cells_dropped(self):
+        self.sampler.sample(self.data, self.partition)
+
+        old_cell = self.partition.cells[1]
+
+        for item in (1, 3, 5):
+            self.partition.remove_item(item, 1)
+
+            self.partition.add_item(item, 0)
+
+        self.partition.remove_empty_cells()
+
+        self.sampler.sample(self.data, self.partition)
+
+        self.assertEqual(list(self.sampler._cell_views.keys()), self.partition.cells)
+
+        self.assertFalse(old_cell in self.sampler._cell_views)
+
+        self.check_statistics(self.partition.cells[0])
+
+
+class VectorMetropolisHastingsAtomSamplerTest(unittest.TestCase):
+
+    def test_log_likelihood_cached(self):
+        rng = RandomStream(0)
+
+        base_measures = OrderedDict((x, BetaBaseMeasure(1, 1)) for x in SAMPLE_IDS)
+
+        densities = OrderedDict((x, CountingBinomialDensity()) for x in SAMPLE_IDS)
+
+        atom_samplers = OrderedDict((x, BaseMeasureAtomSampler(base_measures[x], densities[x], rng=rng))
+                                    for x in SAMPLE_IDS)
+
+        base_measure = VectorBaseMeasure(base_measures)
+
+        sampler = VectorAtomSampler(base_measure, VectorDensity(densities), atom_samplers, rng=rng)
+
+        data = [{'a': BinomialData(i, 10), 'b': BinomialData(10 - i, 20)} for i in range(6)]
+
+        partition = Partition()
+
+        for _ in range(2):
+            partition.add_cell(base_measure.random(rng=rng))
+
+        for item in range(len(data)):
+            partition.add_item(item, item % 2)
+
+        num_iters = 20
+
+        for _ in range(num_iters):
+            sampler.sample(data, partition)
+
+        # Each dimension of each cell evaluates its proposal every iteration, and the current value only once.
+        for density in densities.values():
+            self.assertEqual(density.calls, partition.number_of_cells * (num_iters + 1))
+
+        # The cached values match the current values of the cells.
+        for cell in partition.cells:
+            for x in SAMPLE_IDS:
+                view = sampler._cell_views[cell][x]
+
+                sample_data = [y[x] for y in data]
+
+                self.assertAlmostEqual(view.get_log_likelihood(sampler._get_sample_data(data)[x], densities[x]),
+                                       BinomialDensity().log_p_sum(sample_data, cell.items, cell.value[x]))
+
+        # Moving an item invalidates the cache.
+        partition.remove_item(0, 0)
+
+        partition.add_item(0, 1)
+
+        calls = densities['a'].calls
+
+        sampler.sample(data, partition)
+
+        self.assertEqual(densities['a'].calls, calls + 2 * partition.number_of_cells)
+
+
+if __name__ == '__main__':
+    unittest.main()
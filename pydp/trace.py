@@ -14,17 +14,678 @@ Created on 2012-05-10
 
 @author: Andrew
 '''
+from array import array
+from collections import deque
+
 import bz2
 import csv
 import os
+import struct
+import threading
+
+try:
+    import queue
+
+except ImportError:
+    import Queue as queue
+
+from pydp.rvs import get_rng
+
+try:
+    import numpy as np
+
+except ImportError:
+    np = None
 
 
 class Trace(object):
 
+    # Fields of the state recorded by the trace. Samplers only need to snapshot these fields. None means all fields.
+    fields = None
+
+    def accept(self):
+        '''
+        Called by the sampler once per iteration before update. If False the state of the iteration is not recorded so
+        the sampler does not need to build it and update is not called.
+        '''
+        return True
+
+    def close(self):
+        pass
+
+    def open(self, mode='r'):
+        pass
+
     def update(self, state):
         raise NotImplemented
 
 
+class AsyncTrace(Trace):
+    '''
+    Wrapper which writes states to another trace from a background thread.
+
+    States are passed to the thread through a bounded queue, so update only blocks when the writer falls max_queue_size
+    states behind. Work such as compression in the wrapped trace then overlaps with sampling. close waits for all queued
+    states to be written before closing the wrapped trace. An error raised by the wrapped trace is re-raised by the next
+    call to update or close.
+
+    The states must not be modified after they are passed to update, which holds for DirichletProcessSampler.state.
+
+    Args:
+        trace : (Trace) Trace to write to.
+
+    Kwargs:
+        max_queue_size : (int) Maximum number of states waiting to be written.
+    '''
+
+    def __init__(self, trace, max_queue_size=100):
+        self.trace = trace
+
+        self.max_queue_size = max_queue_size
+
+        self._queue = None
+
+        self._thread = None
+
+        self._error = None
+
+    @property
+    def fields(self):
+        return getattr(self.trace, 'fields', None)
+
+    def accept(self):
+        return _accept(self.trace)
+
+    def __getattr__(self, name):
+        # Give access to the recorded values of the wrapped trace, e.g. MemoryTrace.labels.
+        if name == 'trace':
+            raise AttributeError(name)
+
+        return getattr(self.trace, name)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        state['_queue'] = None
+
+        state['_thread'] = None
+
+        return state
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+
+            self._thread.join()
+
+            self._queue = None
+
+            self._thread = None
+
+        self.trace.close()
+
+        self._raise_error()
+
+    def open(self, mode='r'):
+        self.trace.open(mode)
+
+        if mode == 'w':
+            self._error = None
+
+            self._queue = queue.Queue(maxsize=self.max_queue_size)
+
+            self._thread = threading.Thread(target=self._write)
+
+            self._thread.daemon = True
+
+            self._thread.start()
+
+    def update(self, state):
+        self._raise_error()
+
+        if self._thread is None:
+            raise Exception('The trace must be opened for writing before it is updated.')
+
+        self._queue.put(state)
+
+    def _raise_error(self):
+        if self._error is not None:
+            error = self._error
+
+            self._error = None
+
+            raise error
+
+    def _write(self):
+        while True:
+            state = self._queue.get()
+
+            if state is _STOP:
+                break
+
+            # After an error keep draining the queue so update does not block.
+            if self._error is not None:
+                continue
+
+            try:
+                self.trace.update(state)
+
+            except Exception as e:
+                self._error = e
+
+
+_STOP = object()
+
+
+class TraceFilter(Trace):
+    '''
+    Base class for wrappers which only pass some iterations on to another trace.
+
+    Filters can be nested and each filter only sees the iterations passed on by the filters around it, so
+    BurnInTrace(ThinnedTrace(trace, 10), 1000) drops the first 1000 iterations then keeps every 10th iteration after
+    that. The sampler does not build the state of dropped iterations.
+
+    Args:
+        trace : (Trace) Trace to write to.
+    '''
+
+    def __init__(self, trace):
+        self.trace = trace
+
+        self.num_iters = 0
+
+    @property
+    def fields(self):
+        return getattr(self.trace, 'fields', None)
+
+    def __getattr__(self, name):
+        # Give access to the recorded values of the wrapped trace, e.g. MemoryTrace.labels.
+        if name == 'trace':
+            raise AttributeError(name)
+
+        return getattr(self.trace, name)
+
+    def accept(self):
+        keep = self._keep(self.num_iters)
+
+        self.num_iters += 1
+
+        return keep and _accept(self.trace)
+
+    def close(self):
+        self.trace.close()
+
+    def open(self, mode='r'):
+        if mode == 'w':
+            self.num_iters = 0
+
+        self.trace.open(mode)
+
+    def update(self, state):
+        self.trace.update(state)
+
+    def _keep(self, i):
+        '''
+        Whether to keep the i-th iteration seen by the filter.
+        '''
+        raise NotImplemented
+
+
+class BurnInTrace(TraceFilter):
+    '''
+    Drop the first burnin iterations.
+    '''
+
+    def __init__(self, trace, burnin):
+        TraceFilter.__init__(self, trace)
+
+        self.burnin = burnin
+
+    def _keep(self, i):
+        return i >= self.burnin
+
+
+class ThinnedTrace(TraceFilter):
+    '''
+    Keep every thin-th iteration, starting with the last iteration of the first thin iterations.
+    '''
+
+    def __init__(self, trace, thin):
+        TraceFilter.__init__(self, trace)
+
+        self.thin = thin
+
+    def _keep(self, i):
+        return (i + 1) % self.thin == 0
+
+
+class ReservoirTrace(TraceFilter):
+    '''
+    Keep a uniform random sample of size iterations using reservoir sampling (algorithm R).
+
+    The kept states are held in memory and passed to the wrapped trace in iteration order when the trace is closed.
+    The slot chosen by each accept is queued until the matching update, so the filter can be wrapped by AsyncTrace which
+    calls update from another thread after later calls to accept.
+
+    Args:
+        trace : (Trace) Trace to write to.
+
+        size : (int) Number of iterations to keep.
+
+    Kwargs:
+        rng : (RandomStream) Stream of random numbers. If None the default stream is used.
+    '''
+
+    def __init__(self, trace, size, rng=None):
+        TraceFilter.__init__(self, trace)
+
+        self.size = size
+
+        self.rng = rng
+
+        self._reservoir = []
+
+        self._slots = deque()
+
+    def accept(self):
+        i = self.num_iters
+
+        self.num_iters += 1
+
+        if i < self.size:
+            slot = i
+
+        else:
+            slot = get_rng(self.rng).randrange(i + 1)
+
+            if slot >= self.size:
+                return False
+
+        self._slots.append((i, slot))
+
+        return True
+
+    def close(self):
+        for _, state in sorted(self._reservoir, key=lambda x: x[0]):
+            if _accept(self.trace):
+                self.trace.update(state)
+
+        self._reservoir = []
+
+        self.trace.close()
+
+    def open(self, mode='r'):
+        if mode == 'w':
+            self._reservoir = []
+
+            self._slots = deque()
+
+        TraceFilter.open(self, mode)
+
+    def update(self, state):
+        i, slot = self._slots.popleft()
+
+        if slot == len(self._reservoir):
+            self._reservoir.append((i, state))
+
+        else:
+            self._reservoir[slot] = (i, state)
+
+
+def _accept(trace):
+    accept = getattr(trace, 'accept', None)
+
+    return accept is None or accept()
+
+
+class DeltaLabelTrace(Trace):
+    '''
+    Trace of the labels which stores each iteration as the (item, label) pairs which changed since the previous
+    iteration, with the full labels stored every keyframe_interval iterations.
+
+    Records are written as native int arrays to <trace_dir>/<file_name>.delta. A record starts with its type (0 for a
+    keyframe, 1 for a delta) and length, followed by the labels or by interleaved items and labels. The byte offset of
+    each record is written to <trace_dir>/<file_name>.index so any iteration can be reconstructed by reading at most
+    keyframe_interval records.
+
+    After open('r') the trace has a length, get(i) returns the labels of iteration i and iterating yields the labels of
+    each iteration in order.
+
+    Args:
+        trace_dir : (str) Directory to write the files to.
+
+    Kwargs:
+        keyframe_interval : (int) Number of iterations between full copies of the labels.
+
+        file_name : (str) Name of the files without extension.
+    '''
+
+    fields = ('labels',)
+
+    def __init__(self, trace_dir, keyframe_interval=100, file_name='labels'):
+        self.trace_dir = trace_dir
+
+        self.keyframe_interval = keyframe_interval
+
+        self.data_file = os.path.join(trace_dir, '{0}.delta'.format(file_name))
+
+        self.index_file = os.path.join(trace_dir, '{0}.index'.format(file_name))
+
+        self._data_fh = None
+
+        self._index_fh = None
+
+        self._offsets = None
+
+        self._labels = None
+
+        self._num_iters = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        state['_data_fh'] = None
+
+        state['_index_fh'] = None
+
+        return state
+
+    def __iter__(self):
+        labels = None
+
+        self._data_fh.seek(0)
+
+        for _ in range(len(self)):
+            labels = self._read_record(labels)
+
+            yield list(labels)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def close(self):
+        for fh in (self._data_fh, self._index_fh):
+            if fh is not None:
+                fh.close()
+
+        self._data_fh = None
+
+        self._index_fh = None
+
+        self._offsets = None
+
+        self._labels = None
+
+    def get(self, i):
+        '''
+        Return the labels of iteration i.
+        '''
+        keyframe = i - (i % self.keyframe_interval)
+
+        self._data_fh.seek(self._offsets[keyframe])
+
+        record_type, size = self._read_ints(2)
+
+        if record_type != 0:
+            raise Exception('Record {0} is not a keyframe. Check keyframe_interval matches the written trace.'.format(
+                keyframe))
+
+        labels = self._read_ints(size)
+
+        for _ in range(keyframe, i):
+            labels = self._read_record(labels)
+
+        return list(labels)
+
+    def open(self, mode='r'):
+        if mode == 'w':
+            if not os.path.exists(self.trace_dir):
+                os.makedirs(self.trace_dir)
+
+            self._data_fh = open(self.data_file, 'wb')
+
+            self._index_fh = open(self.index_file, 'wb')
+
+            self._labels = None
+
+            self._num_iters = 0
+
+        elif mode == 'r':
+            with open(self.index_file, 'rb') as fh:
+                index = fh.read()
+
+            self._offsets = struct.unpack('<{0}q'.format(len(index) // 8), index)
+
+            self._data_fh = open(self.data_file, 'rb')
+
+        else:
+            raise Exception('Mode {0} is not supported. Use \'r\' or \'w\'.'.format(mode))
+
+    def update(self, state):
+        labels = array('i', state['labels'])
+
+        self._index_fh.write(struct.pack('<q', self._data_fh.tell()))
+
+        if self._num_iters % self.keyframe_interval == 0 or self._labels is None or len(labels) != len(self._labels):
+            array('i', [0, len(labels)]).tofile(self._data_fh)
+
+            labels.tofile(self._data_fh)
+
+        else:
+            changes = array('i')
+
+            for item, (old, new) in enumerate(zip(self._labels, labels)):
+                if old != new:
+                    changes.append(item)
+
+                    changes.append(new)
+
+            array('i', [1, len(changes) // 2]).tofile(self._data_fh)
+
+            changes.tofile(self._data_fh)
+
+        self._labels = labels
+
+        self._num_iters += 1
+
+    def _read_ints(self, n):
+        values = array('i')
+
+        values.fromfile(self._data_fh, n)
+
+        return values
+
+    def _read_record(self, labels):
+        record_type, size = self._read_ints(2)
+
+        if record_type == 0:
+            return self._read_ints(size)
+
+        changes = self._read_ints(2 * size)
+
+        for item, label in zip(changes[::2], changes[1::2]):
+            labels[item] = label
+
+        return labels
+
+
+class SimilarityMatrixTrace(Trace):
+    '''
+    Trace which accumulates the posterior similarity matrix, the fraction of iterations in which each pair of items
+    shares a cell, without storing the labels.
+
+    The labels are buffered for batch_size iterations. The counts are then updated block_size rows at a time by
+    comparing the labels of the items in the block to the labels of all items for each buffered iteration, so the
+    matrix is only read and written once per batch. The temporary memory is a block_size x items boolean array whatever
+    the number of cells. The counts are stored as float32 which is exact for up to 2^24 iterations.
+
+    If file_name is given the matrix is a memory mapped .npy file so it does not need to fit in memory. On close the
+    counts are divided by the number of iterations, so the file holds the similarity matrix and open('r') maps it back.
+
+    Kwargs:
+        file_name : (str) Path of the .npy file to store the matrix in. If None the matrix is kept in memory.
+
+        block_size : (int) Number of rows of the matrix to update at once.
+
+        batch_size : (int) Number of iterations to buffer between updates of the matrix.
+    '''
+
+    fields = ('labels',)
+
+    def __init__(self, file_name=None, block_size=1000, batch_size=10):
+        if np is None:
+            raise ImportError('NumPy is required for SimilarityMatrixTrace.')
+
+        self.file_name = file_name
+
+        self.block_size = block_size
+
+        self.batch_size = batch_size
+
+        self.num_iters = 0
+
+        self._buffer = []
+
+        self._counts = None
+
+        self._normalised = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        if self.file_name is not None:
+            state['_counts'] = None
+
+        return state
+
+    @property
+    def similarity_matrix(self):
+        '''
+        (items x items) array with the fraction of iterations in which each pair of items was in the same cell.
+
+        After close this is the stored matrix and is free to access. Before close a new dense copy is normalised on each
+        access, use get_similarity_matrix to write it to an existing array instead.
+        '''
+        if self._normalised:
+            return self._counts
+
+        return self.get_similarity_matrix()
+
+    def get_similarity_matrix(self, out=None):
+        '''
+        Normalise the current co-clustering counts without closing the trace.
+
+        Kwargs:
+            out : (array) (items x items) array, such as a np.memmap, to write the matrix to block_size rows at a time.
+                          If None a new float32 array is allocated.
+
+        Returns:
+            sim_mat : (array) The similarity matrix, out if given.
+        '''
+        self._flush()
+
+        if self._counts is None:
+            return None
+
+        if out is None:
+            out = np.empty(self._counts.shape, dtype=np.float32)
+
+        for start in range(0, self._counts.shape[0], self.block_size):
+            block = self._counts[start:start + self.block_size]
+
+            if self._normalised:
+                out[start:start + self.block_size] = block
+
+            else:
+                np.divide(block, self.num_iters, out=out[start:start + self.block_size])
+
+        return out
+
+    def close(self):
+        self._flush()
+
+        if self._counts is not None and not self._normalised and self.num_iters > 0:
+            for start in range(0, self._counts.shape[0], self.block_size):
+                self._counts[start:start + self.block_size] /= self.num_iters
+
+            self._normalised = True
+
+        if isinstance(self._counts, np.memmap):
+            self._counts.flush()
+
+    def open(self, mode='r'):
+        '''
+        Open the trace for writing ('w') or reading ('r'). In read mode the similarity matrix is returned, memory mapped
+        if the trace has a file.
+        '''
+        if mode == 'w':
+            self.num_iters = 0
+
+            self._buffer = []
+
+            self._counts = None
+
+            self._normalised = False
+
+        elif mode == 'r':
+            if self.file_name is not None:
+                self._counts = np.load(self.file_name, mmap_mode='r')
+
+                self._normalised = True
+
+            return self.similarity_matrix
+
+        else:
+            raise Exception('Mode {0} is not supported. Use \'r\' or \'w\'.'.format(mode))
+
+    def update(self, state):
+        if self._normalised:
+            raise Exception('The similarity matrix has been normalised. Open the trace with mode \'w\' to start again.')
+
+        labels = np.array(state['labels'], dtype=np.int64)
+
+        if self._counts is None:
+            self._counts = self._allocate(len(labels))
+
+        elif len(labels) != self._counts.shape[0]:
+            raise Exception('Labels have {0} items but previous labels had {1}.'.format(
+                len(labels), self._counts.shape[0]))
+
+        self._buffer.append(labels)
+
+        self.num_iters += 1
+
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+
+    def _allocate(self, num_items):
+        shape = (num_items, num_items)
+
+        if self.file_name is None:
+            return np.zeros(shape, dtype=np.float32)
+
+        trace_dir = os.path.dirname(self.file_name)
+
+        if trace_dir and not os.path.exists(trace_dir):
+            os.makedirs(trace_dir)
+
+        return np.lib.format.open_memmap(self.file_name, mode='w+', dtype=np.float32, shape=shape)
+
+    def _flush(self):
+        if len(self._buffer) == 0:
+            return
+
+        num_items = self._counts.shape[0]
+
+        for start in range(0, num_items, self.block_size):
+            block = self._counts[start:start + self.block_size]
+
+            for labels in self._buffer:
+                block += labels[start:start + self.block_size, np.newaxis] == labels[np.newaxis, :]
+
+        self._buffer = []
+
+
 class DiskTrace(object):
 
     def __init__(self, trace_dir, params, column_names=None, file_name_map=None):
@@ -49,6 +710,10 @@ class DiskTrace(object):
 
         self._writers = {}
 
+    @property
+    def fields(self):
+        return _get_fields(self.params)
+
     def close(self):
         for param_name in self.params:
             self._fhs[param_name].close()
@@ -84,17 +749,238 @@ class DiskTrace(object):
 
 
 class MemoryTrace(Trace):
+    '''
+    Trace which keeps the alpha, labels and cell values of each iteration in memory.
+
+    Only the values of the cells are stored, not a copy for every item, and the per item values in params are built when
+    they are accessed.
+    '''
+
+    fields = ('alpha', 'labels', 'cell_values')
 
     def __init__(self):
         self.alpha = []
 
         self.labels = []
 
-        self.params = []
+        self.cell_values = []
+
+    @property
+    def params(self):
+        return [[values[x] for x in labels] for labels, values in zip(self.labels, self.cell_values)]
 
     def update(self, state):
         self.alpha.append(state['alpha'])
 
         self.labels.append(state['labels'])
 
-        self.params.append(state['params'])
+        if 'cell_values' in state:
+            self.cell_values.append(state['cell_values'])
+
+        else:
+            cell_values = {}
+
+            for label, value in zip(state['labels'], state['params']):
+                cell_values[label] = value
+
+            self.cell_values.append([cell_values[x] for x in range(len(cell_values))])
+
+
+class BinaryTrace(Trace):
+    '''
+    Trace which writes each parameter to a single .npy file with one fixed width row per iteration.
+
+    Rows are buffered and appended in chunks of chunk_size iterations. The .npy header has a fixed size and is rewritten
+    with the final number of iterations on close, so the files are uncompressed to allow them to be memory mapped when
+    the trace is opened for reading.
+
+    Args:
+        trace_dir : (str) Directory to write the files to.
+
+        params : (list) Names of the parameters to record. 'alpha' and 'labels' are taken from the state directly,
+                        anything else is read from the value of each item in state['params'].
+
+    Kwargs:
+        file_name_map : (dict) Mapping of parameter names to file names, without the .npy extension.
+
+        chunk_size : (int) Number of iterations to buffer before writing to disk.
+    '''
+
+    def __init__(self, trace_dir, params, file_name_map=None, chunk_size=100):
+        if np is None:
+            raise ImportError('NumPy is required for BinaryTrace.')
+
+        self.trace_dir = trace_dir
+
+        self.params = params
+
+        self.chunk_size = chunk_size
+
+        self.trace_files = {}
+
+        for param_name in self.params:
+            if file_name_map is not None and param_name in file_name_map:
+                file_name = file_name_map[param_name]
+
+            else:
+                file_name = param_name
+
+            self.trace_files[param_name] = os.path.join(trace_dir, '{0}.npy'.format(file_name))
+
+        self._mode = None
+
+        self._fhs = {}
+
+        self._buffers = {}
+
+        self._row_shapes = {}
+
+        self._num_rows = {}
+
+        self._arrays = {}
+
+    @property
+    def fields(self):
+        return _get_fields(self.params)
+
+    def __getitem__(self, param_name):
+        '''
+        Return the (iterations x items) array of a parameter. Only valid in read mode.
+        '''
+        return self._arrays[param_name]
+
+    def close(self):
+        if self._mode == 'w':
+            for param_name in self.params:
+                self._flush(param_name)
+
+                self._write_header(param_name)
+
+                self._fhs[param_name].close()
+
+        self._mode = None
+
+        self._fhs = {}
+
+        self._buffers = {}
+
+        self._arrays = {}
+
+    def open(self, mode='r'):
+        '''
+        Open the trace for writing ('w') or reading ('r'). In read mode a dictionary of memory mapped arrays, one per
+        parameter, is returned.
+        '''
+        if mode == 'w':
+            if not os.path.exists(self.trace_dir):
+                os.makedirs(self.trace_dir)
+
+            for param_name in self.params:
+                self._fhs[param_name] = open(self.trace_files[param_name], 'wb')
+
+                self._buffers[param_name] = []
+
+                self._row_shapes[param_name] = None
+
+                self._num_rows[param_name] = 0
+
+                self._write_header(param_name)
+
+        elif mode == 'r':
+            for param_name in self.params:
+                self._arrays[param_name] = np.load(self.trace_files[param_name], mmap_mode='r')
+
+        else:
+            raise Exception('Mode {0} is not supported. Use \'r\' or \'w\'.'.format(mode))
+
+        self._mode = mode
+
+        if mode == 'r':
+            return dict(self._arrays)
+
+    def update(self, state):
+        for param_name in self.params:
+            if param_name == 'alpha':
+                row = state['alpha']
+
+            elif param_name == 'labels':
+                row = state['labels']
+
+            else:
+                row = [getattr(x, param_name) for x in state['params']]
+
+            row = np.asarray(row, dtype=self._get_dtype(param_name))
+
+            if self._row_shapes[param_name] is None:
+                self._row_shapes[param_name] = row.shape
+
+            elif row.shape != self._row_shapes[param_name]:
+                raise Exception('Row for {0} has shape {1} but previous rows had shape {2}.'.format(
+                    param_name, row.shape, self._row_shapes[param_name]))
+
+            self._buffers[param_name].append(row)
+
+            if len(self._buffers[param_name]) >= self.chunk_size:
+                self._flush(param_name)
+
+    def _flush(self, param_name):
+        buffer = self._buffers[param_name]
+
+        if len(buffer) == 0:
+            return
+
+        self._fhs[param_name].write(np.ascontiguousarray(buffer).tobytes())
+
+        self._num_rows[param_name] += len(buffer)
+
+        self._buffers[param_name] = []
+
+    def _get_dtype(self, param_name):
+        if param_name == 'labels':
+            return np.int32
+
+        return np.float64
+
+    def _write_header(self, param_name):
+        row_shape = self._row_shapes[param_name]
+
+        if row_shape is None:
+            row_shape = ()
+
+        shape = tuple(int(x) for x in (self._num_rows[param_name],) + row_shape)
+
+        header = "{{'descr': {0!r}, 'fortran_order': False, 'shape': {1!r}, }}".format(
+            str(np.lib.format.dtype_to_descr(np.dtype(self._get_dtype(param_name)))), shape)
+
+        # Magic string, version and header length take 10 bytes and the header ends with a new line.
+        header = header.ljust(_NPY_HEADER_SIZE - 11) + '\n'
+
+        fh = self._fhs[param_name]
+
+        position = fh.tell()
+
+        fh.seek(0)
+
+        fh.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+        if position > 0:
+            fh.seek(position)
+
+
+_NPY_HEADER_SIZE = 128
+
+
+def _get_fields(params):
+    '''
+    State fields needed to record the given trace parameters.
+    '''
+    fields = []
+
+    for param_name in params:
+        if param_name in ('alpha', 'labels'):
+            fields.append(param_name)
+
+        elif 'params' not in fields:
+            fields.append('params')
+
+    return fields
@@ -20,6 +20,13 @@ from collections import OrderedDict
 from math import exp, isinf, log
 
 import functools
+import sys
+
+try:
+    import numpy as np
+
+except ImportError:
+    np = None
 
 #=======================================================================================================================
 # Log space functions
@@ -30,33 +37,94 @@ def log_sum_exp(log_X):
     '''
     Given a list of values in log space, log_X. Compute exp(log_X[0] + log_X[1] + ... log_X[n])
 
-    Numerically safer than naive method.
+    Numerically safer than naive method. NumPy arrays are reduced with NumPy, anything else with a pure Python loop.
     '''
+    if np is not None and isinstance(log_X, np.ndarray):
+        return float(_log_sum_exp_array(log_X.ravel()))
+
     max_exp = max(log_X)
 
     if isinf(max_exp):
         return max_exp
 
-    total = 0
-
-    for x in log_X:
-        total += exp(x - max_exp)
+    total = sum([exp(x - max_exp) for x in log_X])
 
     return log(total) + max_exp
 
 
-def log_space_normalise(log_X):
+def log_space_normalise(log_X, in_place=False):
     '''
     Given a list of values in log space return the values normalised such that exp(log_X[0]) + exp(log_X[1]) + ... = 1
-    '''
-    normalised_log_X = []
 
+    Kwargs:
+        in_place : (bool) Whether to overwrite log_X, which must be a list or a float NumPy array, rather than allocate
+                          a new list or array.
+    '''
     log_norm_const = log_sum_exp(log_X)
 
-    for x in log_X:
-        normalised_log_X.append(x - log_norm_const)
+    if np is not None and isinstance(log_X, np.ndarray):
+        if in_place:
+            log_X -= log_norm_const
+
+            return log_X
+
+        return log_X - log_norm_const
+
+    if in_place:
+        for i, x in enumerate(log_X):
+            log_X[i] = x - log_norm_const
+
+        return log_X
+
+    return [x - log_norm_const for x in log_X]
+
+
+def log_sum_exp_rows(log_X):
+    '''
+    Compute log_sum_exp of each row of a 2-D NumPy array, i.e. of an (items x cells) matrix of log scores.
+
+    Returns:
+        (array) Array with one value per row.
+    '''
+    if np is None:
+        raise ImportError('NumPy is required for row-wise log space functions.')
+
+    return _log_sum_exp_array(np.asarray(log_X, dtype=float), axis=1)
+
+
+def log_space_normalise_rows(log_X, in_place=False):
+    '''
+    Normalise each row of a 2-D NumPy array of log values so the exponentiated values of each row sum to one.
+
+    Kwargs:
+        in_place : (bool) Whether to overwrite log_X, which must be a float NumPy array.
+    '''
+    log_norm_const = log_sum_exp_rows(log_X)[:, np.newaxis]
+
+    if in_place:
+        log_X -= log_norm_const
+
+        return log_X
+
+    return log_X - log_norm_const
+
+
+def _log_sum_exp_array(log_X, axis=None):
+    max_exp = log_X.max(axis=axis)
+
+    if axis is None:
+        if isinf(max_exp):
+            return max_exp
+
+        return max_exp + np.log(np.exp(log_X - max_exp).sum())
+
+    # Rows where every value is -inf (or the max is inf) are shifted by zero so they return the max.
+    shift = np.where(np.isinf(max_exp), 0, max_exp)
+
+    with np.errstate(divide='ignore'):
+        log_total = np.log(np.exp(log_X - np.expand_dims(shift, axis)).sum(axis=axis))
 
-    return normalised_log_X
+    return np.where(np.isinf(max_exp), max_exp, log_total + shift)
 
 #=======================================================================================================================
 # Integration
@@ -64,47 +132,52 @@ def log_space_normalise(log_X):
 
 
 class Integrator(object):
+    '''
+    Base class for integrators over a fixed grid of knots on [a, b].
+
+    Kwargs:
+        vectorised : (bool) Whether the function to integrate can be called once with a NumPy array of the knots.
+    '''
+
+    def __init__(self, a=0, b=1, mesh_size=100, vectorised=False):
+        if vectorised and np is None:
+            raise ImportError('NumPy is required for vectorised integration.')
 
-    def __init__(self, a=0, b=1, mesh_size=100):
         self.a = a
         self.b = b
         self.mesh_size = mesh_size
 
+        self.vectorised = vectorised
+
         self.step_size = (b - a) / mesh_size
 
         self.knots = [i * self.step_size + a for i in range(0, mesh_size + 1)]
 
+        if vectorised:
+            self._knots = np.array(self.knots)
+
 
 class SimpsonsRuleIntegrator(Integrator):
 
-    def __init__(self, a=0, b=1, mesh_size=100):
+    def __init__(self, a=0, b=1, mesh_size=100, vectorised=False):
         if mesh_size % 2 != 0:
             raise Exception("Mesh size for Simpson's rule must be an even number.")
 
-        Integrator.__init__(self, a, b, mesh_size)
-
-    def log_integrate(self, log_f):
-        log_total = []
-
-        # First and last terms.
-        log_total.append(log_f(self.knots[0]))
-        log_total.append(log_f(self.knots[-1]))
-
-        four_total = []
+        Integrator.__init__(self, a, b, mesh_size, vectorised=vectorised)
 
-        for i in range(1, self.mesh_size, 2):
-            four_total.append(log_f(self.knots[i]))
+        # Log of the weight of each knot, step_size / 3 * (1, 4, 2, 4, ..., 2, 4, 1).
+        coefficients = [1] + [4 if i % 2 == 1 else 2 for i in range(1, mesh_size)] + [1]
 
-        log_total.append(log(4) + log_sum_exp(four_total))
+        self.log_weights = [log(self.step_size / 3) + log(c) for c in coefficients]
 
-        two_total = []
+        if vectorised:
+            self._log_weights = np.array(self.log_weights)
 
-        for i in range(2, self.mesh_size - 1, 2):
-            two_total.append(log_f(self.knots[i]))
-
-        log_total.append(log(2) + log_sum_exp(two_total))
+    def log_integrate(self, log_f):
+        if self.vectorised:
+            return log_sum_exp(self._log_weights + np.asarray(log_f(self._knots), dtype=float))
 
-        return log(self.step_size) - log(3) + log_sum_exp(log_total)
+        return log_sum_exp([w + log_f(x) for w, x in zip(self.log_weights, self.knots)])
 
 #=======================================================================================================================
 # Caching
@@ -137,3 +210,190 @@ class memoized(object):
         '''Support instance methods.'''
 
         return functools.partial(self.__call__, obj)
+
+
+class Cache(object):
+    '''
+    Base class for the caches used by Density.log_p.
+
+    Caches track the number of hits and misses so the hit rate can be checked when tuning. Subclasses implement
+    lookup.
+    '''
+
+    def __init__(self):
+        self.hits = 0
+
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+
+        if total == 0:
+            return 0
+
+        return self.hits / total
+
+    def clear(self):
+        self.hits = 0
+
+        self.misses = 0
+
+    def lookup(self, func, data, params, global_params):
+        '''
+        Return func(data, params) using a cached value if possible.
+
+        Args:
+            func : (function) Function of data and params to cache.
+
+            data : (namedtuple) Data point.
+
+            params : (namedtuple) Parameters.
+
+            global_params : (namedtuple) Global parameters which func depends on implicitly.
+        '''
+        raise NotImplemented
+
+
+class NullCache(Cache):
+    '''
+    Cache which stores nothing. Every lookup is counted as a miss.
+    '''
+
+    def lookup(self, func, data, params, global_params):
+        self.misses += 1
+
+        return func(data, params)
+
+
+class LRUCache(Cache):
+    '''
+    Least recently used cache keyed by the values of the data and parameters.
+
+    Kwargs:
+        max_size : (int) Maximum number of entries. None for no limit.
+
+        max_bytes : (int) Approximate limit on the memory used by the entries. None for no limit. The size of the
+                          entries is only measured, and size_bytes only updated, if a limit is set.
+    '''
+
+    def __init__(self, max_size=10000, max_bytes=None):
+        Cache.__init__(self)
+
+        self.max_size = max_size
+
+        self.max_bytes = max_bytes
+
+        self.size_bytes = 0
+
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        Cache.clear(self)
+
+        self._entries = OrderedDict()
+
+        self.size_bytes = 0
+
+    def __getstate__(self):
+        # Cached values are not worth sending to other processes.
+        state = self.__dict__.copy()
+
+        state['_entries'] = OrderedDict()
+
+        state['size_bytes'] = 0
+
+        return state
+
+    def lookup(self, func, data, params, global_params):
+        key = self._get_key(data, params, global_params)
+
+        entry = self._entries.pop(key, None)
+
+        if entry is None:
+            self.misses += 1
+
+            value = func(data, params)
+
+            entry = self._make_entry(value, data, params, global_params)
+
+            self.size_bytes += entry[0]
+
+            self._entries[key] = entry
+
+            self._evict()
+
+        else:
+            self.hits += 1
+
+            # Re-insert to mark as most recently used.
+            self._entries[key] = entry
+
+        return entry[1]
+
+    def _evict(self):
+        while self._entries and self._is_full():
+            _, entry = self._entries.popitem(last=False)
+
+            self.size_bytes -= entry[0]
+
+    def _get_key(self, data, params, global_params):
+        return (data, params, global_params)
+
+    def _is_full(self):
+        if self.max_size is not None and len(self._entries) > self.max_size:
+            return True
+
+        if self.max_bytes is not None and self.size_bytes > self.max_bytes:
+            return True
+
+        return False
+
+    def _make_entry(self, value, data, params, global_params):
+        if self.max_bytes is None:
+            return (0, value)
+
+        size = _get_size(data) + _get_size(params) + _get_size(global_params) + sys.getsizeof(value)
+
+        return (size, value)
+
+
+class IdentityCache(LRUCache):
+    '''
+    Least recently used cache keyed by the identity of the data point and parameter objects.
+
+    Data points and parameters are immutable namedtuples and samplers assign a new object whenever a value changes, so
+    object identity acts as a cheap per data point and parameter version key. This avoids hashing the contents of the
+    namedtuples which often costs more than evaluating the density. Entries hold references to the objects so their ids
+    cannot be reused while cached.
+
+    Data which creates a new object each time an item is accessed, such as a Dataset, will never hit this cache.
+    '''
+
+    def _get_key(self, data, params, global_params):
+        return (id(data), id(params), id(global_params))
+
+    def _make_entry(self, value, data, params, global_params):
+        if self.max_bytes is None:
+            size = 0
+
+        else:
+            size = sys.getsizeof((data, params, global_params)) + sys.getsizeof(value)
+
+        return (size, value, data, params, global_params)
+
+
+def _get_size(x):
+    '''
+    Approximate memory used by x, including the contents of tuples.
+    '''
+    size = sys.getsizeof(x)
+
+    if isinstance(x, tuple):
+        for y in x:
+            size += _get_size(y)
+
+    return size
@@ -8,15 +8,14 @@ Created on 2014-03-25
 from collections import OrderedDict, namedtuple
 
 from pydp.base_measures import BaseMeasure
-from pydp.densities import Density
-from pydp.partition import PartitionCell
+from pydp.densities import Density, log_p_sum
 from pydp.proposal_functions import ProposalFunction
 from pydp.samplers.atom import AtomSampler
 
 
 class VectorAtomSampler(AtomSampler):
 
-    def __init__(self, base_measure, cluster_density, atom_samplers):
+    def __init__(self, base_measure, cluster_density, atom_samplers, rng=None):
         '''
         Args:
            base_measure : (VectorBaseMeasure) Base measure.
@@ -24,24 +23,117 @@ class VectorAtomSampler(AtomSampler):
            cluster_density : (VectorDensity) Emission density of clusters.
 
            atom_samplers : (dict) Mapping of dimension ID to atom sampler. 
+
+        Kwargs:
+           rng : (RandomStream) Stream of random numbers. If None the default stream is used.
         '''
-        AtomSampler.__init__(self, base_measure, cluster_density)
+        AtomSampler.__init__(self, base_measure, cluster_density, rng=rng)
 
         self.atom_samplers = atom_samplers
 
+        # Data points of each dimension as a (data, dict) tuple, rebuilt when a different data list is passed.
+        self._sample_data = None
+
+        # VectorCellView of each dimension of each cell, so the caches of the views persist between iterations.
+        self._cell_views = {}
+
+    def sample(self, data, partition):
+        # Drop the views of cells which have been removed from the partition.
+        self._cell_views = dict((cell, self._cell_views.get(cell, {})) for cell in partition.cells)
+
+        AtomSampler.sample(self, data, partition)
+
     def sample_atom(self, data, cell):
+        sample_data = self._get_sample_data(data)
+
+        views = self._cell_views.setdefault(cell, {})
+
         new_atom = OrderedDict()
 
         for sample_id in self.atom_samplers:
-            sample_data = [x[sample_id] for x in data]
+            if sample_id not in views:
+                views[sample_id] = VectorCellView(cell, sample_id)
 
-            sample_cell = PartitionCell(cell.value[sample_id])
+            new_atom[sample_id] = self.atom_samplers[sample_id].sample_atom(sample_data[sample_id], views[sample_id])
 
-            sample_cell._items = cell._items
+        return new_atom
+
+    def _get_sample_data(self, data):
+        '''
+        Return the data points of each dimension. The data is assumed not to be modified in place, as for the
+        sufficient statistics attached to cells.
+        '''
+        if self._sample_data is None or self._sample_data[0] is not data:
+            sample_data = dict((sample_id, [x[sample_id] for x in data]) for sample_id in self.atom_samplers)
 
-            new_atom[sample_id] = self.atom_samplers[sample_id].sample_atom(sample_data, sample_cell)
+            self._sample_data = (data, sample_data)
+
+        return self._sample_data[1]
 
-        return new_atom
+
+class VectorCellView(object):
+    '''
+    One dimension of a PartitionCell with a vector value, passed to the atom sampler of the dimension.
+
+    Membership is read from the cell and sufficient statistics are attached to the cell under a key for the dimension,
+    so they are kept up to date as items move between cells. The log likelihood of the dimension is cached on the view
+    as in PartitionCell.get_log_likelihood.
+    '''
+
+    def __init__(self, cell, sample_id):
+        '''
+        Args:
+            cell : (PartitionCell) Cell with a dict of values keyed by dimension ID.
+
+            sample_id : Dimension ID.
+        '''
+        self.cell = cell
+
+        self.sample_id = sample_id
+
+        self._log_likelihood = None
+
+    @property
+    def empty(self):
+        return self.cell.empty
+
+    @property
+    def items(self):
+        return self.cell.items
+
+    @property
+    def size(self):
+        return self.cell.size
+
+    @property
+    def value(self):
+        return self.cell.value[self.sample_id]
+
+    @property
+    def version(self):
+        return self.cell.version
+
+    def get_log_likelihood(self, data, density):
+        key = (data, density, self.value, getattr(density, 'params', None))
+
+        if self._log_likelihood is not None:
+            cached_key, version, log_likelihood = self._log_likelihood
+
+            if version == self.cell.version and all(x is y for x, y in zip(cached_key, key)):
+                return log_likelihood
+
+        log_likelihood = log_p_sum(density, data, self.cell.items, self.value)
+
+        self._log_likelihood = (key, self.cell.version, log_likelihood)
+
+        return log_likelihood
+
+    def set_log_likelihood(self, data, density, value, log_likelihood):
+        self._log_likelihood = ((data, density, value, getattr(density, 'params', None)), self.cell.version,
+                                log_likelihood)
+
+    def get_sufficient_statistics(self, statistics_cls, data):
+        return self.cell.get_sufficient_statistics(statistics_cls, data, key=(statistics_cls, self.sample_id))
 
 
 class VectorBaseMeasure(BaseMeasure):
@@ -61,11 +153,11 @@ class VectorBaseMeasure(BaseMeasure):
 
         return log_p
 
-    def random(self):
+    def random(self, rng=None):
         random_sample = OrderedDict()
 
         for sample_id in self.base_measures:
-            random_sample[sample_id] = self.base_measures[sample_id].random()
+            random_sample[sample_id] = self.base_measures[sample_id].random(rng=rng)
 
         return random_sample
 
@@ -84,6 +176,8 @@ class VectorDensity(Density):
 
         self.shared_params = shared_params
 
+        self._params = None
+
     @property
     def params(self):
         if self.shared_params:
@@ -91,12 +185,17 @@ class VectorDensity(Density):
                 return self.cluster_densities[cluster_id].params
 
         else:
-            params = OrderedDict()
+            # Return the same object until the params of a cluster density change so callers can detect changes by
+            # identity.
+            if self._params is None or self._params_changed():
+                params = OrderedDict()
 
-            for cluster_id in self.cluster_densities:
-                params[cluster_id] = self.cluster_densities[cluster_id].params
+                for cluster_id in self.cluster_densities:
+                    params[cluster_id] = self.cluster_densities[cluster_id].params
+
+                self._params = params
 
-            return params
+            return self._params
 
     @params.setter
     def params(self, value):
@@ -121,6 +220,19 @@ class VectorDensity(Density):
 
         return log_p
 
+    def _params_changed(self):
+        if len(self._params) != len(self.cluster_densities):
+            return True
+
+        for cluster_id in self.cluster_densities:
+            if cluster_id not in self._params:
+                return True
+
+            if self._params[cluster_id] is not self.cluster_densities[cluster_id].params:
+                return True
+
+        return False
+
 
 class VectorProposalFunction(ProposalFunction):
 
@@ -139,10 +251,10 @@ class VectorProposalFunction(ProposalFunction):
 
         return log_p
 
-    def random(self, params):
+    def random(self, params, rng=None):
         random_sample = OrderedDict()
 
         for sample_id in self.proposal_funcs:
-            random_sample[sample_id] = self.proposal_funcs[sample_id].random(params[sample_id])
+            random_sample[sample_id] = self.proposal_funcs[sample_id].random(params[sample_id], rng=rng)
 
         return random_sample